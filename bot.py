@@ -20,6 +20,7 @@ from lib.postgres import PostgresDB  # PostgresDBクラスをインポート
 import threading
 import uvicorn
 from lib.bot_http_server import app as bot_http_app, set_bot
+from lib.runtime_config import watch_config
 import aiohttp
 
 load_dotenv()
@@ -142,4 +143,9 @@ async def on_ready():
     bot.loop.create_task(update_rpc_task(), name="update_rpc_task")
     bot.loop.create_task(restart_rpc_task(), name="restart_rpc_task")
 
+    # .envの変更を監視して実行時設定を差し替える
+    # 再接続のたびに on_ready が呼ばれるので、監視タスクが動いていれば増やさない
+    if not any(task.get_name() == "watch_config" for task in asyncio.all_tasks()):
+        bot.loop.create_task(watch_config(), name="watch_config")
+
 bot.run(TOKEN)
@@ -2,25 +2,41 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from lib.postgres import PostgresDB
+from lib.settings_cache import SettingsCache
 from lib.VOICEVOXlib import VOICEVOXLib  # 追加: VOICEVOXLib をインポート
-import os
-from dotenv import load_dotenv
+from lib.runtime_config import get_config, reload_config
+from lib.voicevox_bench import (
+    CHAT_DEFAULT_LEVELS, CHAT_MAX_LEVEL, POOL_BYPASS_NOTE, format_engine, parse_levels, run_benchmark,
+)
 import time
 import wave
 import io
 
 class AdminCog(commands.Cog):
-    def __init__(self, bot: commands.Bot, db: PostgresDB, voicelib: VOICEVOXLib):  # 変更: voicelib を追加
+    def __init__(self, bot: commands.Bot, db: PostgresDB):
         self.bot = bot
         self.db = db
-        self.voicelib = voicelib  # 追加: voicelib を保存
+
+    def _voice_cog(self):
+        # VOICEVOXLib と設定キャッシュは読み上げコグのものを毎回取りにいく（別のコピーは持たない）
+        voice_cog = self.bot.get_cog("VoiceReadCog")
+        if voice_cog is None:
+            raise RuntimeError("VoiceReadCog is not loaded")
+        return voice_cog
+
+    def get_voicelib(self) -> VOICEVOXLib:
+        """読み上げで実際に使っているVOICEVOXLib（エンジンプールの状態を共有するため）"""
+        return self._voice_cog().voicelib
+
+    def get_settings(self) -> SettingsCache:
+        """読み上げで実際に使っている設定キャッシュ（書き込みをすぐ反映するため）"""
+        return self._voice_cog().settings
 
     def get_admin_id(self) -> int:
-        load_dotenv()  # .envを毎回読み込む
-        admin_id = os.getenv("ADMIN_ID")
+        admin_id = get_config().admin_id  # .envの変更はwatcherが反映する
         if admin_id is None:
             raise ValueError("ADMIN_ID is not set in .env")
-        return int(admin_id)
+        return admin_id
 
     async def is_admin(self, interaction: discord.Interaction) -> bool:
         """管理者かどうかを確認"""
@@ -42,29 +58,29 @@ class AdminCog(commands.Cog):
             # アナウンス内容をDBに保存または削除
             try:
                 if value.strip().lower() == "delete":
-                    await self.db.delete_announce()
+                    await self.get_settings().delete_announce()
                     await interaction.response.send_message("アナウンス内容を削除しました。", ephemeral=True)
                 else:
-                    await self.db.upsert_announce(value)
+                    await self.get_settings().set_announce(value)
                     await interaction.response.send_message(f"アナウンス内容を設定しました。\n内容: {value}", ephemeral=True)
             except Exception as e:
                 await interaction.response.send_message(f"アナウンス設定中にエラー: {str(e)}", ephemeral=True)
             return
 
         if option == "ban":
-            await self.db.execute(
-                "INSERT INTO banlist (user_id) VALUES ($1) ON CONFLICT DO NOTHING", value_int
-            )
-            for cog in self.bot.cogs.values():
-                if hasattr(cog, "banlist"):
-                    cog.banlist.add(value_int)
+            try:
+                await self.get_settings().ban(value_int)
+            except Exception as e:
+                await interaction.response.send_message(f"BAN中にエラー: {str(e)}", ephemeral=True)
+                return
             await interaction.response.send_message(f"ユーザーID {value_int} をBANしました。", ephemeral=True)
 
         elif option == "unban":
-            await self.db.execute("DELETE FROM banlist WHERE user_id = $1", value_int)
-            for cog in self.bot.cogs.values():
-                if hasattr(cog, "banlist"):
-                    cog.banlist.discard(value_int)
+            try:
+                await self.get_settings().unban(value_int)
+            except Exception as e:
+                await interaction.response.send_message(f"BAN解除中にエラー: {str(e)}", ephemeral=True)
+                return
             await interaction.response.send_message(f"ユーザーID {value_int} のBANを解除しました。", ephemeral=True)
 
         elif option == "voice":
@@ -75,11 +91,19 @@ class AdminCog(commands.Cog):
                 await interaction.response.send_message("ページ番号は整数で指定してください。", ephemeral=True)
                 return
 
-            # 接続中の VC をリストアップ
-            items = [
-                f"{vc.channel.name} - {vc.guild.name} ({vc.guild.id})"
-                for vc in self.bot.voice_clients
-            ]
+            # 接続中の VC をリストアップ（読み上げ待ちがあれば件数と最古の待ち時間も出す）
+            voice_cog = self.bot.get_cog("VoiceReadCog")
+            snapshot = voice_cog.rust_queue.snapshot() if voice_cog else None
+            queues = {row.guild_id: row for row in snapshot.guilds} if snapshot else {}
+
+            def describe(vc):
+                line = f"{vc.channel.name} - {vc.guild.name} ({vc.guild.id})"
+                row = queues.get(vc.guild.id)
+                if row:
+                    line += f" [待ち {row.depth}件 / 最古 {row.oldest_age:.0f}秒]"
+                return line
+
+            items = [describe(vc) for vc in self.bot.voice_clients]
             if not items:
                 await interaction.response.send_message("現在接続中のVCはありません。", ephemeral=True)
                 return
@@ -103,6 +127,8 @@ class AdminCog(commands.Cog):
                 f"{i+1}. {item}"
                 for i, item in enumerate(page_items, start)
             )
+            if snapshot:
+                embed.set_footer(text=f"読み上げ待ち: {len(snapshot.guilds)} サーバー / 合計 {snapshot.total_depth} 件 / {snapshot.total_bytes} バイト")
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
         elif option == "warn":
@@ -127,6 +153,42 @@ class AdminCog(commands.Cog):
                 return
             await interaction.response.send_message(f"ユーザーID {user_id} に警告を送信しました。", ephemeral=True)
 
+        elif option == "bench" and value.strip().split(" ", 1)[0] == "suite":
+            # 各エンジンに対して並列数を変えながらコーパスを合成し、レイテンシ分布と飽和点を計測
+            # 例: "suite" / "suite 1,4,16"
+            # 稼働中のエンジンに負荷をかけるので、省略時は低い並列数だけ・指定時も bench_max_concurrency まで
+            args = value.strip().split(" ", 1)
+            config = getattr(self.bot, "config", {})
+            max_level = int(config.get("bench_max_concurrency", CHAT_MAX_LEVEL))
+            try:
+                levels = parse_levels(args[1], max_level) if len(args) > 1 else list(CHAT_DEFAULT_LEVELS)
+            except ValueError:
+                await interaction.response.send_message(
+                    f"並列数は1～{max_level}のカンマ区切りの整数で指定してください。例: suite 1,4,16", ephemeral=True
+                )
+                return
+
+            await interaction.response.defer(ephemeral=True)
+            urls = list(get_config().voicevox_urls)
+            corpus = config.get("bench_corpus")
+            try:
+                results = await run_benchmark(urls, corpus, levels)
+            except Exception as e:
+                await interaction.followup.send(f"ベンチマーク中にエラーが発生しました: {str(e)}", ephemeral=True)
+                return
+
+            embed = discord.Embed(
+                title="VOICEVOX ベンチマークスイート結果",
+                description=(
+                    "total は audio_query + synthesis、query/synth は各段階の秒数\n"
+                    f"{POOL_BYPASS_NOTE}"
+                ),
+                color=discord.Color.green()
+            )
+            for engine in results[:25]:
+                embed.add_field(name=engine.url, value=f"```\n{format_engine(engine)[:1000]}\n```", inline=False)
+            await interaction.followup.send(embed=embed, ephemeral=True)
+
         elif option == "bench":
             # テキストをVOICEVOXで合成し、時間を計測
             text = value.strip()
@@ -141,7 +203,7 @@ class AdminCog(commands.Cog):
 
             start_time = time.perf_counter()
             try:
-                used_url, wav_bytes = await self.voicelib.synthesize_bytes(text, speaker_id)
+                used_url, wav_bytes = await self.get_voicelib().synthesize_bytes(text, speaker_id, use_cache=False)
                 elapsed = time.perf_counter() - start_time
 
                 # 音声長さを計算
@@ -166,6 +228,52 @@ class AdminCog(commands.Cog):
             except Exception as e:
                 await interaction.followup.send(f"ベンチマーク中にエラーが発生しました: {str(e)}", ephemeral=True)  # 変更: followup で送信
 
+        elif option == "engines":
+            # VOICEVOXエンジンプールの状態を表示
+            try:
+                rows = self.get_voicelib().pool.snapshot()
+            except RuntimeError as e:
+                await interaction.response.send_message(f"エンジン状態を取得できません: {str(e)}", ephemeral=True)
+                return
+            if not rows:
+                await interaction.response.send_message("VOICEVOXエンジンが登録されていません。", ephemeral=True)
+                return
+            embed = discord.Embed(
+                title="VOICEVOX エンジン状態",
+                color=discord.Color.blue()
+            )
+            for row in rows:
+                rtf = f"{row['ewma_rtf']:.2f}" if row['ewma_rtf'] is not None else "-"
+                probe = {True: "OK", False: "NG", None: "-"}[row['last_probe_ok']]
+                lines = [
+                    f"役割: {row['role']}",
+                    f"サーキット: {row['state']}" + (" (除外中)" if row['ejected'] else ""),
+                    f"連続失敗: {row['consecutive_failures']}",
+                    f"RTF(EWMA): {rtf}",
+                    f"処理中: {row['inflight']} / 重み: {row['weight']:.2f}",
+                    f"ヘルスチェック: {probe}",
+                ]
+                if row['last_error']:
+                    lines.append(f"最終エラー: {row['last_error'][:100]}")
+                embed.add_field(name=row['url'], value="\n".join(lines), inline=False)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        elif option == "normalizer":
+            # 連打・繰り返しの圧縮で削った文字数の多いサーバー
+            dictionary_cog = self.bot.get_cog("DictionaryCog")
+            chars_saved = getattr(dictionary_cog, "chars_saved", {})
+            top = sorted(chars_saved.items(), key=lambda item: item[1], reverse=True)[:10]
+            embed = discord.Embed(
+                title="繰り返し圧縮の統計",
+                description=f"合計 {sum(chars_saved.values())} 文字を削減（{len(chars_saved)} サーバー）",
+                color=discord.Color.blue()
+            )
+            for guild_id, saved in top:
+                guild = self.bot.get_guild(guild_id) if guild_id is not None else None
+                name = guild.name if guild else str(guild_id)
+                embed.add_field(name=name, value=f"{saved} 文字", inline=False)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
         elif option == "config" and value.strip().lower() == "reload":
             # prefix以外のconfigをリロード
             import yaml
@@ -176,18 +284,24 @@ class AdminCog(commands.Cog):
                 config_data.pop("prefix", None)
                 # 既存のself.bot.configの値を保持しつつ、config_dataの値のみ上書き
                 self.bot.config.update(config_data)
-                await interaction.response.send_message("config.ymlをリロードしました。", ephemeral=True)
+                # .env の実行時設定（VOICEVOXのURLなど）も読み直す
+                runtime_config = reload_config("admin")
+                await interaction.response.send_message(
+                    "config.ymlと.envをリロードしました。\n"
+                    f"VOICEVOX_URL: {', '.join(runtime_config.voicevox_urls)}\n"
+                    f"VOICEVOX_BACKUP_URL: {', '.join(runtime_config.voicevox_backup_urls) or 'なし'}",
+                    ephemeral=True
+                )
             except Exception as e:
                 await interaction.response.send_message(f"configリロード失敗: {str(e)}", ephemeral=True)
             return
 
         else:
             await interaction.response.send_message(
-                "無効なオプションです。'ban', 'unban', 'voice', 'warn', 'bench', 'setannounce', 'config' を指定してください。", ephemeral=True
+                "無効なオプションです。'ban', 'unban', 'voice', 'warn', 'bench', 'engines', 'normalizer', 'setannounce', 'config' を指定してください。", ephemeral=True
             )
 
 async def setup(bot: commands.Bot):
     db = PostgresDB()
     await db.initialize()
-    voicelib = VOICEVOXLib()  # 追加: VOICEVOXLib を初期化
-    await bot.add_cog(AdminCog(bot, db, voicelib))  # 変更: voicelib を渡す
\ No newline at end of file
+    await bot.add_cog(AdminCog(bot, db))
\ No newline at end of file
@@ -19,14 +19,24 @@ class PrometheusCog(commands.Cog):
         self.shard_vc_count_metric = Gauge('bot_shard_vc_count', 'シャードごとのVC接続数', ['shard_id'])
         self.shard_tts_count_per_minute = Gauge('bot_shard_tts_count_per_minute', 'シャードごとの1分間TTS回数', ['shard_id'])
         self.shard_error_count_per_minute = Gauge('bot_shard_error_count_per_minute', 'シャードごとの1分間エラー回数', ['shard_id'])
+        # 読み上げキュー（rust_queue.snapshot() から。空になったギルドのラベルは消す）
+        self.queue_depth_metric = Gauge('tts_queue_depth', 'ギルドごとの読み上げキューの件数', ['guild'])
+        self.queue_oldest_age_metric = Gauge('tts_queue_oldest_age_seconds', 'ギルドごとのキュー内で最も古い項目の待ち時間（秒）', ['guild'])
+        self.queue_bytes_metric = Gauge('tts_queue_bytes', 'ギルドごとのキューが保持するテキストのバイト数', ['guild'])
+        self.queue_total_depth_metric = Gauge('tts_queue_total_depth', '全ギルドの読み上げキューの合計件数')
+        self.queue_total_bytes_metric = Gauge('tts_queue_total_bytes', '全ギルドの読み上げキューの合計バイト数')
+        self.queue_guilds_metric = Gauge('tts_queue_guilds', '読み上げ待ちのあるギルド数')
+        self.queue_guild_labels = set()
         # シャードごとのカウンターをボットに追加
         self.bot.shard_tts_counters = defaultdict(int)
         self.bot.shard_error_counters = defaultdict(int)
         self.update_metrics.start()
+        self.update_queue_metrics.start()
         start_http_server(47724)
 
     def cog_unload(self):
         self.update_metrics.cancel()
+        self.update_queue_metrics.cancel()
 
     @commands.Cog.listener()
     async def on_application_command(self, ctx):
@@ -71,5 +81,30 @@ class PrometheusCog(commands.Cog):
     async def before_update_metrics(self):
         await self.bot.wait_until_ready()
 
+    @tasks.loop(seconds=15)
+    async def update_queue_metrics(self):
+        voice_cog = self.bot.get_cog("VoiceReadCog")
+        if voice_cog is None:
+            return
+        snapshot = voice_cog.rust_queue.snapshot()
+        labels = set()
+        for row in snapshot.guilds:
+            guild = str(row.guild_id)
+            labels.add(guild)
+            self.queue_depth_metric.labels(guild=guild).set(row.depth)
+            self.queue_oldest_age_metric.labels(guild=guild).set(row.oldest_age)
+            self.queue_bytes_metric.labels(guild=guild).set(row.bytes)
+        for guild in self.queue_guild_labels - labels:
+            for metric in (self.queue_depth_metric, self.queue_oldest_age_metric, self.queue_bytes_metric):
+                metric.remove(guild)
+        self.queue_guild_labels = labels
+        self.queue_total_depth_metric.set(snapshot.total_depth)
+        self.queue_total_bytes_metric.set(snapshot.total_bytes)
+        self.queue_guilds_metric.set(len(snapshot.guilds))
+
+    @update_queue_metrics.before_loop
+    async def before_update_queue_metrics(self):
+        await self.bot.wait_until_ready()
+
 async def setup(bot):
     await bot.add_cog(PrometheusCog(bot))
\ No newline at end of file
@@ -4,14 +4,23 @@ from discord.ext import commands
 import asyncio
 import os
 import subprocess
+import io
+import time
+from collections import deque
 from lib.VOICEVOXlib import VOICEVOXLib
 from discord import app_commands
 from lib.postgres import PostgresDB  # PostgresDBをインポート
-from lib.rust_lib_client import RustQueueClient
-import uuid
+from lib.rust_lib_client import RustQueueClient, PRIORITY_SYSTEM, PRIORITY_COMMAND, PRIORITY_CHAT, DROP_OLDEST
+from lib.audio_stream import ChunkedPCMStream, split_text_chunks, wav_to_pcm
+from lib.pcm_audio import StreamingPCMSource, to_discord_pcm
+from lib.opus_cache import OpusFrameCache
+from lib.phrase_bank import PhraseBank
+from lib.settings_cache import SettingsCache
 from dotenv import load_dotenv  # dotenvをインポート
 import traceback
 import logging
+from prometheus_client import Counter
+from lib.backlog_policy import apply_backlog_policy
 
 # 話者名とIDの紐付けリスト
 SPEAKER_LIST = [
@@ -50,16 +59,57 @@ SPEAKER_LIST = [
     {"name": "中部つるぎ", "id": 94}
 ]
 
+# 定型文バンクで事前合成しておくシステム音声
+CONNECT_PHRASE = "接続しました。"
+JOIN_SUFFIX = "が参加しました。"
+LEAVE_SUFFIX = "が退出しました。"
+PRESENCE_SUFFIXES = (JOIN_SUFFIX, LEAVE_SUFFIX)
+
+# 優先レーンごとの有効期限の設定キー
+QUEUE_TTL_KEYS = {
+    PRIORITY_SYSTEM: "queue_system_ttl_seconds",
+    PRIORITY_COMMAND: "queue_command_ttl_seconds",
+    PRIORITY_CHAT: "queue_chat_ttl_seconds",
+}
+
+# ギルドごとの読み上げキューの処理結果（キューの長さは PrometheusCog が rust_queue.snapshot() から出す）
+QUEUE_MERGED = Counter(
+    'tts_queue_merged_total',
+    'バックログ処理で同じ投稿者の連続投稿・同一メッセージをまとめた件数',
+    ['guild']
+)
+QUEUE_DROPPED = Counter(
+    'tts_queue_dropped_total',
+    '読み上げずに捨てた件数（stale: バックログ処理, expired: TTL切れ, overflow: 容量超過）',
+    ['guild', 'reason']
+)
+
+
 class VoiceReadCog(commands.Cog):
     autojoin = app_commands.Group(name="autojoin", description="自動参加設定")
     def __init__(self, bot):
         self.bot = bot
         self.voicelib = VOICEVOXLib()
+        # 接続・参加・退出の定型文（tmp/phrase_bank 以下に永続化）
+        self.phrase_bank = PhraseBank(
+            self.voicelib,
+            os.path.join(self.voicelib.tmp_dir, "phrase_bank") if self.voicelib.tmp_dir else None,
+        )
+        self.phrase_bank_task = None
+        # 繰り返し再生される音声のエンコード済みOpusフレーム（MB単位、0で無効）
+        self.opus_cache = OpusFrameCache(int(float(os.getenv("OPUS_CACHE_MEMORY_MB", "32")) * 1024 * 1024))
         self.speaker_id = 1
         self.tts_channels = {}      # {guild.id: channel.id}
         self.queue_tasks = {}       # {guild.id: Task}
         self.rust_queue = RustQueueClient()
         self.db = PostgresDB()  # データベースインスタンスを初期化
+        # スピード・話者・アナウンス・BAN・自動参加の設定キャッシュ（メッセージごとにDBを引かない）
+        config = getattr(bot, "config", {})
+        self.settings = SettingsCache(
+            self.db,
+            ttl=float(config.get("settings_cache_ttl", 300)),
+            max_users=int(config.get("user_voice_cache_size", 50000)),
+        )
         self.cleanup_task = None  # 定期的なクリーンアップタスク
         # 新規: ギルド単位の接続ロック
         self.connect_locks = {}  # {guild.id: asyncio.Lock()}
@@ -70,8 +120,10 @@ class VoiceReadCog(commands.Cog):
         self.task_restart_interval = 1800  # タスク再作成間隔（秒）
         self.voice_connect_timeout = int(os.getenv("VOICE_CONNECT_TIMEOUT", "60"))  # 接続タイムアウト（秒）
         self.sync_vcstate_task = None  # ← 追加: VC状態同期タスク
-        # ギルドごとの autojoin 設定キャッシュ: {guild.id: (vc_channel_id, tts_channel_id)}
-        self.autojoin_configs = {}
+        # "s" でキューをクリアするたびに進むギルドごとの世代番号（取り出し済みの項目の再生を止める）
+        self.clear_generations = {}  # {guild.id: int}
+        # 再生中に先読みしている合成ジョブ（再生順）
+        self.prefetch_jobs = {}  # {guild.id: deque[(generation, items, taken_at, Task)]}
         self.logger = logging.getLogger(__name__)
 
         def handle_global_exception(loop, context):
@@ -87,15 +139,21 @@ class VoiceReadCog(commands.Cog):
 
     async def cog_load(self):
         await self.db.initialize()  # データベース接続を初期化
+        await self.voicelib.start()  # VOICEVOXへの共有HTTPセッションを作成
+        config = getattr(self.bot, "config", {})
+        if config.get("phrase_bank_warmup_enabled", True):
+            # 定型文を全話者分バックグラウンドで用意する（ディスクにある分は合成しない）
+            self.phrase_bank_task = self.bot.loop.create_task(self.phrase_bank.warm(
+                [CONNECT_PHRASE, *PRESENCE_SUFFIXES],
+                [self.speaker_id] + [speaker["id"] for speaker in SPEAKER_LIST],
+            ))
         self.cleanup_task = self.bot.loop.create_task(self.cleanup_temp_files())
-        self.banlist = set(await self.db.fetch_column("SELECT user_id FROM banlist"))  # BANリストをキャッシュ
+        await self.settings.load_banlist()  # BANリストをキャッシュ
 
         # autojoin 設定をロード（DEBUGモードでもロードする）
         try:
-            rows = await self.db.fetch("SELECT guild_id, vc_channel_id, tts_channel_id FROM autojoin_config")
-            for r in rows:
-                self.autojoin_configs[r['guild_id']] = (r['vc_channel_id'], r['tts_channel_id'])
-            self.logger.info(f"Loaded autojoin configs for {len(self.autojoin_configs)} guild(s)")
+            await self.settings.load_autojoin()
+            self.logger.info(f"Loaded autojoin configs for {len(self.settings.autojoin)} guild(s)")
         except Exception:
             self.logger.exception("Failed to load autojoin configs")
 
@@ -139,6 +197,10 @@ class VoiceReadCog(commands.Cog):
 
     async def cog_unload(self):
         await self.db.close()  # データベース接続を閉じる
+        if self.phrase_bank_task:
+            self.phrase_bank_task.cancel()
+            await asyncio.gather(self.phrase_bank_task, return_exceptions=True)
+        await self.voicelib.close()  # VOICEVOXへの共有HTTPセッションを閉じる
         if self.cleanup_task:
             self.cleanup_task.cancel()
             try:
@@ -166,7 +228,7 @@ class VoiceReadCog(commands.Cog):
 
     async def is_banned(self, user_id: int) -> bool:
         """ユーザーがBANされているか確認"""
-        return user_id in self.banlist
+        return self.settings.is_banned(user_id)
 
     @app_commands.command(name="join", description="ボイスチャンネルに参加")
     async def join(self, interaction: discord.Interaction):
@@ -219,37 +281,18 @@ class VoiceReadCog(commands.Cog):
 
             # 「接続しました。」と喋る処理を非同期で実行
             async def play_connection_message():
-                tmp_wav = f"tmp_{uuid.uuid4()}_join.wav"  # UUIDを使用（要求するファイル名だが実際の保存先はライブラリが返す）
                 user_speaker_id = await self.get_user_speaker_id(interaction.user.id, interaction.guild.id)
                 try:
-                    saved_path = await self.voicelib.synthesize("接続しました。", user_speaker_id, tmp_wav)
+                    wav_bytes = await self.phrase_bank.get(CONNECT_PHRASE, user_speaker_id)
                 except Exception:
                     # 合成失敗は黙って戻る
                     return
-                voice_client = interaction.guild.voice_client
-                if voice_client and not voice_client.is_playing():
-                    audio_source = discord.FFmpegPCMAudio(saved_path)
-                    voice_client.play(audio_source)
-                    while voice_client.is_playing():
-                        await asyncio.sleep(0.5)
-                # 再生後はライブラリが保存したファイルを削除
-                try:
-                    if saved_path and os.path.exists(saved_path):
-                        os.remove(saved_path)
-                except Exception:
-                    pass
+                await self._play_wav_bytes(interaction.guild, wav_bytes, hot=True)
 
             self.bot.loop.create_task(play_connection_message())
 
-            # アナウンス内容をDBから取得して表示
-            announce_data = await self.db.get_announce()
-            if announce_data and isinstance(announce_data, dict):
-                announce_text = announce_data.get('announce', '')
-            elif announce_data:
-                announce_text = str(announce_data)
-            else:
-                announce_text = ""
-            
+            # アナウンス内容を表示
+            announce_text = await self.settings.get_announce()
             if announce_text:
                 announce_display = f"アナウンス：{announce_text}"
             else:
@@ -309,8 +352,7 @@ class VoiceReadCog(commands.Cog):
         vc_channel = interaction.user.voice.channel
         tts_channel_id = interaction.channel.id
         try:
-            await self.db.set_autojoin(guild.id, vc_channel.id, tts_channel_id)
-            self.autojoin_configs[guild.id] = (vc_channel.id, tts_channel_id)
+            await self.settings.set_autojoin(guild.id, vc_channel.id, tts_channel_id)
         except Exception as e:
             self.logger.error(f"Failed to save autojoin config for guild {guild.id}: {e}")
             traceback.print_exc()
@@ -343,15 +385,7 @@ class VoiceReadCog(commands.Cog):
                     tts_channel = guild.get_channel(tts_channel_id)
                     if tts_channel:
                         try:
-                            # アナウンス内容をDBから取得
-                            announce_data = await self.db.get_announce()
-                            if announce_data and isinstance(announce_data, dict):
-                                announce_text = announce_data.get('announce', '')
-                            elif announce_data:
-                                announce_text = str(announce_data)
-                            else:
-                                announce_text = ""
-                        
+                            announce_text = await self.settings.get_announce()
                             if announce_text:
                                 announce_display = f"\n\nアナウンス：{announce_text}"
                             else:
@@ -375,8 +409,7 @@ class VoiceReadCog(commands.Cog):
             await interaction.response.send_message("このコマンドを実行する権限がありません。", ephemeral=True)
             return
         try:
-            await self.db.delete_autojoin(interaction.guild.id)
-            self.autojoin_configs.pop(interaction.guild.id, None)
+            await self.settings.delete_autojoin(interaction.guild.id)
         except Exception as e:
             self.logger.error(f"Failed to remove autojoin config for guild {interaction.guild.id}: {e}")
             traceback.print_exc()
@@ -403,46 +436,14 @@ class VoiceReadCog(commands.Cog):
             )
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
-        await interaction.response.defer()
-        # テキストを辞書で変換
-        dictionary_cog = self.bot.get_cog("DictionaryCog")
-        if dictionary_cog:
-            text = await dictionary_cog.apply_dictionary(text, interaction.guild.id)
-        try:
-            tmp_wav = f"tmp/tmp_{uuid.uuid4()}_read.wav"  # UUIDを使用（要求するファイル名だが実際の保存先はライブラリが返す）
-            speed = await self.db.get_server_voice_speed(interaction.guild.id)
-            if speed is None:
-                speed = 1.0
-            try:
-                saved_path = await self.voicelib.synthesize(text, self.speaker_id, tmp_wav, speed=speed)
-            except Exception:
-                traceback.print_exc()
-                self.bot.error_counter += 1  # エラーカウンターをインクリメント
-                return
-        except Exception:
-            traceback.print_exc()
-            self.bot.error_counter += 1  # エラーカウンターをインクリメント
-            return
-        if not voice_client.is_playing():
-            audio_source = discord.FFmpegPCMAudio(saved_path)
-            voice_client.play(audio_source)
-            while voice_client.is_playing():
-                await asyncio.sleep(0.5)
-            # 読み上げ成功時にカウンターをインクリメント
-            self.bot.tts_counter += 1
-            shard_id = interaction.guild.shard_id
-            self.bot.shard_tts_counters[shard_id] += 1
-        try:
-            if saved_path and os.path.exists(saved_path):
-                os.remove(saved_path)
-        except Exception:
-            pass
+        # チャットより先に読み上げるコマンドのレーンに積む（辞書の適用・合成・再生は process_queue が行う）
+        self._enqueue(interaction.guild.id, text, self.speaker_id, "", priority=PRIORITY_COMMAND)
         embed = discord.Embed(
-            title="再生完了",
-            description="テキストの読み上げが完了しました。",
+            title="読み上げ予約",
+            description="テキストを読み上げキューに追加しました。",
             color=discord.Color.green()
         )
-        await interaction.followup.send(embed=embed, ephemeral=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @app_commands.command(name="voice", description="読み上げる声を設定")
     async def voice(self, interaction: discord.Interaction):
@@ -501,13 +502,8 @@ class VoiceReadCog(commands.Cog):
                     return
                 speaker_info = SPEAKER_LIST[num - 1]
                 speaker_id_int = speaker_info["id"]
-                speaker_id_str = str(speaker_id_int)
-                # DBに保存
-                await cog.db.execute(
-                    "INSERT INTO user_voice (user_id, speaker_id) VALUES ($1,$2) "
-                    "ON CONFLICT (user_id) DO UPDATE SET speaker_id = $2",
-                    inter.user.id, speaker_id_str
-                )
+                # DBに保存（キャッシュにも反映）
+                await cog.settings.set_speaker_id(inter.user.id, speaker_id_int)
                 await inter.response.send_message(
                     f"{inter.user.display_name}さんが声を {speaker_info['name']} (ID: {speaker_id_int}) に設定しました。", ephemeral=False
                 )
@@ -520,7 +516,7 @@ class VoiceReadCog(commands.Cog):
     @app_commands.command(name="speed", description="サーバー全体の読み上げスピードを設定・確認・リセット")
     async def speed(self, interaction: discord.Interaction, value: str = None):
         if value is None:
-            speed = await self.db.get_server_voice_speed(interaction.guild.id)
+            speed = await self.settings.get_speed(interaction.guild.id)
             if speed is not None:
                 desc = f"現在のサーバー全体の読み上げスピードは{speed}です。"
             else:
@@ -556,11 +552,11 @@ class VoiceReadCog(commands.Cog):
                     await self.parent.reset_speed(interaction2)
 
             async def set_speed(self, interaction2, value):
-                await self.db.set_server_voice_speed(interaction2.guild.id, value)
+                await self.settings.set_speed(interaction2.guild.id, value)
                 await interaction2.response.send_message(f"サーバー全体の読み上げスピードを{value}に設定しました。", ephemeral=False)
 
             async def reset_speed(self, interaction2):
-                await self.db.delete_server_voice_speed(interaction2.guild.id)
+                await self.settings.reset_speed(interaction2.guild.id)
                 await interaction2.response.send_message("サーバー全体の読み上げスピード設定をリセットしました。", ephemeral=True)
 
             self.set_speed = set_speed.__get__(self)
@@ -574,7 +570,7 @@ class VoiceReadCog(commands.Cog):
             await interaction.response.send_message(embed=embed, view=SpeedButtonView(self), ephemeral=True)
             return
         if value.lower() == "reset":
-            await self.db.delete_server_voice_speed(interaction.guild.id)
+            await self.settings.reset_speed(interaction.guild.id)
             await interaction.response.send_message("サーバー全体の読み上げスピード設定をリセットしました。", ephemeral=True)
             return
         try:
@@ -585,7 +581,7 @@ class VoiceReadCog(commands.Cog):
         if not (1 <= speed <= 2.0):
             await interaction.response.send_message("スピードは1.0～2.0の間で指定してください。", ephemeral=True)
             return
-        await self.db.set_server_voice_speed(interaction.guild.id, speed)
+        await self.settings.set_speed(interaction.guild.id, speed)
         await interaction.response.send_message(f"サーバー全体の読み上げスピードを{speed}に設定しました。", ephemeral=False)
 
     async def get_user_speaker_id(self, user_id: int, guild_id: int = None) -> int:
@@ -631,68 +627,421 @@ class VoiceReadCog(commands.Cog):
                         return 3  # ずんだもんID
                 except Exception:
                     pass  # 設定不正時は通常通り
-        row = await self.db.fetchrow("SELECT speaker_id FROM user_voice WHERE user_id = $1", user_id)
-        return int(row['speaker_id']) if row else self.speaker_id  # デフォルトはself.speaker_id
+        speaker_id = await self.settings.get_speaker_id(user_id)
+        return speaker_id if speaker_id is not None else self.speaker_id  # デフォルトはself.speaker_id
+
+    def _count_tts(self, guild) -> None:
+        """読み上げ成功時にカウンターをインクリメント"""
+        self.bot.tts_counter += 1
+        self.bot.shard_tts_counters[guild.shard_id] += 1
+
+    def _count_error(self, guild) -> None:
+        """エラーカウンターをインクリメント"""
+        self.bot.error_counter += 1
+        self.bot.shard_error_counters[guild.shard_id] += 1
+
+    async def _prepare_text(self, guild_id, text, speaker_id, user_name, author_id=0) -> str:
+        """キューから取り出したテキストに辞書を適用し、読み上げる文字列を作る"""
+        # テキストを辞書で変換（ユーザー辞書は投稿者のもの）
+        dictionary_cog = self.bot.get_cog("DictionaryCog")
+        if dictionary_cog:
+            text = await dictionary_cog.apply_dictionary(text, guild_id, author_id)
+        # ずんだもんの場合、configでユーザー名読み上げ有効なら先頭に追加
+        config = getattr(self.bot, "config", {})
+        zundamon_read_username_enabled = config.get("zundamon_read_username_enabled", False)
+        if speaker_id == 3 and zundamon_read_username_enabled:
+            if dictionary_cog:
+                user_name = await dictionary_cog.apply_dictionary(user_name, guild_id)
+            text = f"{user_name}、{text}"
+        return text
+
+    async def _get_speed(self, guild_id) -> float:
+        speed = await self.settings.get_speed(guild_id)
+        if speed is None:
+            speed = 1.0
+        return speed
+
+    def _make_audio_source(self, wav_bytes: bytes, hot: bool = False) -> discord.AudioSource:
+        """WAVデータから再生用のAudioSourceを作る
+
+        48kHzステレオ（またはNumPyでリサンプリング可能な形式）ならメモリ上のPCMを
+        そのまま渡し、一時ファイルもFFmpegのプロセスも使わない。繰り返し再生される音声
+        （hot=True の定型文は初回から）はエンコード済みのOpusフレームを流す。
+        """
+        try:
+            return self.opus_cache.source_for(to_discord_pcm(wav_bytes), hot=hot)
+        except ValueError as e:
+            self.logger.debug(f"Falling back to FFmpeg playback: {e}")
+            # 一時ファイルを作らずにFFmpegの標準入力へ流す
+            return discord.FFmpegPCMAudio(io.BytesIO(wav_bytes), pipe=True)
+
+    async def _play_wav_bytes(self, guild, wav_bytes: bytes, hot: bool = False) -> bool:
+        """WAVデータを再生し、再生が終わるまで待つ。再生できた場合は True を返す"""
+        return await self._play_source(guild, lambda: self._make_audio_source(wav_bytes, hot))
+
+    async def _play_and_wait(self, voice_client, source) -> None:
+        """source を再生し、プレイヤーの after コールバックで再生終了（停止・切断を含む）を待つ"""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def after(error):
+            if error:
+                self.logger.error(f"Playback error: {error}")
+            try:
+                loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+            except RuntimeError:
+                pass  # イベントループが既に閉じている
+
+        voice_client.play(source, after=after)
+        await finished
+
+    async def _play_source(self, guild, make_source) -> bool:
+        """make_source() で作ったAudioSourceを再生し、再生が終わるまで待つ"""
+        voice_client = guild.voice_client
+        if not voice_client or voice_client.is_playing():
+            return False
+        await self._play_and_wait(voice_client, make_source())
+        return True
 
     async def process_queue(self, guild_id):
-        """サーバーごとの読み上げキューをRustで処理"""
+        """サーバーごとの読み上げキューをRustで処理
+
+        再生中に後続の最大 prefetch_depth 件分の辞書適用と合成を先に進めておき、
+        再生が終わり次第すぐ次を流せるようにする。再生する直前に、先読みした項目より
+        優先度の高い項目がキューに来ていれば先読み分をキューに戻してそちらを先に流す。
+        """
         guild = self.bot.get_guild(guild_id)
-        while True:
-            try:
-                item = self.rust_queue.get_next(guild_id)
-                if item is None:
-                    await asyncio.sleep(0.1)
-                    continue
-                text, speaker_id, user_name = item
-                # テキストを辞書で変換
-                dictionary_cog = self.bot.get_cog("DictionaryCog")
-                if dictionary_cog:
-                    text = await dictionary_cog.apply_dictionary(text, guild_id)
-                # ずんだもんの場合、configでユーザー名読み上げ有効なら先頭に追加
-                config = getattr(self.bot, "config", {})
-                zundamon_read_username_enabled = config.get("zundamon_read_username_enabled", False)
-                if speaker_id == 3 and zundamon_read_username_enabled:
-                    if dictionary_cog:
-                        user_name = await dictionary_cog.apply_dictionary(user_name, guild_id)
-                    text = f"{user_name}、{text}"
-                tmp_wav = f"tmp_{uuid.uuid4()}_queue.wav"  # UUIDを使用（要求するファイル名だが実際の保存先はライブラリが返す）
-                speed = await self.db.get_server_voice_speed(guild_id)
-                if speed is None:
-                    speed = 1.0
+        prefetch = self.prefetch_jobs.setdefault(guild_id, deque())
+        try:
+            while True:
                 try:
-                    saved_path = await self.voicelib.synthesize(text, speaker_id, tmp_wav, speed=speed)
+                    if not prefetch:
+                        # パイプラインが空のときの先頭はストリーミング再生を許可する
+                        if not self._start_prefetch(guild, prefetch, allow_streaming=True):
+                            # キューが空なら追加されるまで眠る（_enqueue が起こす）
+                            await self.rust_queue.wait(guild_id)
+                            continue
+                    current = prefetch.popleft()
+                    generation, _, _, job = current
+                    self._fill_prefetch(guild, prefetch)
+                    playables = await job
+                    if self._preempt_prefetch(guild_id, current, prefetch):
+                        continue
+                    # 合成を待つ間にキューに入った分も再生中に合成しておく
+                    self._fill_prefetch(guild, prefetch)
+                    await self._play_prepared(guild, generation, playables)
+                except asyncio.CancelledError:
+                    break  # タスクがキャンセルされた場合は終了
                 except Exception as e:
-                    self.logger.error(f"TTS synth failed for guild {guild_id}: {e}")
+                    self.logger.error(f"Error in process_queue for guild {guild_id}: {e}")
                     traceback.print_exc()
-                    self.bot.error_counter += 1  # エラーカウンターをインクリメント
-                    shard_id = guild.shard_id
-                    self.bot.shard_error_counters[shard_id] += 1
+                    self._count_error(guild)
+                    continue  # その他のエラーは無視して次のメッセージへ
+        finally:
+            for *_, job in prefetch:
+                job.cancel()
+            if self.prefetch_jobs.get(guild_id) is prefetch:
+                del self.prefetch_jobs[guild_id]
+
+    def _enqueue(self, guild_id, text, speaker_id, user_name, priority=PRIORITY_CHAT, author_id=0) -> None:
+        """優先レーン・容量・TTLの設定に従って読み上げキューに追加する"""
+        config = getattr(self.bot, "config", {})
+        ttl_key = QUEUE_TTL_KEYS.get(priority, "queue_chat_ttl_seconds")
+        dropped = self.rust_queue.add(
+            guild_id, text, speaker_id, user_name,
+            priority=priority,
+            ttl=float(config.get(ttl_key, 0)),
+            capacity=int(config.get("queue_capacity", 0)),
+            overflow=config.get("queue_overflow_policy", DROP_OLDEST),
+            author_id=author_id,
+        )
+        if dropped:
+            QUEUE_DROPPED.labels(guild=str(guild_id), reason="overflow").inc(dropped)
+
+    def _take_items(self, guild_id) -> list:
+        """キューから次の1件を取り出す。バックログがあれば一括合成用にまとめて取り出す
+
+        キューが backlog_policy_depth 件を超えている場合は全件取り出し、古い項目の破棄・
+        同一メッセージや同じ投稿者の連続投稿のまとめを行う。1回に返すのは先読みのジョブと
+        同じく最大 batch_synthesis_max_items 件（一括合成が無効なら1件）で、残りはまとめた
+        状態でキューの先頭に戻す。
+        """
+        item = self.rust_queue.get_next(guild_id)
+        expired = self.rust_queue.take_expired(guild_id)
+        if expired:
+            QUEUE_DROPPED.labels(guild=str(guild_id), reason="expired").inc(expired)
+        if item is None:
+            return []
+        items = [item]
+        config = getattr(self.bot, "config", {})
+        depth = self.rust_queue.length(guild_id) + 1
+        policy_depth = int(config.get("backlog_policy_depth", 0))
+        batch_max_items = 1
+        if config.get("batch_synthesis_enabled", False):
+            batch_max_items = max(1, int(config.get("batch_synthesis_max_items", 8)))
+        if policy_depth > 0 and depth > policy_depth:
+            items += self.rust_queue.get_many(guild_id, depth)
+            items, stats = apply_backlog_policy(
+                items,
+                stale_seconds=float(config.get("backlog_stale_seconds", 60)),
+                merge_max_chars=int(config.get("backlog_merge_max_chars", 150)),
+                summary_speaker_id=self.speaker_id,
+            )
+            if stats.merged:
+                QUEUE_MERGED.labels(guild=str(guild_id)).inc(stats.merged)
+            if stats.dropped:
+                QUEUE_DROPPED.labels(guild=str(guild_id), reason="stale").inc(stats.dropped)
+            self.rust_queue.requeue_front(guild_id, items[batch_max_items:])
+            return items[:batch_max_items]
+        items += self.rust_queue.get_many(guild_id, batch_max_items - 1)
+        return items
+
+    def _start_prefetch(self, guild, prefetch, allow_streaming: bool = False) -> bool:
+        """キューから取り出した項目の合成ジョブを開始して prefetch の末尾に積む"""
+        items = self._take_items(guild.id)
+        if not items:
+            return False
+        generation = self.clear_generations.get(guild.id, 0)
+        job = self.bot.loop.create_task(self._synthesize_items(guild, items, allow_streaming))
+        prefetch.append((generation, items, time.monotonic(), job))
+        return True
+
+    def _fill_prefetch(self, guild, prefetch) -> None:
+        """先読み中のジョブが prefetch_depth 件になるまでキューから補充する
+
+        ジョブ1件が保持する音声は最大 batch_synthesis_max_items 件なので、
+        先読みによるメモリ使用量は prefetch_depth × batch_synthesis_max_items 件分に収まる。
+        先読み中の項目はキューの外にあるので、優先度・TTL・容量は _preempt_prefetch で
+        キューに戻したときに改めて効く。
+        """
+        config = getattr(self.bot, "config", {})
+        depth = int(config.get("prefetch_depth", 0))
+        while len(prefetch) < depth:
+            if not self._start_prefetch(guild, prefetch):
+                break
+
+    def _preempt_prefetch(self, guild_id, current, prefetch) -> bool:
+        """current より優先度の高い項目がキューか後続の先読みで待っていれば、先読み分を
+        全てキューに戻す
+
+        戻した場合は True（current は再生しない）。先読みしていた間の経過時間を
+        age と TTL に反映し、その間に期限切れになった項目は捨てる。合成済みの音声は
+        捨てるが、音声キャッシュに残っていれば取り直したときに再利用される。
+        """
+        generation, items, _, _ = current
+        if generation != self.clear_generations.get(guild_id, 0):
+            return False  # "s" で取り消された分は戻さない（_play_prepared が捨てる）
+        waiting = [item.priority for _, job_items, _, _ in prefetch for item in job_items]
+        queued = self.rust_queue.peek_priority(guild_id)
+        if queued is not None:
+            waiting.append(queued)
+        if not waiting or min(waiting) >= min(item.priority for item in items):
+            return False
+        now = time.monotonic()
+        requeued = []
+        expired = 0
+        for _, job_items, taken_at, job in (current, *prefetch):
+            job.cancel()
+            elapsed = now - taken_at
+            for item in job_items:
+                if item.ttl and item.ttl <= elapsed:
+                    expired += 1
                     continue
-                voice_client = guild.voice_client
-                if voice_client and not voice_client.is_playing():
-                    audio_source = discord.FFmpegPCMAudio(saved_path)
-                    voice_client.play(audio_source)
-                    while voice_client.is_playing():
-                        await asyncio.sleep(0.5)
-                    # 読み上げ成功時にカウンターをインクリメント
-                    self.bot.tts_counter += 1
-                    shard_id = guild.shard_id
-                    self.bot.shard_tts_counters[shard_id] += 1
-                try:
-                    if saved_path and os.path.exists(saved_path):
-                        os.remove(saved_path)
-                except Exception:
-                    pass
-            except asyncio.CancelledError:
-                break  # タスクがキャンセルされた場合は終了
+                requeued.append(item._replace(
+                    age=item.age + elapsed,
+                    ttl=item.ttl - elapsed if item.ttl else 0.0,
+                ))
+        prefetch.clear()
+        self.rust_queue.requeue_front(guild_id, requeued)
+        if expired:
+            QUEUE_DROPPED.labels(guild=str(guild_id), reason="expired").inc(expired)
+        return True
+
+    def _cancel_prefetch(self, guild_id) -> None:
+        """先読み中の合成ジョブを取り消す（"s" やタスク終了時）"""
+        prefetch = self.prefetch_jobs.get(guild_id)
+        if not prefetch:
+            return
+        for *_, job in prefetch:
+            job.cancel()
+        prefetch.clear()
+
+    async def _synthesize_items(self, guild, items, allow_streaming: bool) -> list:
+        """キューから取り出した項目を再生可能な形にする
+
+        戻り値は ("wav", WAVデータ)、("pcm", discord用PCM) または
+        ("stream", テキスト, speaker_id, speed) のリスト。
+        ストリーミングは先頭の1件（再生中の音声がないとき）に限る。先読み分は
+        再生を待つ間に合成し終えるので、まとめて合成した方が途切れない。
+        """
+        guild_id = guild.id
+        speed = await self._get_speed(guild_id)
+        prepared = []
+        for item in items:
+            presence = await self._split_presence(guild_id, item)
+            if presence:
+                prepared.append((presence, item.speaker_id))
+            else:
+                text = await self._prepare_text(guild_id, item.text, item.speaker_id, item.user_name, item.author_id)
+                prepared.append((text, item.speaker_id))
+
+        if len(prepared) == 1 and isinstance(prepared[0][0], str):
+            text, speaker_id = prepared[0]
+            config = getattr(self.bot, "config", {})
+            min_chunk_chars = int(config.get("streaming_synthesis_min_chunk_chars", 8))
+            if (allow_streaming and config.get("streaming_synthesis_enabled", False)
+                    and len(split_text_chunks(text, min_chunk_chars)) > 1):
+                return [("stream", text, speaker_id, speed)]
+
+        # 同じ話者が連続する区間ごとに1回の /multi_synthesis にまとめる（再生順は維持）
+        # 参加・退出のアナウンスは定型文バンクから組み立てるので単独のグループにする
+        # バックログ処理で件数が多い場合も1回の一括合成は batch_synthesis_max_items 件まで
+        batch_max_items = int(getattr(self.bot, "config", {}).get("batch_synthesis_max_items", 8))
+        groups = []
+        for text, speaker_id in prepared:
+            if (isinstance(text, str) and groups and groups[-1][0] == speaker_id
+                    and isinstance(groups[-1][1][0], str) and len(groups[-1][1]) < batch_max_items):
+                groups[-1][1].append(text)
+            else:
+                groups.append((speaker_id, [text]))
+
+        playables = []
+        for speaker_id, texts in groups:
+            if not isinstance(texts[0], str):
+                playable = await self._compose_presence(guild, texts[0], speaker_id, speed)
+                if playable:
+                    playables.append(playable)
+                continue
+            try:
+                if len(texts) > 1:
+                    results = await self.voicelib.synthesize_batch(texts, speaker_id, speed=speed)
+                else:
+                    results = [(await self.voicelib.synthesize_bytes(texts[0], speaker_id, speed=speed))[1]]
             except Exception as e:
-                self.logger.error(f"Error in process_queue for guild {guild_id}: {e}")
+                self.logger.error(f"TTS synth failed for guild {guild_id}: {e}")
                 traceback.print_exc()
-                self.bot.error_counter += 1  # エラーカウンターをインクリメント
-                shard_id = guild.shard_id
-                self.bot.shard_error_counters[shard_id] += 1
-                continue  # その他のエラーは無視して次のメッセージへ
-            await asyncio.sleep(0.1)  # 少し待機して次のメッセージへ
+                self._count_error(guild)
+                continue
+            playables.extend(("wav", wav_bytes) for wav_bytes in results)
+        return playables
+
+    async def _split_presence(self, guild_id, item):
+        """参加・退出のシステム音声なら (辞書適用後の名前, 定型文) を返す
+
+        システムのレーンに積まれた項目だけが対象（/read やチャットで同じ語尾を打っても分割しない）。
+        サーバー辞書が定型文自体を書き換える場合は、通常どおり全文を合成させるため None を返す。
+        """
+        if item.priority != PRIORITY_SYSTEM:
+            return None
+        text = item.text
+        suffix = next((s for s in PRESENCE_SUFFIXES if text.endswith(s)), None)
+        if suffix is None or len(text) == len(suffix):
+            return None
+        name = text[:-len(suffix)]
+        dictionary_cog = self.bot.get_cog("DictionaryCog")
+        if dictionary_cog:
+            if await dictionary_cog.apply_dictionary(suffix, guild_id) != suffix:
+                return None
+            name = await dictionary_cog.apply_dictionary(name, guild_id)
+        return name, suffix
+
+    async def _compose_presence(self, guild, presence, speaker_id, speed):
+        """名前の音声と定型文の音声を繋いで参加・退出のアナウンスを作る"""
+        name, suffix = presence
+        try:
+            return ("pcm", await self.phrase_bank.compose(name, suffix, speaker_id, speed))
+        except ValueError:
+            # PCMに変換できない形式の場合は全文を合成する
+            pass
+        except Exception as e:
+            self.logger.error(f"Phrase bank composition failed for guild {guild.id}: {e}")
+        try:
+            _, wav_bytes = await self.voicelib.synthesize_bytes(name + suffix, speaker_id, speed=speed)
+        except Exception as e:
+            self.logger.error(f"TTS synth failed for guild {guild.id}: {e}")
+            traceback.print_exc()
+            self._count_error(guild)
+            return None
+        return ("wav", wav_bytes)
+
+    async def _play_prepared(self, guild, generation, playables) -> None:
+        """_synthesize_items の結果を順番に再生する"""
+        guild_id = guild.id
+        for playable in playables:
+            # 合成中・再生中に "s" でキューがクリアされた場合は残りを再生しない
+            if self.clear_generations.get(guild_id, 0) != generation:
+                return
+            if playable[0] == "stream":
+                _, text, speaker_id, speed = playable
+                try:
+                    played = await self.play_streaming(guild, text, speaker_id, speed)
+                except Exception as e:
+                    self.logger.error(f"TTS streaming synth failed for guild {guild_id}: {e}")
+                    traceback.print_exc()
+                    self._count_error(guild)
+                    continue
+            elif playable[0] == "pcm":
+                played = await self._play_source(guild, lambda: self.opus_cache.source_for(playable[1]))
+            else:
+                played = await self._play_wav_bytes(guild, playable[1])
+            if played:
+                self._count_tts(guild)
+
+    async def play_streaming(self, guild, text, speaker_id, speed) -> bool:
+        """テキストを文単位でストリーミング合成し、1つの連続した音声として再生する
+
+        最初のチャンクの合成が終わった時点で再生を開始し、残りのチャンクは
+        合成でき次第順番にFFmpegへ流し込む。再生できた場合は True を返す。
+        """
+        config = getattr(self.bot, "config", {})
+        chunk_iter = self.voicelib.synthesize_stream(
+            text, speaker_id, speed,
+            max_parallel=int(config.get("streaming_synthesis_parallel", 3)),
+            min_chunk_chars=int(config.get("streaming_synthesis_min_chunk_chars", 8)),
+        )
+        stream = ChunkedPCMStream()
+        feeder = None
+        try:
+            first_wav = await chunk_iter.__anext__()
+            try:
+                # 48kHzステレオのPCMを直接プレイヤーに流す
+                stream.feed(to_discord_pcm(first_wav))
+                to_pcm = to_discord_pcm
+                audio_source = StreamingPCMSource(stream)
+            except ValueError:
+                # 変換できない形式の場合はFFmpegに生PCMとして流し込む
+                pcm, framerate, channels, sampwidth = wav_to_pcm(first_wav)
+                stream.feed(pcm)
+                to_pcm = lambda wav_bytes: wav_to_pcm(wav_bytes)[0]
+                audio_source = discord.FFmpegPCMAudio(
+                    stream,
+                    pipe=True,
+                    before_options=f"-f s{sampwidth * 8}le -ar {framerate} -ac {channels}",
+                )
+
+            async def feed_rest():
+                try:
+                    async for wav_bytes in chunk_iter:
+                        stream.feed(to_pcm(wav_bytes))
+                except Exception as e:
+                    # 途中のチャンクで失敗したらそこまでで再生を終える
+                    self.logger.error(f"TTS streaming chunk failed for guild {guild.id}: {e}")
+                finally:
+                    stream.finish()
+
+            feeder = self.bot.loop.create_task(feed_rest())
+            voice_client = guild.voice_client
+            if not voice_client or voice_client.is_playing():
+                return False
+            await self._play_and_wait(voice_client, audio_source)
+            return True
+        finally:
+            # 停止（"s"）やキャンセル時にFFmpegの書き込みスレッドを解放する
+            stream.abort()
+            if feeder:
+                feeder.cancel()
+                await asyncio.gather(feeder, return_exceptions=True)
+            await chunk_iter.aclose()
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -709,6 +1058,8 @@ class VoiceReadCog(commands.Cog):
 
         if message.content.strip() == "s":
             self.rust_queue.clear(message.guild.id)
+            self.clear_generations[message.guild.id] = self.clear_generations.get(message.guild.id, 0) + 1
+            self._cancel_prefetch(message.guild.id)
             voice_client = message.guild.voice_client
             if voice_client and voice_client.is_playing():
                 voice_client.stop()
@@ -738,7 +1089,12 @@ class VoiceReadCog(commands.Cog):
 
         # ユーザーのスピーカーIDを取得
         speaker_id = await self.get_user_speaker_id(message.author.id, message.guild.id)
-        self.rust_queue.add(message.guild.id, tts_text, speaker_id, message.author.display_name)  # Rustキューに追加
+        # メンション先の表示名を覚えておき、読み上げ時に通信なしで解決できるようにする
+        dictionary_cog = self.bot.get_cog("DictionaryCog")
+        if dictionary_cog:
+            dictionary_cog.remember_names(message)
+        self._enqueue(message.guild.id, tts_text, speaker_id, message.author.display_name,
+                      author_id=message.author.id)  # Rustキューに追加
         # コマンドの処理も継続
         await self.bot.process_commands(message)
 
@@ -761,7 +1117,7 @@ class VoiceReadCog(commands.Cog):
             try:
                 # メンバーが参加したイベント（before=None, after!=None）の場合をチェック
                 if before.channel is None and after.channel is not None and not member.bot:
-                    cfg = self.autojoin_configs.get(guild.id)
+                    cfg = self.settings.autojoin.get(guild.id)
                     if cfg and after.channel and after.channel.id == cfg[0]:
                         # 既に接続済みでなければ接続を試みる
                         if not voice_client or not getattr(voice_client, 'is_connected', lambda: False)():
@@ -785,15 +1141,7 @@ class VoiceReadCog(commands.Cog):
                                     try:
                                         tts_channel = guild.get_channel(cfg[1])
                                         if tts_channel:
-                                            # アナウンス内容をDBから取得
-                                            announce_data = await self.db.get_announce()
-                                            if announce_data and isinstance(announce_data, dict):
-                                                announce_text = announce_data.get('announce', '')
-                                            elif announce_data:
-                                                announce_text = str(announce_data)
-                                            else:
-                                                announce_text = ""
-                                            
+                                            announce_text = await self.settings.get_announce()
                                             if announce_text:
                                                 announce_display = f"\n\nアナウンス：{announce_text}"
                                             else:
@@ -880,8 +1228,8 @@ class VoiceReadCog(commands.Cog):
             if not voice_client or not voice_client.is_connected():
                 return
 
-            # メッセージをRustキューに追加（システム音声はスピーカーIDを1に固定）
-            self.rust_queue.add(guild.id, msg, self.speaker_id, "")
+            # メッセージをRustキューに追加（システム音声はスピーカーIDを1に固定し、チャットより先に読む）
+            self._enqueue(guild.id, msg, self.speaker_id, "", priority=PRIORITY_SYSTEM)
             # ここでプロセスタスクが存在しなければ作成する
             if guild.id not in self.queue_tasks or self.queue_tasks[guild.id].done():
                 self.queue_tasks[guild.id] = self.bot.loop.create_task(self.process_queue(guild.id))
@@ -5,7 +5,40 @@ from lib.postgres import PostgresDB  # PostgresDBをインポート
 import re
 from discord.ui import View, Button
 import asyncio
+import json
+import logging
 import time
+from collections import OrderedDict, defaultdict
+from prometheus_client import Counter
+from lib.text_normalizer import collapse_repeats
+from lib.async_cache import AsyncLoadingCache
+from lib.dict_matcher import EMPTY_MATCHER, CompiledDictionary, DictionaryMatcher, dictionary_version, rows_to_entries
+
+# これより大きい辞書のオートマトンはイベントループを止めないよう別スレッドで構築する
+COMPILE_IN_THREAD_ENTRIES = 1000
+
+# 辞書テーブルの変更はトリガーからこのチャンネルに NOTIFY される
+DICTIONARY_CHANNEL = "tts_dictionary_changed"
+DICTIONARY_TABLES = ("globaldic", "dictionarynew", "user_dictionary")
+# LISTEN できていないときの全件読み直しの間隔（秒）。LISTEN 中は config の dictionary_reload_interval
+POLL_RELOAD_INTERVAL = 10
+
+# ユーザー・ロールのメンション（<@id>, <@!id>, <@&id>）
+MENTION_PATTERN = re.compile(r"<@([!&]?)(\d+)>")
+# メンバーキャッシュにいないユーザーの表示名をいくつまで覚えておくか
+DISPLAY_NAME_CACHE_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+# 繰り返しの圧縮で合成しなくて済んだ文字数
+NORMALIZER_CHARS_SAVED = Counter(
+    'tts_normalizer_chars_saved_total',
+    '連打・繰り返しの圧縮で削った文字数'
+)
+NORMALIZER_MESSAGES_COLLAPSED = Counter(
+    'tts_normalizer_messages_collapsed_total',
+    '繰り返しの圧縮が適用されたメッセージ数'
+)
 
 class DictionaryCog(commands.Cog):
     def __init__(self, bot):
@@ -13,57 +46,180 @@ class DictionaryCog(commands.Cog):
         self.db = PostgresDB()  # データベースインスタンスを初期化
         self.voice_cog = None  # VoiceReadCogの参照
         self.global_dict_cache = []
-        self.server_dict_cache = {}  # guild_id: list of dict rows
-        self.user_dict_cache = {}  # user_id: list of dict rows
-        self.cache_lock = asyncio.Lock()
+        # コンパイル済みのグローバル辞書（内容が変わったときだけ作り直す）
+        self.global_matcher = EMPTY_MATCHER
+        # サーバー・ユーザー辞書: id -> CompiledDictionary（同じ id の同時読み込みは1回にまとめる）
+        config = getattr(bot, "config", {})
+        ttl = float(config.get("dictionary_cache_ttl", 600))
+        self.server_dicts = AsyncLoadingCache(
+            "server_dictionary", self._load_server_dict,
+            max_entries=int(config.get("server_dictionary_cache_size", 2000)), ttl=ttl,
+        )
+        self.user_dicts = AsyncLoadingCache(
+            "user_dictionary", self._load_user_dict,
+            max_entries=int(config.get("user_dictionary_cache_size", 10000)), ttl=ttl,
+        )
         self.cache_task = None
         self.cache_last_update = 0
+        # LISTEN/NOTIFY による変更通知（届いている間は全件読み直しを間引く）
+        self.listener_task = None
+        self.notify_installed = False
+        self.listening = False
+        self.reload_requested = asyncio.Event()
+        self.global_compile_task = None
+        # 取得中に変更通知が来たグローバル辞書を採用しないための世代番号
+        self.global_generation = 0
+        self.chars_saved = defaultdict(int)  # {guild_id: 繰り返しの圧縮で削った文字数}
+        # メッセージで見かけたユーザーの表示名: {(guild_id, user_id): display_name}（LRU）
+        self.display_names = OrderedDict()
 
     async def cog_load(self):
         await self.db.initialize()  # データベース接続を初期化
         self.voice_cog = self.bot.get_cog("VoiceReadCog")  # VoiceReadCogを取得
+        try:
+            await self.db.install_change_notify(DICTIONARY_CHANNEL, DICTIONARY_TABLES)
+            self.notify_installed = True
+        except Exception as e:
+            # トリガーを作れない（権限がない等）場合は従来どおり短い間隔で読み直す
+            logger.warning(f"Failed to install dictionary change triggers, falling back to polling: {e}")
+        if self.notify_installed:
+            self.listener_task = self.bot.loop.create_task(self.db.listen(
+                DICTIONARY_CHANNEL, self.on_dictionary_notify,
+                on_connect=self.on_listener_connect, on_disconnect=self.on_listener_disconnect,
+            ))
         self.cache_task = self.bot.loop.create_task(self.cache_updater())
 
     async def cog_unload(self):
+        for task in (self.listener_task, self.cache_task, self.global_compile_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
         await self.db.close()  # データベース接続を閉じる
-        if self.cache_task:
-            self.cache_task.cancel()
-            try:
-                await self.cache_task
-            except asyncio.CancelledError:
-                pass
 
     async def cache_updater(self):
+        """グローバル辞書を読み直し、サーバー・ユーザー辞書のキャッシュを期限切れにする
+
+        変更は NOTIFY で個別に反映されるので、LISTEN できている間は取りこぼしに備えた
+        dictionary_reload_interval 秒ごとの安全網。LISTEN できていなければ10秒ごとに行う。
+        期限切れにした辞書は次に使うときに読み直す（内容が同じならマッチャーは作り直さない）。
+        """
         while True:
             try:
-                async with self.cache_lock:
-                    self.global_dict_cache = await self.db.get_all_global_dictionary()
-                    # サーバー辞書キャッシュは必要なものだけ都度取得するのでここでは空に
-                    self.server_dict_cache.clear()
-                    self.cache_last_update = time.time()
+                self.server_dicts.expire_all()
+                self.user_dicts.expire_all()
+                await self.reload_global_dictionary()
             except Exception as e:
                 print(f"辞書キャッシュ更新エラー: {e}")
-            await asyncio.sleep(10)
+            config = getattr(self.bot, "config", {})
+            interval = float(config.get("dictionary_reload_interval", 600)) if self.listening else POLL_RELOAD_INTERVAL
+            try:
+                await asyncio.wait_for(self.reload_requested.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self.reload_requested.clear()
 
-    async def get_server_dict(self, guild_id):
-        async with self.cache_lock:
-            if guild_id in self.server_dict_cache:
-                return self.server_dict_cache[guild_id]
-        # キャッシュになければ取得してキャッシュ
+    async def reload_global_dictionary(self) -> None:
+        generation = self.global_generation
+        rows = await self.db.get_all_global_dictionary()
+        if self.global_generation != generation:
+            # 取得中に変更通知が来た。通知の差分より古い可能性があるので取り直す
+            self.reload_requested.set()
+            return
+        self.global_dict_cache = rows
+        self.cache_last_update = time.time()
+        await self.compile_global_dictionary()
+
+    async def compile_global_dictionary(self) -> None:
+        """グローバル辞書のマッチャーを最新の行に合わせる（構築中に行が変わればやり直す）"""
+        while True:
+            rows = self.global_dict_cache
+            self.global_matcher = await self.compile_dictionary(rows, self.global_matcher)
+            if self.global_dict_cache is rows:
+                return
+
+    async def _compile_global_soon(self) -> None:
+        await asyncio.sleep(0.5)  # 続けて届いた変更をまとめて1回で作り直す
+        await self.compile_global_dictionary()
+
+    def on_listener_connect(self) -> None:
+        # 切断中の変更は届いていないので、キャッシュを捨てて全件読み直す
+        self.listening = True
+        self.reload_requested.set()
+
+    def on_listener_disconnect(self) -> None:
+        self.listening = False
+
+    def on_dictionary_notify(self, payload: str) -> None:
+        """辞書テーブルの変更通知を反映する
+
+        グローバル辞書は差分をキャッシュに適用し、サーバー・ユーザー辞書は
+        変更のあったサーバー・ユーザーのキャッシュだけを捨てる（次に使うときに取り直す）。
+        """
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Invalid dictionary notification: {payload[:200]}")
+            return
+        table = change.get("table")
+        rows = [row for row in (change.get("old"), change.get("new")) if row]
+        reload = change.get("op") == "RELOAD"
+        if table == "globaldic":
+            self.global_generation += 1
+            if reload:
+                self.reload_requested.set()
+                return
+            entries = dict(rows_to_entries(self.global_dict_cache))
+            if change.get("old"):
+                entries.pop(change["old"]["key"], None)
+            if change.get("new"):
+                entries[change["new"]["key"]] = change["new"]["value"]
+            self.global_dict_cache = [{"key": key, "value": value} for key, value in entries.items()]
+            if self.global_compile_task is None or self.global_compile_task.done():
+                self.global_compile_task = self.bot.loop.create_task(self._compile_global_soon())
+        elif table == "dictionarynew":
+            self._invalidate(self.server_dicts, [row["guild_id"] for row in rows], reload)
+        elif table == "user_dictionary":
+            self._invalidate(self.user_dicts, [row["user_id"] for row in rows], reload)
+
+    @staticmethod
+    def _invalidate(cache: AsyncLoadingCache, ids, everything=False) -> None:
+        if everything:
+            cache.clear()
+            return
+        for id_ in ids:
+            cache.invalidate(id_)
+
+    async def compile_dictionary(self, rows, current=None) -> DictionaryMatcher:
+        """辞書をマッチャーにコンパイルする。current と内容が同じならそれをそのまま返す"""
+        entries = rows_to_entries(rows)
+        if current is not None and current.version == dictionary_version(entries):
+            return current
+        if len(entries) > COMPILE_IN_THREAD_ENTRIES:
+            return await asyncio.to_thread(DictionaryMatcher, entries)
+        return DictionaryMatcher(entries)
+
+    async def _load_server_dict(self, guild_id, previous) -> CompiledDictionary:
         rows = await self.db.get_all_dictionary(guild_id)
-        async with self.cache_lock:
-            self.server_dict_cache[guild_id] = rows
-        return rows
+        return CompiledDictionary(rows, await self.compile_dictionary(rows, previous and previous.matcher))
 
-    async def get_user_dict(self, user_id):
-        async with self.cache_lock:
-            if user_id in self.user_dict_cache:
-                return self.user_dict_cache[user_id]
-        # キャッシュになければ取得してキャッシュ
+    async def _load_user_dict(self, user_id, previous) -> CompiledDictionary:
         rows = await self.db.get_all_user_dictionary(user_id)
-        async with self.cache_lock:
-            self.user_dict_cache[user_id] = rows
-        return rows
+        return CompiledDictionary(rows, await self.compile_dictionary(rows, previous and previous.matcher))
+
+    async def get_server_matcher(self, guild_id) -> DictionaryMatcher:
+        return (await self.server_dicts.get(guild_id)).matcher
+
+    async def get_user_matcher(self, user_id) -> DictionaryMatcher:
+        return (await self.user_dicts.get(user_id)).matcher
+
+    async def get_server_dict(self, guild_id):
+        return (await self.server_dicts.get(guild_id)).rows
+
+    async def get_user_dict(self, user_id):
+        return (await self.user_dicts.get(user_id)).rows
 
     async def is_banned(self, user_id: int) -> bool:
         """ユーザーがBANされているか確認"""
@@ -84,8 +240,7 @@ class DictionaryCog(commands.Cog):
             if user_dict:
                 await self.db.upsert_user_dictionary(interaction.user.id, key, value)
                 # キャッシュを即時反映
-                async with self.cache_lock:
-                    self.user_dict_cache.pop(interaction.user.id, None)
+                self.user_dicts.invalidate(interaction.user.id)
                 embed = discord.Embed(
                     title="ユーザー辞書更新",
                     description=f"ユーザー辞書に追加しました: **{key}** -> **{value}**",
@@ -96,8 +251,7 @@ class DictionaryCog(commands.Cog):
                 guild_id = interaction.guild.id
                 await self.db.upsert_dictionary(guild_id, key, value, author_id)
                 # キャッシュを即時反映
-                async with self.cache_lock:
-                    self.server_dict_cache.pop(guild_id, None)
+                self.server_dicts.invalidate(guild_id)
                 embed = discord.Embed(
                     title="辞書更新",
                     description=f"辞書に追加しました: **{key}** -> **{value}**",
@@ -122,15 +276,13 @@ class DictionaryCog(commands.Cog):
             if user_dict:
                 result = await self.db.remove_user_dictionary(interaction.user.id, key)
                 # キャッシュを即時反映
-                async with self.cache_lock:
-                    self.user_dict_cache.pop(interaction.user.id, None)
+                self.user_dicts.invalidate(interaction.user.id)
                 title = "ユーザー辞書削除"
             else:
                 guild_id = interaction.guild.id
                 result = await self.db.remove_dictionary(guild_id, key)
                 # キャッシュを即時反映
-                async with self.cache_lock:
-                    self.server_dict_cache.pop(guild_id, None)
+                self.server_dicts.invalidate(guild_id)
                 title = "辞書削除"
             if result == "DELETE 1":
                 embed = discord.Embed(
@@ -282,44 +434,85 @@ class DictionaryCog(commands.Cog):
             except Exception as inner_e:
                 print(inner_e)
 
-    async def apply_dictionary(self, text: str, guild_id: int = None) -> str:
-        """辞書を適用してテキストを変換（サーバーごと対応 & グローバル辞書対応）"""
+    def remember_names(self, message) -> None:
+        """メッセージの投稿者とメンション先の表示名を覚えておく（読み上げ時のメンション解決用）
+
+        メンション先はメッセージのペイロードに含まれているので、メンバーキャッシュに
+        いないユーザーでも REST で取得せずに名前がわかる。
+        """
+        if not message.guild:
+            return
+        for user in (message.author, *message.mentions):
+            key = (message.guild.id, user.id)
+            self.display_names[key] = user.display_name
+            self.display_names.move_to_end(key)
+        while len(self.display_names) > DISPLAY_NAME_CACHE_SIZE:
+            self.display_names.popitem(last=False)
+
+    def _display_name(self, guild, user_id):
+        """メンバーキャッシュ → 覚えておいた表示名 → ユーザーキャッシュの順に探す（通信なし）"""
+        member = guild.get_member(user_id) if guild else None
+        if member:
+            return member.display_name
+        if guild:
+            name = self.display_names.get((guild.id, user_id))
+            if name is not None:
+                self.display_names.move_to_end((guild.id, user_id))
+                return name
+        user = self.bot.get_user(user_id)
+        return user.display_name if user else None
+
+    def resolve_mentions(self, text: str, guild_id: int = None) -> str:
+        """ユーザー・ロールのメンションを読み上げ用の名前に置き換える（解決できないものはそのまま）"""
+        if "<@" not in text:
+            return text
+        guild = self.bot.get_guild(guild_id) if guild_id is not None else None
+
+        def replace(match):
+            kind, target_id = match.group(1), int(match.group(2))
+            if kind == "&":
+                role = guild.get_role(target_id) if guild else None
+                return f"ろーる:{role.name}" if role else match.group(0)
+            name = self._display_name(guild, target_id)
+            return f"あっと{name}" if name is not None else match.group(0)
+
+        return MENTION_PATTERN.sub(replace, text)
+
+    async def apply_dictionary(self, text: str, guild_id: int = None, author_id: int = None) -> str:
+        """辞書を適用してテキストを変換（グローバル辞書 → サーバー辞書 → author_id のユーザー辞書）"""
         if not self.cache_task or self.cache_task.done():
             self.cache_task = self.bot.loop.create_task(self.cache_updater())
-        msg = discord.utils.get(self.bot.cached_messages, content=text)
-        if msg:
-            for user_id in {m.id for m in msg.mentions}:
-                user = await self.bot.fetch_user(user_id)
-                if user:
-                    text = text.replace(f"<@{user_id}>", f"あっと{user.display_name}")
-                    text = text.replace(f"<@!{user_id}>", f"あっと{user.display_name}")
-        for role in msg.role_mentions if msg else []:
-            text = text.replace(f"<@&{role.id}>", f"ろーる:{role.name}")
+        text = self.resolve_mentions(text, guild_id)
         text = re.sub(r'<a?:([a-zA-Z0-9_]+):\d+>', lambda m: f"えもじ:{m.group(1)}", text)
         text = re.sub(r'<a?:([a-zA-Z0-9_]+):\d+>', lambda m: f"すたんぷ:{m.group(1)}", text)
         text = re.sub(r'https?://\S+', 'リンク省略', text)
-        # guild_idが指定されていなければ、メッセージから取得
-        if guild_id is None and msg and msg.guild:
-            guild_id = msg.guild.id
-        # グローバル辞書をキャッシュから適用
-        async with self.cache_lock:
-            global_rows = list(self.global_dict_cache)
-        for row in global_rows:
-            text = text.replace(row['key'], row['value'])
-        # サーバーごとの辞書をキャッシュから適用
+        # グローバル辞書 → サーバー辞書 → ユーザー辞書の順に、それぞれ1回の走査で置換
+        text = self.global_matcher.replace(text)
         if guild_id is not None:
-            rows = await self.get_server_dict(guild_id)
-            for row in rows:
-                text = text.replace(row['key'], row['value'])
-        # ユーザー辞書適用
-        user_id = msg.author.id if msg else None
-        if user_id is not None:
-            user_rows = await self.get_user_dict(user_id)
-            for row in user_rows:
-                text = text.replace(row['key'], row['value'])
-        if len(text) > 70:
-            text = text[:150] + "省略"
+            text = (await self.get_server_matcher(guild_id)).replace(text)
+        if author_id:
+            text = (await self.get_user_matcher(author_id)).replace(text)
+        config = getattr(self.bot, "config", {})
+        if config.get("repeat_collapse_enabled", True):
+            text = self.collapse_repeats(text, guild_id, config)
+        max_chars = int(config.get("read_max_chars", 150))
+        if len(text) > max_chars:
+            text = text[:max_chars] + "省略"
         return text
 
+    def collapse_repeats(self, text: str, guild_id, config) -> str:
+        """連打・繰り返しを縮め、削った文字数をサーバーごとに記録する"""
+        collapsed = collapse_repeats(
+            text,
+            max_char_run=int(config.get("repeat_collapse_max_char_run", 3)),
+            max_token_repeats=int(config.get("repeat_collapse_max_token_repeats", 2)),
+        )
+        saved = len(text) - len(collapsed)
+        if saved > 0:
+            self.chars_saved[guild_id] += saved
+            NORMALIZER_CHARS_SAVED.inc(saved)
+            NORMALIZER_MESSAGES_COLLAPSED.inc()
+        return collapsed
+
 async def setup(bot):
     await bot.add_cog(DictionaryCog(bot))
\ No newline at end of file
@@ -1,13 +1,18 @@
 import aiohttp
+import asyncio
 import wave
 import io
 import os
 from dotenv import load_dotenv
 import time
-import shutil
-from prometheus_client import Gauge
-import random
+from prometheus_client import Counter, Gauge, Histogram
 import logging  # 追加: エラーログ用
+import zipfile
+from typing import Optional
+from lib.audio_cache import AudioCache
+from lib.engine_pool import EngineBusyError, EnginePool
+from lib.runtime_config import get_config
+from lib.audio_stream import split_text_chunks
 try:
     import sentry_sdk
 except ImportError:
@@ -16,19 +21,158 @@ except ImportError:
 # Load environment variables
 load_dotenv()
 
-# Add a Prometheus gauge to record seconds of processing per 1 minute of generated audio
-VOICE_GENERATION_TIME_PER_MINUTE = Gauge(
-    'voice_generation_seconds_per_minute',
-    '1分の音声生成にかかる平均処理時間（秒）'
+# 音声の長さの上限を適用した回数（action: speed / trim）と削った秒数
+VOICEVOX_DURATION_BUDGET_APPLIED = Counter(
+    'voicevox_duration_budget_applied_total',
+    '予測した音声の長さが上限を超え、話速の引き上げやアクセント句の削除を行った回数',
+    ['action']
 )
+VOICEVOX_DURATION_BUDGET_TRIMMED_SECONDS = Counter(
+    'voicevox_duration_budget_trimmed_seconds_total',
+    '音声の長さの上限により合成しなかった音声の秒数（予測値）'
+)
+
+# 合成経路の段階ごとの分布（engine: エンジンURL, role: primary / backup, speaker: 話者ID）
+_SYNTHESIS_LABELS = ['engine', 'role', 'speaker']
+VOICEVOX_AUDIO_QUERY_SECONDS = Histogram(
+    'voicevox_audio_query_seconds',
+    '/audio_query のレイテンシ（秒）',
+    _SYNTHESIS_LABELS,
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+VOICEVOX_SYNTHESIS_SECONDS = Histogram(
+    'voicevox_synthesis_seconds',
+    '/synthesis（一括合成では /multi_synthesis 1回）のレイテンシ（秒）',
+    _SYNTHESIS_LABELS,
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 30.0)
+)
+VOICEVOX_WAV_BYTES = Histogram(
+    'voicevox_wav_bytes',
+    '合成したWAVのバイト数',
+    _SYNTHESIS_LABELS,
+    buckets=(16e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6)
+)
+VOICEVOX_AUDIO_DURATION_SECONDS = Histogram(
+    'voicevox_audio_duration_seconds',
+    '合成した音声の長さ（秒）',
+    _SYNTHESIS_LABELS,
+    buckets=(0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 12.0, 20.0, 40.0)
+)
+VOICEVOX_REALTIME_FACTOR = Histogram(
+    'voicevox_realtime_factor',
+    '処理時間（audio_query + synthesis）÷ 音声の長さ',
+    _SYNTHESIS_LABELS,
+    buckets=(0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 4.0)
+)
+
+# VOICEVOXエンジンへのHTTP接続の再利用状況
+VOICEVOX_HTTP_CONNECTIONS_CREATED = Counter(
+    'voicevox_http_connections_created_total',
+    'VOICEVOXエンジンへ新規に確立したTCP接続数'
+)
+VOICEVOX_HTTP_CONNECTIONS_REUSED = Counter(
+    'voicevox_http_connections_reused_total',
+    'keep-aliveにより再利用されたVOICEVOXエンジンへの接続数'
+)
+VOICEVOX_HTTP_DNS_CACHE = Counter(
+    'voicevox_http_dns_cache_total',
+    'VOICEVOXエンジンのDNSキャッシュ参照数',
+    ['result']
+)
+
+# /multi_synthesis による一括合成の効果
+VOICEVOX_BATCH_SIZE = Histogram(
+    'voicevox_batch_size',
+    '/multi_synthesis 1回で合成した件数',
+    buckets=(2, 3, 4, 6, 8, 12, 16, 32)
+)
+VOICEVOX_BATCH_ROUND_TRIPS_SAVED = Counter(
+    'voicevox_batch_round_trips_saved_total',
+    '一括合成により省略できた /synthesis の往復数'
+)
+VOICEVOX_BATCH_SPEEDUP = Gauge(
+    'voicevox_batch_speedup_ratio',
+    '単発合成のリアルタイム係数(EWMA) ÷ 直近の一括合成のリアルタイム係数',
+    ['engine']
+)
+
+# 接続プールの設定（.envで上書き可能）
+CONN_LIMIT_PER_HOST = int(os.getenv("VOICEVOX_CONN_LIMIT_PER_HOST", "32"))
+KEEPALIVE_TIMEOUT = float(os.getenv("VOICEVOX_KEEPALIVE_TIMEOUT", "30"))
+DNS_CACHE_TTL = int(os.getenv("VOICEVOX_DNS_CACHE_TTL", "300"))
+# 1リクエスト（audio_query または synthesis）のタイムアウト秒数
+REQUEST_TIMEOUT = float(os.getenv("VOICEVOX_REQUEST_TIMEOUT", "30"))
+
+# エンジンプール（サーキットブレーカー・ヘルスチェック）の設定
+ENGINE_FAILURE_THRESHOLD = int(os.getenv("VOICEVOX_FAILURE_THRESHOLD", "3"))
+ENGINE_OPEN_SECONDS = float(os.getenv("VOICEVOX_CIRCUIT_OPEN_SECONDS", "30"))
+ENGINE_PROBE_INTERVAL = float(os.getenv("VOICEVOX_PROBE_INTERVAL", "5"))
+ENGINE_OUTLIER_FACTOR = float(os.getenv("VOICEVOX_OUTLIER_FACTOR", "3"))
+
+# VOICEVOXに discord がそのまま再生できる 48kHz ステレオで出力させる（0でエンジン既定の形式）
+OUTPUT_DISCORD_PCM = os.getenv("VOICEVOX_OUTPUT_48K_STEREO", "1") == "1"
+
+# 1発話の音声の長さの上限（秒、0で無制限）。audio_query のモーラ長から予測し、
+# 超える場合は VOICEVOX_MAX_SPEED_SCALE まで話速を上げ、それでも超える分は末尾のアクセント句を削る
+MAX_UTTERANCE_SECONDS = float(os.getenv("VOICEVOX_MAX_UTTERANCE_SECONDS", "30"))
+MAX_SPEED_SCALE = float(os.getenv("VOICEVOX_MAX_SPEED_SCALE", "1.6"))
+
+# 合成済み音声キャッシュの設定（MB単位、0で無効）
+AUDIO_CACHE_MEMORY_MB = float(os.getenv("AUDIO_CACHE_MEMORY_MB", "64"))
+AUDIO_CACHE_DISK_MB = float(os.getenv("AUDIO_CACHE_DISK_MB", "1024"))
+
+# エンジンバージョン取得に失敗した場合の再試行間隔（秒）
+ENGINE_VERSION_RETRY_INTERVAL = 60.0
+
+# 音声キャッシュはプロセス内で1つだけ持つ（VOICEVOXLibの各インスタンスで共有）
+_shared_audio_cache = None
+
+
+def _get_audio_cache(tmp_dir):
+    global _shared_audio_cache
+    if _shared_audio_cache is None:
+        cache_dir = os.path.join(tmp_dir, "audio_cache") if tmp_dir else None
+        _shared_audio_cache = AudioCache(
+            cache_dir,
+            memory_limit_bytes=int(AUDIO_CACHE_MEMORY_MB * 1024 * 1024),
+            disk_limit_bytes=int(AUDIO_CACHE_DISK_MB * 1024 * 1024),
+        )
+    return _shared_audio_cache
+
+
+async def _on_connection_create_end(session, trace_config_ctx, params):
+    VOICEVOX_HTTP_CONNECTIONS_CREATED.inc()
+
+
+async def _on_connection_reuseconn(session, trace_config_ctx, params):
+    VOICEVOX_HTTP_CONNECTIONS_REUSED.inc()
+
+
+async def _on_dns_cache_hit(session, trace_config_ctx, params):
+    VOICEVOX_HTTP_DNS_CACHE.labels(result="hit").inc()
+
+
+async def _on_dns_cache_miss(session, trace_config_ctx, params):
+    VOICEVOX_HTTP_DNS_CACHE.labels(result="miss").inc()
+
 
 class VOICEVOXLib:
     def __init__(self, base_url=None):
         self._base_url_arg = base_url  # 引数を保存
-        self._default_url = "http://localhost:50021"
-        # 初期化時は一度だけロード
-        self.base_urls = self._load_base_urls()
-        self.backup_urls = self._load_backup_urls()
+        self.base_urls = []
+        self.backup_urls = []
+        # エンジンの健全性管理と振り分け
+        self.pool = EnginePool(
+            failure_threshold=ENGINE_FAILURE_THRESHOLD,
+            open_seconds=ENGINE_OPEN_SECONDS,
+            probe_interval=ENGINE_PROBE_INTERVAL,
+            outlier_factor=ENGINE_OUTLIER_FACTOR,
+        )
+        # URLリストは実行時設定（lib.runtime_config）が差し替わったときだけ反映する
+        self._config = None
+        self._refresh_urls()
+        # 共有HTTPセッション（start()または初回リクエスト時に作成、close()で破棄）
+        self._session = None
         # プロジェクトルートの tmp ディレクトリを確保
         # lib ディレクトリの親をプロジェクトルートとみなし、その直下に tmp を作成する
         try:
@@ -44,38 +188,307 @@ class VOICEVOXLib:
             except Exception:
                 # 最終手段として tmp_dir を None にしておく
                 self.tmp_dir = None
-
-    def _load_base_urls(self):
-        # .envを毎回再読込
-        load_dotenv(override=True)
+        # 合成済み音声キャッシュ（tmp/audio_cache 以下に永続化）
+        self.audio_cache = _get_audio_cache(self.tmp_dir)
+        self._engine_version = None
+        self._engine_version_checked_at = 0.0
+
+    async def start(self):
+        """共有セッションを作成し、エンジンのヘルスチェックを開始する（cog_load から呼ぶ）"""
+        await self._get_session()
+        self.pool.start(self._get_session)
+
+    async def close(self):
+        """ヘルスチェックを止め、共有セッションを閉じる（cog_unload から呼ぶ）"""
+        await self.pool.stop()
+        session = self._session
+        self._session = None
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """keep-alive・DNSキャッシュ付きの共有セッションを返す
+
+        セッションは作成したイベントループに紐づくため、別スレッドのループから
+        呼ばないこと（bot_http_server からは bot.loop に投げて実行する）。
+        """
+        if self._session is None or self._session.closed:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(_on_connection_create_end)
+            trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+            trace_config.on_dns_cache_hit.append(_on_dns_cache_hit)
+            trace_config.on_dns_cache_miss.append(_on_dns_cache_miss)
+            connector = aiohttp.TCPConnector(
+                limit=0,  # 全体上限はなし、エンジンごとに limit_per_host で制限
+                limit_per_host=CONN_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                use_dns_cache=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                trace_configs=[trace_config],
+            )
+        return self._session
+
+    def _refresh_urls(self):
+        """実行時設定が差し替わっていればURLリストとエンジンプールを更新する（ファイルI/Oなし）"""
+        config = get_config()
+        if config is self._config:
+            return
+        self._config = config
         if self._base_url_arg is None:
-            env_urls = os.getenv("VOICEVOX_URL", self._default_url)
-            if not env_urls:
-                env_urls = self._default_url
-            return [u.strip() for u in env_urls.split(",") if u.strip()]
+            self.base_urls = list(config.voicevox_urls)
+        elif isinstance(self._base_url_arg, list):
+            self.base_urls = list(self._base_url_arg)
         else:
-            if isinstance(self._base_url_arg, list):
-                return self._base_url_arg
-            else:
-                return [self._base_url_arg]
-
-    def _load_backup_urls(self):
-        load_dotenv(override=True)
-        backup_env_urls = os.getenv("VOICEVOX_BACKUP_URL", "")
-        return [u.strip() for u in backup_env_urls.split(",") if u.strip()]
+            self.base_urls = [self._base_url_arg]
+        self.backup_urls = list(config.voicevox_backup_urls)
+        self.pool.update_urls(self.base_urls, self.backup_urls)
+        self.pool.set_routing(config.voicevox_routing)
 
     def _choose_base_url(self):
-        # .envを毎回再読込してURLリストを更新
-        self.base_urls = self._load_base_urls()
-        return random.choice(self.base_urls)
+        self._refresh_urls()
+        return self.pool.choose()
 
     async def get_speakers(self):
         """Fetch available speakers from the VOICEVOX engine."""
         base_url = self._choose_base_url()
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{base_url}/speakers") as response:
+        session = await self._get_session()
+        async with session.get(f"{base_url}/speakers") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_engine_version(self) -> Optional[str]:
+        """エンジンのバージョンを取得する（キャッシュキー用、取得できなければ None）
+
+        取得できたバージョンだけを覚える。失敗した場合は ENGINE_VERSION_RETRY_INTERVAL 秒後に取り直す。
+        """
+        if self._engine_version is not None:
+            return self._engine_version
+        now = time.monotonic()
+        if now - self._engine_version_checked_at < ENGINE_VERSION_RETRY_INTERVAL:
+            return None
+        self._engine_version_checked_at = now
+        try:
+            base_url = self._choose_base_url()
+            session = await self._get_session()
+            async with session.get(f"{base_url}/version") as response:
                 response.raise_for_status()
-                return await response.json()
+                self._engine_version = str(await response.json())
+        except Exception as e:
+            logging.warning(f"Failed to fetch VOICEVOX engine version: {e}")
+            return None
+        return self._engine_version
+
+    @staticmethod
+    def _apply_query_options(audio_query: dict, speed=None) -> dict:
+        """audio_query に速度と出力形式を設定する"""
+        if speed is not None and "speedScale" in audio_query:
+            audio_query["speedScale"] = speed
+        if OUTPUT_DISCORD_PCM:
+            # 48kHzステレオで受け取ればFFmpegでのリサンプリングが不要になる
+            audio_query["outputSamplingRate"] = 48000
+            audio_query["outputStereo"] = True
+        return audio_query
+
+    @staticmethod
+    def _phrase_seconds(accent_phrase: dict) -> float:
+        """アクセント句1つ分の発話時間（話速1.0のとき）"""
+        moras = list(accent_phrase.get("moras") or [])
+        if accent_phrase.get("pause_mora"):
+            moras.append(accent_phrase["pause_mora"])
+        return sum((mora.get("consonant_length") or 0.0) + (mora.get("vowel_length") or 0.0) for mora in moras)
+
+    @classmethod
+    def predict_duration(cls, audio_query: dict) -> float:
+        """audio_query から合成される音声の長さ（秒）を予測する"""
+        speed = float(audio_query.get("speedScale") or 1.0)
+        speech = sum(cls._phrase_seconds(phrase) for phrase in audio_query.get("accent_phrases") or [])
+        return (speech / speed
+                + float(audio_query.get("prePhonemeLength") or 0.0)
+                + float(audio_query.get("postPhonemeLength") or 0.0))
+
+    @classmethod
+    def _apply_duration_budget(cls, audio_query: dict, max_seconds: float = None) -> dict:
+        """予測した音声の長さが max_seconds を超えるなら話速を上げ、それでも超える分は末尾を削る"""
+        max_seconds = MAX_UTTERANCE_SECONDS if max_seconds is None else max_seconds
+        if max_seconds <= 0 or "accent_phrases" not in audio_query:
+            return audio_query
+        predicted = cls.predict_duration(audio_query)
+        if predicted <= max_seconds:
+            return audio_query
+        fixed = float(audio_query.get("prePhonemeLength") or 0.0) + float(audio_query.get("postPhonemeLength") or 0.0)
+        available = max_seconds - fixed
+        if available <= 0:
+            return audio_query
+        speed = float(audio_query.get("speedScale") or 1.0)
+        needed_speed = speed * (predicted - fixed) / available
+        max_speed = max(MAX_SPEED_SCALE, speed)
+        if needed_speed <= max_speed:
+            audio_query["speedScale"] = needed_speed
+            VOICEVOX_DURATION_BUDGET_APPLIED.labels(action="speed").inc()
+            return audio_query
+
+        # 話速を上限まで上げても収まらない分は、収まるところまでのアクセント句だけを合成する
+        audio_query["speedScale"] = max_speed
+        kept, total = [], 0.0
+        for phrase in audio_query["accent_phrases"]:
+            seconds = cls._phrase_seconds(phrase) / max_speed
+            if kept and total + seconds > available:
+                break
+            kept.append(phrase)
+            total += seconds
+        audio_query["accent_phrases"] = kept
+        VOICEVOX_DURATION_BUDGET_APPLIED.labels(action="trim").inc()
+        VOICEVOX_DURATION_BUDGET_TRIMMED_SECONDS.inc(max(0.0, predicted - fixed - total))
+        return audio_query
+
+    async def cache_key(self, text, speaker_id, speed=None) -> Optional[str]:
+        """音声キャッシュのキー。エンジンのバージョンがわからないときは None（キャッシュを使わない）
+
+        バージョン不明のまま保存すると、エンジンの更新後も古い音声がヒットしてしまうため。
+        """
+        version = await self.get_engine_version()
+        if version is None:
+            return None
+        # 出力形式や長さの上限が異なる音声を取り違えないようキーに含める
+        output_format = "48k-stereo" if OUTPUT_DISCORD_PCM else "engine-default"
+        budget = f"max{MAX_UTTERANCE_SECONDS:g}s@{MAX_SPEED_SCALE:g}x"
+        return AudioCache.make_key(text, speaker_id, speed, f"{version}|{output_format}|{budget}")
+
+    async def _synthesize_cached(self, text, speaker_id, speed=None, use_cache: bool = True) -> tuple[str, bytes]:
+        """音声キャッシュを引き、なければエンジンで合成してキャッシュに格納する"""
+        if not use_cache:
+            return await self._synthesize_with_failover(text, speaker_id, speed)
+        key = await self.cache_key(text, speaker_id, speed)
+        if key is None:
+            return await self._synthesize_with_failover(text, speaker_id, speed)
+        wav_bytes = self.audio_cache.get_from_memory(key)
+        if wav_bytes is None:
+            wav_bytes = await asyncio.to_thread(self.audio_cache.get_from_disk, key)
+        if wav_bytes is not None:
+            return "cache", wav_bytes
+        self.audio_cache.record_miss()
+        used_url, wav_bytes = await self._synthesize_with_failover(text, speaker_id, speed)
+        try:
+            await asyncio.to_thread(self.audio_cache.put, key, wav_bytes)
+        except Exception as e:
+            # キャッシュ失敗で読み上げを止めない
+            logging.error(f"Failed to store synthesized audio in cache: {e}")
+        return used_url, wav_bytes
+
+    @staticmethod
+    def _wav_duration(wav_bytes: bytes) -> float:
+        """WAVの長さ（秒）を返す"""
+        with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
+            n_frames = wav_file.getnframes()
+            framerate = wav_file.getframerate()
+            return n_frames / framerate if framerate else 0.0
+
+    def _synthesis_labels(self, base_url: str, speaker_id) -> dict:
+        engine = self.pool.engines.get(base_url)
+        return {"engine": base_url, "role": engine.role if engine else "primary", "speaker": str(speaker_id)}
+
+    def _observe_wav(self, labels: dict, wav_bytes: bytes) -> float:
+        """WAVのバイト数と長さを記録し、長さ（秒）を返す"""
+        try:
+            duration_sec = self._wav_duration(wav_bytes)
+        except Exception:
+            # 安全のため例外は無視（メトリクス失敗で処理を止めない）
+            duration_sec = 0.0
+        VOICEVOX_WAV_BYTES.labels(**labels).observe(len(wav_bytes))
+        VOICEVOX_AUDIO_DURATION_SECONDS.labels(**labels).observe(duration_sec)
+        return duration_sec
+
+    def _record_generation_time(self, base_url: str, speaker_id, query_seconds: float,
+                                synthesis_seconds: float, wav_bytes: bytes) -> None:
+        """段階ごとの処理時間と音声長からメトリクスとエンジンプールの統計を更新する"""
+        labels = self._synthesis_labels(base_url, speaker_id)
+        elapsed = query_seconds + synthesis_seconds
+        VOICEVOX_AUDIO_QUERY_SECONDS.labels(**labels).observe(query_seconds)
+        VOICEVOX_SYNTHESIS_SECONDS.labels(**labels).observe(synthesis_seconds)
+        duration_sec = self._observe_wav(labels, wav_bytes)
+        if duration_sec > 0:
+            VOICEVOX_REALTIME_FACTOR.labels(**labels).observe(elapsed / duration_sec)
+        self.pool.record_success(base_url, elapsed, duration_sec)
+
+    async def _request_wav(self, base_url, text, speaker_id, speed=None) -> bytes:
+        """1つのエンジンに対して audio_query → synthesis を実行してWAVを返す"""
+        self.pool.begin(base_url)
+        try:
+            session = await self._get_session()
+            start_time = time.perf_counter()
+            # Step 1: Generate audio query
+            async with session.post(
+                f"{base_url}/audio_query",
+                params={"text": text, "speaker": speaker_id}
+            ) as query_response:
+                query_response.raise_for_status()
+                audio_query = self._apply_duration_budget(self._apply_query_options(await query_response.json(), speed))
+            query_done = time.perf_counter()
+
+            # Step 2: Synthesize audio
+            async with session.post(
+                f"{base_url}/synthesis",
+                params={"speaker": speaker_id},
+                json=audio_query
+            ) as synthesis_response:
+                synthesis_response.raise_for_status()
+                wav_bytes = await synthesis_response.read()
+        finally:
+            self.pool.end(base_url)
+
+        self._record_generation_time(
+            base_url, speaker_id, query_done - start_time, time.perf_counter() - query_done, wav_bytes
+        )
+        return wav_bytes
+
+    async def _synthesize_with_failover(self, text, speaker_id, speed=None) -> tuple[str, bytes]:
+        """エンジンプールが選んだ順にエンジンを試行する
+
+        サーキットが open のエンジンは候補から外れるため、落ちているエンジンに
+        毎回リトライを浪費しない。通常サーバーが全滅している間はプールが
+        バックアップサーバーを候補として返す。
+        """
+        self._refresh_urls()
+        last_error = None
+        for base_url in self.pool.candidates():
+            if self._config.debug:
+                print(f"Using VOICEVOX URL: {base_url}")
+            try:
+                wav_bytes = await self._request_wav(base_url, text, speaker_id, speed)
+            except EngineBusyError as e:
+                last_error = e
+                continue
+            except aiohttp.ClientResponseError as e:
+                if e.status < 500:
+                    # 4xx はテキストやパラメータの問題なので他のエンジンでも失敗する
+                    self.pool.release(base_url)
+                    raise
+                logging.error(f"VOICEVOX synthesis failed for URL {base_url}: {e}")
+                self.pool.record_failure(base_url, e)
+                last_error = e
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.error(f"VOICEVOX synthesis failed for URL {base_url}: {e!r}")
+                self.pool.record_failure(base_url, e)
+                last_error = e
+                continue
+            except Exception as e:
+                logging.error(f"VOICEVOX synthesis unexpected error for URL {base_url}: {e}")
+                self.pool.record_failure(base_url, e)
+                last_error = e
+                continue
+            if self.pool.is_backup(base_url) and sentry_sdk:
+                # SentryにINFOログ送信
+                sentry_sdk.capture_message(
+                    f"VOICEVOX backup server used: {base_url} for text: {text[:50]}...",
+                    level="info"
+                )
+            return base_url, wav_bytes
+        raise RuntimeError(f"All VOICEVOX URLs failed for synthesis: {text[:50]}... Last error: {last_error}")
 
     async def synthesize(self, text, speaker_id, output_path, speed: float = 1.0):
         """
@@ -87,304 +500,203 @@ class VOICEVOXLib:
             output_path (str): Path to save the output WAV file.
             speed (float): Speed of the synthesized voice (default 1.0).
         """
-        # .envを毎回再読込してURLリストを更新
-        self.base_urls = self._load_base_urls()
-        self.backup_urls = self._load_backup_urls()
-        last_error = None
-        # まず通常サーバーで試行
-        for base_url in self.base_urls:
-            if os.getenv("DEBUG") == "1":
-                print(f"Using VOICEVOX URL: {base_url}")
-            for attempt in range(3):
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        start_time = time.perf_counter()
-                        # Step 1: Generate audio query
-                        async with session.post(
-                            f"{base_url}/audio_query",
-                            params={"text": text, "speaker": speaker_id}
-                        ) as query_response:
-                            if query_response.status >= 500:
-                                raise aiohttp.ClientResponseError(
-                                    request_info=query_response.request_info,
-                                    history=query_response.history,
-                                    status=query_response.status,
-                                    message=f"HTTP {query_response.status}",
-                                    headers=query_response.headers
-                                )
-                            query_response.raise_for_status()
-                            audio_query = await query_response.json()
-                            if "speedScale" in audio_query:
-                                audio_query["speedScale"] = speed
-
-                        # Step 2: Synthesize audio
-                        async with session.post(
-                            f"{base_url}/synthesis",
-                            params={"speaker": speaker_id},
-                            json=audio_query
-                        ) as synthesis_response:
-                            if synthesis_response.status >= 500:
-                                raise aiohttp.ClientResponseError(
-                                    request_info=synthesis_response.request_info,
-                                    history=synthesis_response.history,
-                                    status=synthesis_response.status,
-                                    message=f"HTTP {synthesis_response.status}",
-                                    headers=synthesis_response.headers
-                                )
-                            synthesis_response.raise_for_status()
-                            wav_bytes = await synthesis_response.read()
-
-                        elapsed = time.perf_counter() - start_time
-
-                        # Step 3: Save WAV file and compute duration
-                        with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
-                            n_frames = wav_file.getnframes()
-                            framerate = wav_file.getframerate()
-                            duration_sec = n_frames / framerate if framerate else 0.0
-
-                            # Update Prometheus metric: seconds of processing per 1 minute of audio
-                            if duration_sec > 0:
-                                seconds_per_minute = elapsed * 60.0 / duration_sec
-                            else:
-                                seconds_per_minute = 0.0
-                            try:
-                                VOICE_GENERATION_TIME_PER_MINUTE.set(seconds_per_minute)
-                            except Exception:
-                                # 安全のため例外は無視（メトリクス失敗で処理を止めない）
-                                pass
-
-                            # 出力先をプロジェクトルートの tmp ディレクトリに固定し、そのパスを返す
-                            filename = os.path.basename(output_path)
-                            if self.tmp_dir:
-                                tmp_output_path = os.path.join(self.tmp_dir, filename)
-                            else:
-                                tmp_output_path = os.path.abspath(output_path)
-
-                            # tmp に保存
-                            with wave.open(tmp_output_path, "wb") as output_file:
-                                output_file.setparams(wav_file.getparams())
-                                output_file.writeframes(wav_file.readframes(n_frames))
-
-                            return tmp_output_path
-                except aiohttp.ClientResponseError as e:
-                    logging.error(f"VOICEVOX synthesis failed for URL {base_url} (attempt {attempt+1}/3): {e}")
-                    last_error = e
-                    time.sleep(0.5)
-                    continue
-                except aiohttp.ClientError as e:
-                    logging.error(f"VOICEVOX synthesis failed for URL {base_url} (attempt {attempt+1}/3): {e}")
-                    last_error = e
-                    time.sleep(0.5)
-                    continue
-                except Exception as e:
-                    logging.error(f"VOICEVOX synthesis unexpected error for URL {base_url}: {e}")
-                    last_error = e
-                    break
-        # 通常サーバー全て失敗→バックアップサーバーで再試行
-        if self.backup_urls:
-            for backup_url in self.backup_urls:
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        start_time = time.perf_counter()
-                        # Step 1: Generate audio query
-                        async with session.post(
-                            f"{backup_url}/audio_query",
-                            params={"text": text, "speaker": speaker_id}
-                        ) as query_response:
-                            query_response.raise_for_status()
-                            audio_query = await query_response.json()
-                            if "speedScale" in audio_query:
-                                audio_query["speedScale"] = speed
-
-                        # Step 2: Synthesize audio
-                        async with session.post(
-                            f"{backup_url}/synthesis",
-                            params={"speaker": speaker_id},
-                            json=audio_query
-                        ) as synthesis_response:
-                            synthesis_response.raise_for_status()
-                            wav_bytes = await synthesis_response.read()
-
-                        elapsed = time.perf_counter() - start_time
-
-                        # Step 3: Save WAV file and compute duration
-                        with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
-                            n_frames = wav_file.getnframes()
-                            framerate = wav_file.getframerate()
-                            duration_sec = n_frames / framerate if framerate else 0.0
-
-                            # Update Prometheus metric: seconds of processing per 1 minute of audio
-                            if duration_sec > 0:
-                                seconds_per_minute = elapsed * 60.0 / duration_sec
-                            else:
-                                seconds_per_minute = 0.0
-                            try:
-                                VOICE_GENERATION_TIME_PER_MINUTE.set(seconds_per_minute)
-                            except Exception:
-                                pass
-
-                            filename = os.path.basename(output_path)
-                            if self.tmp_dir:
-                                tmp_output_path = os.path.join(self.tmp_dir, filename)
-                            else:
-                                tmp_output_path = os.path.abspath(output_path)
-
-                            # tmp に保存
-                            with wave.open(tmp_output_path, "wb") as output_file:
-                                output_file.setparams(wav_file.getparams())
-                                output_file.writeframes(wav_file.readframes(n_frames))
-
-                            # SentryにINFOログ送信
-                            if sentry_sdk:
-                                sentry_sdk.capture_message(
-                                    f"VOICEVOX backup server used: {backup_url} for text: {text[:50]}...",
-                                    level="info"
-                                )
-                            return tmp_output_path
-                except Exception as e:
-                    logging.error(f"VOICEVOX backup synthesis failed for URL {backup_url}: {e}")
-                    last_error = e
-                    continue
-        raise RuntimeError(f"All VOICEVOX URLs failed for synthesis: {text[:50]}... Last error: {last_error}")
+        _, wav_bytes = await self._synthesize_cached(text, speaker_id, speed)
 
-    async def synthesize_bytes(self, text, speaker_id) -> tuple[str, bytes]:
+        # 出力先をプロジェクトルートの tmp ディレクトリに固定し、そのパスを返す
+        filename = os.path.basename(output_path)
+        if self.tmp_dir:
+            tmp_output_path = os.path.join(self.tmp_dir, filename)
+        else:
+            tmp_output_path = os.path.abspath(output_path)
+
+        # tmp に保存
+        with open(tmp_output_path, "wb") as output_file:
+            output_file.write(wav_bytes)
+        return tmp_output_path
+
+    async def synthesize_bytes(self, text, speaker_id, speed: float = None, use_cache: bool = True) -> tuple[str, bytes]:
         """
         Synthesize speech from text and return audio data as bytes.
 
         Args:
             text (str): The text to synthesize.
             speaker_id (int): The ID of the speaker to use.
+            speed (float): Speed of the synthesized voice (default: engine default).
+            use_cache (bool): Look up / store the result in the audio cache (default True).
 
         Returns:
-            tuple[str, bytes]: The used base URL and the synthesized speech audio data.
+            tuple[str, bytes]: The used base URL ("cache" on a cache hit) and the synthesized speech audio data.
         """
-        # .envを毎回再読込してURLリストを更新
-        self.base_urls = self._load_base_urls()
-        self.backup_urls = self._load_backup_urls()
-        last_error = None
-        for base_url in self.base_urls:
-            if os.getenv("DEBUG") == "1":
-                print(f"Using VOICEVOX URL: {base_url}")
-            for attempt in range(3):
+        return await self._synthesize_cached(text, speaker_id, speed, use_cache)
+
+    async def _request_multi_wav(self, base_url, texts, speaker_id, speed=None) -> list[bytes]:
+        """1つのエンジンに対して audio_query を並列実行し、/multi_synthesis で一括合成する"""
+        self.pool.begin(base_url)
+        try:
+            session = await self._get_session()
+            start_time = time.perf_counter()
+
+            labels = self._synthesis_labels(base_url, speaker_id)
+
+            async def audio_query(text):
+                query_start = time.perf_counter()
+                async with session.post(
+                    f"{base_url}/audio_query",
+                    params={"text": text, "speaker": speaker_id}
+                ) as query_response:
+                    query_response.raise_for_status()
+                    query = self._apply_duration_budget(self._apply_query_options(await query_response.json(), speed))
+                VOICEVOX_AUDIO_QUERY_SECONDS.labels(**labels).observe(time.perf_counter() - query_start)
+                return query
+
+            tasks = [asyncio.ensure_future(audio_query(text)) for text in texts]
+            try:
+                queries = await asyncio.gather(*tasks)
+            except BaseException:
+                # 1件でも失敗したら残りの audio_query は取り消し、終わるのを待ってから end() する
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            synthesis_start = time.perf_counter()
+            async with session.post(
+                f"{base_url}/multi_synthesis",
+                params={"speaker": speaker_id},
+                json=queries
+            ) as synthesis_response:
+                synthesis_response.raise_for_status()
+                zip_bytes = await synthesis_response.read()
+        finally:
+            self.pool.end(base_url)
+        elapsed = time.perf_counter() - start_time
+        VOICEVOX_SYNTHESIS_SECONDS.labels(**labels).observe(time.perf_counter() - synthesis_start)
+
+        # zip内のWAVはクエリの順番どおりの連番ファイル名で格納されている
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as archive:
+            names = sorted(name for name in archive.namelist() if name.lower().endswith(".wav"))
+            if len(names) != len(texts):
+                raise RuntimeError(f"multi_synthesis returned {len(names)} files for {len(texts)} queries")
+            results = [archive.read(name) for name in names]
+
+        total_duration = sum(self._observe_wav(labels, wav_bytes) for wav_bytes in results)
+        if total_duration > 0:
+            VOICEVOX_REALTIME_FACTOR.labels(**labels).observe(elapsed / total_duration)
+        engine = self.pool.engines.get(base_url)
+        single_rtf = engine.ewma_rtf if engine else None
+        if single_rtf and total_duration > 0 and elapsed > 0:
+            VOICEVOX_BATCH_SPEEDUP.labels(engine=base_url).set(single_rtf / (elapsed / total_duration))
+        self.pool.record_success(base_url, elapsed, total_duration)
+        VOICEVOX_BATCH_SIZE.observe(len(texts))
+        VOICEVOX_BATCH_ROUND_TRIPS_SAVED.inc(len(texts) - 1)
+        return results
+
+    async def synthesize_batch(self, texts, speaker_id, speed: float = None) -> list[bytes]:
+        """
+        Synthesize several texts for one speaker with a single /multi_synthesis call.
+
+        Texts already in the audio cache are not sent to the engine. The audio_query
+        calls for the rest run in parallel against one engine, then all queries are
+        synthesized in one request. Falls back to per-text synthesis if every engine
+        fails the batch request.
+
+        Returns:
+            list[bytes]: WAV data for each text, in the same order as texts.
+        """
+        self._refresh_urls()
+        keys = await asyncio.gather(*(self.cache_key(text, speaker_id, speed) for text in texts))
+        results: list = [None] * len(texts)
+        for i, key in enumerate(keys):
+            if key is None:
+                continue
+            wav_bytes = self.audio_cache.get_from_memory(key)
+            if wav_bytes is None:
+                wav_bytes = await asyncio.to_thread(self.audio_cache.get_from_disk, key)
+            results[i] = wav_bytes
+        missing = [i for i, wav_bytes in enumerate(results) if wav_bytes is None]
+        if not missing:
+            return results
+        for _ in missing:
+            self.audio_cache.record_miss()
+
+        synthesized = None
+        if len(missing) > 1:
+            missing_texts = [texts[i] for i in missing]
+            for base_url in self.pool.candidates():
                 try:
-                    async with aiohttp.ClientSession() as session:
-                        start_time = time.perf_counter()
-
-                        # Step 1: Generate audio query
-                        async with session.post(
-                            f"{base_url}/audio_query",
-                            params={"text": text, "speaker": speaker_id}
-                        ) as query_response:
-                            if query_response.status >= 500:
-                                raise aiohttp.ClientResponseError(
-                                    request_info=query_response.request_info,
-                                    history=query_response.history,
-                                    status=query_response.status,
-                                    message=f"HTTP {query_response.status}",
-                                    headers=query_response.headers
-                                )
-                            query_response.raise_for_status()
-                            audio_query = await query_response.json()
-
-                        # Step 2: Synthesize audio
-                        async with session.post(
-                            f"{base_url}/synthesis",
-                            params={"speaker": speaker_id},
-                            json=audio_query
-                        ) as synthesis_response:
-                            if synthesis_response.status >= 500:
-                                raise aiohttp.ClientResponseError(
-                                    request_info=synthesis_response.request_info,
-                                    history=synthesis_response.history,
-                                    status=synthesis_response.status,
-                                    message=f"HTTP {synthesis_response.status}",
-                                    headers=synthesis_response.headers
-                                )
-                            synthesis_response.raise_for_status()
-                            wav_bytes = await synthesis_response.read()
-
-                        elapsed = time.perf_counter() - start_time
-
-                        # Compute duration and set metric
-                        try:
-                            with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
-                                n_frames = wav_file.getnframes()
-                                framerate = wav_file.getframerate()
-                                duration_sec = n_frames / framerate if framerate else 0.0
-                                if duration_sec > 0:
-                                    seconds_per_minute = elapsed * 60.0 / duration_sec
-                                else:
-                                    seconds_per_minute = 0.0
-                                VOICE_GENERATION_TIME_PER_MINUTE.set(seconds_per_minute)
-                        except Exception:
-                            # 例外は無視して wav_bytes を返す（メトリクスの失敗で処理を止めない）
-                            pass
-
-                        return base_url, wav_bytes
-                except aiohttp.ClientResponseError as e:
-                    logging.error(f"VOICEVOX synthesize_bytes failed for URL {base_url} (attempt {attempt+1}/3): {e}")
-                    last_error = e
-                    time.sleep(0.5)
-                    continue
-                except aiohttp.ClientError as e:
-                    logging.error(f"VOICEVOX synthesize_bytes failed for URL {base_url} (attempt {attempt+1}/3): {e}")
-                    last_error = e
-                    time.sleep(0.5)
+                    synthesized = await self._request_multi_wav(base_url, missing_texts, speaker_id, speed)
+                    break
+                except EngineBusyError:
                     continue
+                except aiohttp.ClientResponseError as e:
+                    logging.error(f"VOICEVOX multi_synthesis failed for URL {base_url}: {e}")
+                    if e.status < 500:
+                        # 4xx（非対応エンジンや不正なテキスト）は1件ずつの合成に切り替える
+                        self.pool.release(base_url)
+                        break
+                    self.pool.record_failure(base_url, e)
                 except Exception as e:
-                    logging.error(f"VOICEVOX synthesize_bytes unexpected error for URL {base_url}: {e}")
-                    last_error = e
+                    logging.error(f"VOICEVOX multi_synthesis failed for URL {base_url}: {e!r}")
+                    self.pool.record_failure(base_url, e)
+        if synthesized is None:
+            synthesized = [
+                (await self._synthesize_with_failover(texts[i], speaker_id, speed))[1]
+                for i in missing
+            ]
+        for i, wav_bytes in zip(missing, synthesized):
+            results[i] = wav_bytes
+            if keys[i] is None:
+                continue
+            try:
+                await asyncio.to_thread(self.audio_cache.put, keys[i], wav_bytes)
+            except Exception as e:
+                logging.error(f"Failed to store synthesized audio in cache: {e}")
+        return results
+
+    async def synthesize_stream(self, text, speaker_id, speed: float = None, max_parallel: int = 3, min_chunk_chars: int = 8):
+        """
+        Split text at sentence/clause boundaries and synthesize the chunks concurrently.
+
+        Chunks are requested in parallel (up to max_parallel at a time, spread across
+        engines by the engine pool) and yielded in order as soon as each one is ready,
+        so playback can begin with the first chunk.
+
+        Each chunk is capped by the per-utterance duration budget, and no further
+        chunks are yielded once the audio yielded so far reaches the budget.
+
+        Yields:
+            bytes: WAV data for each chunk, in text order.
+        """
+        chunks = split_text_chunks(text, min_chunk_chars)
+        if not chunks:
+            return
+        semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+        async def synthesize_chunk(chunk):
+            async with semaphore:
+                _, wav_bytes = await self._synthesize_cached(chunk, speaker_id, speed)
+                return wav_bytes
+
+        # 先頭から順にセマフォを取得するため、タスク作成順＝合成開始順になる
+        tasks = [asyncio.ensure_future(synthesize_chunk(chunk)) for chunk in chunks]
+        yielded_seconds = 0.0
+        try:
+            for task in tasks:
+                if MAX_UTTERANCE_SECONDS > 0 and yielded_seconds >= MAX_UTTERANCE_SECONDS:
+                    # 発話全体が上限に達したら残りのチャンクは合成・再生しない
+                    VOICEVOX_DURATION_BUDGET_APPLIED.labels(action="trim").inc()
                     break
-        # 通常サーバー全て失敗→バックアップサーバーで再試行
-        if self.backup_urls:
-            for backup_url in self.backup_urls:
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        start_time = time.perf_counter()
-                        # Step 1: Generate audio query
-                        async with session.post(
-                            f"{backup_url}/audio_query",
-                            params={"text": text, "speaker": speaker_id}
-                        ) as query_response:
-                            query_response.raise_for_status()
-                            audio_query = await query_response.json()
-
-                        # Step 2: Synthesize audio
-                        async with session.post(
-                            f"{backup_url}/synthesis",
-                            params={"speaker": speaker_id},
-                            json=audio_query
-                        ) as synthesis_response:
-                            synthesis_response.raise_for_status()
-                            wav_bytes = await synthesis_response.read()
-
-                        try:
-                            with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
-                                n_frames = wav_file.getnframes()
-                                framerate = wav_file.getframerate()
-                                duration_sec = n_frames / framerate if framerate else 0.0
-                                if duration_sec > 0:
-                                    seconds_per_minute = elapsed * 60.0 / duration_sec
-                                else:
-                                    seconds_per_minute = 0.0
-                                VOICE_GENERATION_TIME_PER_MINUTE.set(seconds_per_minute)
-                        except Exception:
-                            pass
-                        # SentryにINFOログ送信
-                        if sentry_sdk:
-                            sentry_sdk.capture_message(
-                                f"VOICEVOX backup server used: {backup_url} for text: {text[:50]}...",
-                                level="info"
-                        )
-                        return backup_url, wav_bytes
-                except Exception as e:
-                    logging.error(f"VOICEVOX backup synthesize_bytes failed for URL {backup_url}: {e}")
-                    last_error = e
-                    continue
-        raise RuntimeError(f"All VOICEVOX URLs failed for synthesize_bytes: {text[:50]}... Last error: {last_error}")
+                wav_bytes = await task
+                yielded_seconds += self._wav_duration(wav_bytes)
+                yield wav_bytes
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
 # Example usage:
 # voicelib = VOICEVOXLib()
-# speakers = voicelib.get_speakers()
+# await voicelib.start()
+# speakers = await voicelib.get_speakers()
 # print(speakers)
-# voicelib.synthesize("こんにちは、世界！", speaker_id=1, output_path="output.wav")
+# await voicelib.synthesize("こんにちは、世界！", speaker_id=1, output_path="output.wav")
+# await voicelib.close()
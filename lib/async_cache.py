@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+CACHE_REQUESTS = Counter(
+    'tts_cache_requests_total',
+    'AsyncLoadingCache の参照回数（hit: キャッシュから, miss: 読み込んだ, coalesced: 読み込み中の結果を待った）',
+    ['cache', 'result']
+)
+CACHE_EVICTIONS = Counter(
+    'tts_cache_evictions_total',
+    'AsyncLoadingCache から件数の上限で追い出したエントリ数',
+    ['cache']
+)
+CACHE_ENTRIES = Gauge(
+    'tts_cache_entries',
+    'AsyncLoadingCache のエントリ数',
+    ['cache']
+)
+
+
+class AsyncLoadingCache:
+    """キーごとに1回だけ読み込む、件数上限（LRU）と有効期限付きの非同期キャッシュ
+
+    イベントループ上からだけ使う前提なのでロックは取らない（ヒット時は辞書を引くだけ）。
+    同じキーを同時に読み込もうとした場合は、最初の読み込みの結果を全員で待つ。
+    loader(key, previous) の previous は期限切れになった以前の値（なければ None）で、
+    内容が変わっていなければ作り直さない、といった再利用に使える。
+
+    読み込み中に invalidate されたキーの結果は、待っていた呼び出し元には返すが
+    キャッシュには入れない（変更前の内容を読んだ可能性があるため）。
+    """
+
+    def __init__(self, name: str, loader: Callable[[Hashable, Any], Awaitable[Any]],
+                 max_entries: int = 1000, ttl: Optional[float] = None) -> None:
+        self.name = name
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (値, 読み込んだ時刻)。期限切れの値も次の読み込みまでは previous 用に残す
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._entries_metric = CACHE_ENTRIES.labels(cache=name)
+        self._hits = CACHE_REQUESTS.labels(cache=name, result="hit")
+        self._misses = CACHE_REQUESTS.labels(cache=name, result="miss")
+        self._coalesced = CACHE_REQUESTS.labels(cache=name, result="coalesced")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries and self._is_fresh(self._entries[key][1])
+
+    def _is_fresh(self, loaded_at: float) -> bool:
+        return not self.ttl or time.monotonic() - loaded_at < self.ttl
+
+    async def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and self._is_fresh(entry[1]):
+            self._entries.move_to_end(key)
+            self._hits.inc()
+            return entry[0]
+        task = self._inflight.get(key)
+        if task is None:
+            self._misses.inc()
+            previous = entry[0] if entry is not None else None
+            task = asyncio.ensure_future(self._load(key, previous))
+            self._inflight[key] = task
+        else:
+            self._coalesced.inc()
+        # 呼び出し元がキャンセルされても、他の待ち手のために読み込みは続ける
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, previous: Any) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await self.loader(key, previous)
+        finally:
+            stored = self._inflight.get(key) is task
+            if stored:
+                del self._inflight[key]
+        if stored:
+            self._store(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """値を直接入れる（DBに書き込んだ値の write-through 用）。読み込み中の結果より優先する"""
+        self._inflight.pop(key, None)
+        self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        if evicted:
+            CACHE_EVICTIONS.labels(cache=self.name).inc(evicted)
+        self._entries_metric.set(len(self._entries))
+
+    def invalidate(self, key: Hashable) -> None:
+        """キーを捨てる。読み込み中ならその結果もキャッシュに入れない"""
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+        self._entries_metric.set(len(self._entries))
+
+    def expire_all(self) -> None:
+        """全エントリを期限切れにする（次の get で読み直すが、previous として値は渡る）"""
+        for key, (value, _) in self._entries.items():
+            self._entries[key] = (value, float("-inf"))
+        if not self.ttl:
+            # 有効期限なしのキャッシュでは期限切れを表せないので捨てる
+            self._entries.clear()
+            self._entries_metric.set(0)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+        self._entries_metric.set(0)
@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from prometheus_client import Counter, Gauge
+
+# 合成済み音声キャッシュのメトリクス（tier: memory / disk）
+AUDIO_CACHE_HITS = Counter(
+    'voicevox_audio_cache_hits_total',
+    '合成済み音声キャッシュのヒット数',
+    ['tier']
+)
+AUDIO_CACHE_MISSES = Counter(
+    'voicevox_audio_cache_misses_total',
+    '合成済み音声キャッシュのミス数（エンジンで合成した回数）'
+)
+AUDIO_CACHE_EVICTIONS = Counter(
+    'voicevox_audio_cache_evictions_total',
+    '合成済み音声キャッシュから追い出したエントリ数',
+    ['tier']
+)
+AUDIO_CACHE_BYTES = Gauge(
+    'voicevox_audio_cache_bytes',
+    '合成済み音声キャッシュの使用バイト数',
+    ['tier']
+)
+AUDIO_CACHE_ENTRIES = Gauge(
+    'voicevox_audio_cache_entries',
+    '合成済み音声キャッシュのエントリ数',
+    ['tier']
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """合成済みWAVのコンテンツアドレス型2段キャッシュ
+
+    - 1段目: バイト数上限付きのメモリLRU
+    - 2段目: cache_dir 以下のサイズ上限付きディスクストア
+
+    キーは make_key() で (辞書適用後テキスト, speaker_id, speed, エンジンバージョン) から作る。
+    ディスク操作はブロッキングなので、非同期コードからは asyncio.to_thread 経由で呼ぶこと。
+    """
+
+    def __init__(self, cache_dir: Optional[str], memory_limit_bytes: int, disk_limit_bytes: int) -> None:
+        self.cache_dir = cache_dir
+        self.memory_limit_bytes = max(0, memory_limit_bytes)
+        self.disk_limit_bytes = max(0, disk_limit_bytes) if cache_dir else 0
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> ファイルサイズ（LRU順）
+        self._disk_bytes = 0
+        if self.disk_limit_bytes > 0:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._load_disk_index()
+            except Exception as e:
+                logger.error(f"Failed to prepare audio cache dir {self.cache_dir}: {e}")
+                self.disk_limit_bytes = 0
+        self._update_gauges()
+
+    @staticmethod
+    def make_key(text: str, speaker_id: int, speed: Optional[float], engine_version: str) -> str:
+        """キャッシュキー（sha256の16進文字列）を作る"""
+        normalized = text.strip()
+        speed_part = "default" if speed is None else f"{float(speed):.3f}"
+        raw = f"{engine_version}\x00{int(speaker_id)}\x00{speed_part}\x00{normalized}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _load_disk_index(self) -> None:
+        """起動時に既存のキャッシュファイルを古い順にインデックスへ載せる"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".wav"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        entries.sort()
+        for _, key, size in entries:
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def get_from_memory(self, key: str) -> Optional[bytes]:
+        """メモリLRUから取得（ノンブロッキング）"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is None:
+                return None
+            self._memory.move_to_end(key)
+        AUDIO_CACHE_HITS.labels(tier="memory").inc()
+        return data
+
+    def get_from_disk(self, key: str) -> Optional[bytes]:
+        """ディスクストアから読み込み、メモリLRUへ昇格させる（ブロッキング）
+
+        呼び出し側もメモリLRUも所有権のある bytes を必要とするので、mmap は使わず
+        1回の read で読み込む（どのみち全体のコピーが必要なため）。
+        """
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if not data:
+                raise ValueError("empty cache file")
+        except (OSError, ValueError):
+            # 他プロセスによる削除や空ファイルはミス扱い
+            with self._lock:
+                size = self._disk.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+            self._update_gauges()
+            return None
+        AUDIO_CACHE_HITS.labels(tier="disk").inc()
+        self._put_memory(key, data)
+        return data
+
+    def record_miss(self) -> None:
+        AUDIO_CACHE_MISSES.inc()
+
+    def put(self, key: str, data: bytes) -> None:
+        """メモリLRUとディスクストアの両方へ格納する（ブロッキング）"""
+        self._put_memory(key, data)
+        self._put_disk(key, data)
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        # 1エントリで予算の1/8を超えるような長文音声はメモリに載せない
+        if self.memory_limit_bytes <= 0 or len(data) > self.memory_limit_bytes // 8:
+            return
+        evicted = 0
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_limit_bytes and self._memory:
+                _, removed = self._memory.popitem(last=False)
+                self._memory_bytes -= len(removed)
+                evicted += 1
+        if evicted:
+            AUDIO_CACHE_EVICTIONS.labels(tier="memory").inc(evicted)
+        self._update_gauges()
+
+    def _put_disk(self, key: str, data: bytes) -> None:
+        if self.disk_limit_bytes <= 0 or len(data) > self.disk_limit_bytes // 8:
+            return
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to write audio cache file {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        victims = []
+        with self._lock:
+            while self._disk_bytes > self.disk_limit_bytes and self._disk:
+                key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                victims.append(key)
+        for key in victims:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        if victims:
+            AUDIO_CACHE_EVICTIONS.labels(tier="disk").inc(len(victims))
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        AUDIO_CACHE_BYTES.labels(tier="memory").set(self._memory_bytes)
+        AUDIO_CACHE_BYTES.labels(tier="disk").set(self._disk_bytes)
+        AUDIO_CACHE_ENTRIES.labels(tier="memory").set(len(self._memory))
+        AUDIO_CACHE_ENTRIES.labels(tier="disk").set(len(self._disk))
@@ -0,0 +1,95 @@
+import io
+import re
+import threading
+import wave
+from typing import List, Optional, Tuple
+
+# 読点・句点・感嘆符・疑問符・改行の直後で分割する
+_CHUNK_BOUNDARY = re.compile(r"(?<=[。！？!?、\n])")
+
+
+def split_text_chunks(text: str, min_chunk_chars: int = 8) -> List[str]:
+    """辞書適用後のテキストを文・節の境界でストリーミング合成用のチャンクに分割する
+
+    短すぎる断片は次の断片とまとめる（1チャンクごとにエンジン往復が発生するため）。
+    """
+    chunks: List[str] = []
+    pending = ""
+    for piece in _CHUNK_BOUNDARY.split(text):
+        pending += piece
+        if len(pending.strip()) >= min_chunk_chars:
+            chunks.append(pending.strip())
+            pending = ""
+    if pending.strip():
+        if chunks and len(pending.strip()) < min_chunk_chars:
+            chunks[-1] += pending.strip()
+        else:
+            chunks.append(pending.strip())
+    return chunks
+
+
+def wav_to_pcm(wav_bytes: bytes) -> Tuple[bytes, int, int, int]:
+    """WAVから (PCMデータ, サンプリングレート, チャンネル数, サンプル幅) を取り出す"""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
+        params = wav_file.getparams()
+        pcm = wav_file.readframes(params.nframes)
+    return pcm, params.framerate, params.nchannels, params.sampwidth
+
+
+class ChunkedPCMStream(io.RawIOBase):
+    """チャンク単位で届くPCMを順番に読み出すブロッキングなファイル風オブジェクト
+
+    discord.FFmpegPCMAudio(pipe=True) の書き込みスレッドから read() され、
+    イベントループ側からは feed() / finish() / abort() で操作する。
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._cond = threading.Condition()
+        self._buffer = bytearray()
+        self._finished = False
+
+    def readable(self) -> bool:
+        return True
+
+    def feed(self, data: bytes) -> None:
+        with self._cond:
+            if self._finished:
+                return
+            self._buffer += data
+            self._cond.notify_all()
+
+    def finish(self) -> None:
+        """これ以上データが来ないことを通知する（残りは読み切られる）"""
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def abort(self) -> None:
+        """再生中止時に呼ぶ。未読データを捨てて読み手を即座にEOFにする"""
+        with self._cond:
+            self._finished = True
+            self._buffer.clear()
+            self._cond.notify_all()
+
+    def read_exact(self, size: int, timeout: Optional[float] = None) -> Optional[bytes]:
+        """size バイト揃うまで待って返す（終端では残りを返し、その後は空）
+
+        timeout 秒待っても揃わず、まだ終端でもなければ None を返す（データは読まずに残す）。
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._buffer) >= size or self._finished, timeout):
+                return None
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def read(self, size: int = -1) -> bytes:
+        with self._cond:
+            while not self._buffer and not self._finished:
+                self._cond.wait()
+            if size is None or size < 0:
+                size = len(self._buffer)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+from typing import List, Set, Tuple
+
+from lib.queue_types import QueueItem
+
+
+@dataclass
+class BacklogStats:
+    merged: int = 0     # 同じ投稿者の連続投稿をまとめた件数・同一メッセージをまとめた件数
+    dropped: int = 0    # 古すぎて読み上げずに捨てた件数
+
+
+def _author_key(item: QueueItem):
+    """投稿者の識別子（ユーザーIDがなければ表示名）。システム音声は空"""
+    return item.author_id or item.user_name
+
+
+def apply_backlog_policy(items: List[QueueItem], stale_seconds: float, merge_max_chars: int,
+                         summary_speaker_id: int) -> Tuple[List[QueueItem], BacklogStats]:
+    """溜まったキューの項目を、読み上げる価値のある少数の発話にまとめる
+
+    1. stale_seconds より古い項目は捨て、捨てた項目のうち最も優先度の高いレーンの先頭に
+       「ほかN件」を読み上げる項目を置く（より優先度の高いレーンの項目の後ろ）
+    2. 同一テキストは（間に別の投稿があっても）最初の1件だけ残す
+    3. 同じ投稿者・同じ話者の連続投稿は merge_max_chars 文字まで「、」で繋いで1件にする
+
+    システム音声（author_id も user_name もない）は投稿者単位でまとめない。
+    """
+    stats = BacklogStats()
+    fresh = items
+    summary_priority = None
+    if stale_seconds > 0:
+        fresh = [item for item in items if item.age <= stale_seconds]
+        stats.dropped = len(items) - len(fresh)
+        if stats.dropped:
+            summary_priority = min(item.priority for item in items if item.age > stale_seconds)
+
+    result: List[QueueItem] = []
+    seen: Set[str] = set()
+    for item in fresh:
+        if item.text in seen:
+            stats.merged += 1
+            continue
+        seen.add(item.text)
+        previous = result[-1] if result else None
+        author = _author_key(item)
+        if (previous is not None and author and _author_key(previous) == author
+                and previous.speaker_id == item.speaker_id
+                and len(previous.text) + 1 + len(item.text) <= merge_max_chars):
+            result[-1] = previous._replace(text=f"{previous.text}、{item.text}")
+            stats.merged += 1
+            continue
+        result.append(item)
+
+    if summary_priority is not None:
+        # items はレーン順に並んでいるので、同じかより低いレーンの最初の項目の前に入れる
+        index = next((i for i, item in enumerate(result) if item.priority >= summary_priority), len(result))
+        result.insert(index, QueueItem(f"ほか{stats.dropped}件", summary_speaker_id, "", 0.0,
+                                       priority=summary_priority))
+    return result, stats
@@ -75,6 +75,8 @@ async def get_server_count():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 辞書の変更は DB のトリガー（LISTEN/NOTIFY）で DictionaryCog に届くので、以下の /notify は
+# 反映を少し早めるだけ（呼ばれなくても整合性は保たれる）。既存のWeb側からの呼び出しのために残している
 @app.post("/user-dictionary/notify")
 async def notify_user_dictionary(request: Request):
     print("[Notify] Received user dictionary change notification")
@@ -85,17 +87,9 @@ async def notify_user_dictionary(request: Request):
     if _bot is not None and user_id is not None:
         cog = _bot.get_cog("DictionaryCog")
         if cog is not None:
-            # cache_lockを使ってpop
             try:
-                async def clear_cache():
-                    async with cog.cache_lock:
-                        cog.user_dict_cache.pop(int(user_id), None)
-                # 別スレッドから呼ばれる可能性があるのでloopで実行
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    asyncio.run_coroutine_threadsafe(clear_cache(), loop)
-                else:
-                    loop.run_until_complete(clear_cache())
+                # キャッシュはbotのイベントループ上でだけ触るので、botのループで実行する
+                _bot.loop.call_soon_threadsafe(cog.user_dicts.invalidate, int(user_id))
             except Exception as e:
                 print(f"[Notify] cache clear error: {e}")
     return {"ok": True}
@@ -113,14 +107,7 @@ async def notify_guild_dictionary(request: Request):
         cog = _bot.get_cog("DictionaryCog")
         if cog is not None:
             try:
-                async def clear_cache():
-                    async with cog.cache_lock:
-                        cog.server_dict_cache.pop(int(guild_id), None)
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    asyncio.run_coroutine_threadsafe(clear_cache(), loop)
-                else:
-                    loop.run_until_complete(clear_cache())
+                _bot.loop.call_soon_threadsafe(cog.server_dicts.invalidate, int(guild_id))
             except Exception as e:
                 print(f"[Notify] guild cache clear error: {e}")
     return {"ok": True}
@@ -163,7 +150,11 @@ async def get_voice_sample(speaker_id: int):
         print(f"[VoiceSample] Generating new sample for speaker_id={speaker_id}")
         
         # synthesize_bytesを使用してバイトデータを取得
-        _, wav_bytes = await cog.voicelib.synthesize_bytes(sample_text, speaker_id)
+        # VOICEVOXLibの共有セッションはbotのイベントループに紐づくため、botのループ上で実行する
+        future = asyncio.run_coroutine_threadsafe(
+            cog.voicelib.synthesize_bytes(sample_text, speaker_id), _bot.loop
+        )
+        _, wav_bytes = await asyncio.wrap_future(future)
         
         # キャッシュに保存
         _voice_sample_cache[speaker_id] = wav_bytes
@@ -190,28 +181,50 @@ async def get_voice_sample(speaker_id: int):
 async def notify_user_voice(request: Request):
     """ユーザーのボイス設定が変更されたときに呼ばれる
     
-    ユーザー辞書のキャッシュをクリアする（ボイス設定変更時に辞書も再読み込み）
+    話者の設定キャッシュと、ユーザー辞書のキャッシュをクリアする（ボイス設定変更時に辞書も再読み込み）
     """
     print("[Notify] Received user voice change notification")
     data = await request.json()
     user_id = data.get("user_id")
     print(f"[Notify] user_voice changed for user_id={user_id}")
-    
+
+    if _bot is not None and user_id is not None:
+        voice_cog = _bot.get_cog("VoiceReadCog")
+        if voice_cog is not None:
+            _bot.loop.call_soon_threadsafe(voice_cog.settings.invalidate_speaker, int(user_id))
+
     # ユーザー辞書キャッシュをクリア（ボイス変更時に辞書も再適用させる）
     if _bot is not None and user_id is not None:
         cog = _bot.get_cog("DictionaryCog")
         if cog is not None:
             try:
-                async def clear_cache():
-                    async with cog.cache_lock:
-                        cog.user_dict_cache.pop(int(user_id), None)
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    asyncio.run_coroutine_threadsafe(clear_cache(), loop)
-                else:
-                    loop.run_until_complete(clear_cache())
+                _bot.loop.call_soon_threadsafe(cog.user_dicts.invalidate, int(user_id))
                 print(f"[Notify] Cleared user dictionary cache for user_id={user_id}")
             except Exception as e:
                 print(f"[Notify] user voice cache clear error: {e}")
     
     return {"ok": True}
+
+
+# サーバーの読み上げスピード変更通知
+@app.post("/server-speed/notify")
+async def notify_server_speed(request: Request):
+    data = await request.json()
+    guild_id = data.get("guild_id")
+    print(f"[Notify] server_voice_speed changed for guild_id={guild_id}")
+    if _bot is not None and guild_id is not None:
+        voice_cog = _bot.get_cog("VoiceReadCog")
+        if voice_cog is not None:
+            _bot.loop.call_soon_threadsafe(voice_cog.settings.invalidate_speed, int(guild_id))
+    return {"ok": True}
+
+
+# アナウンス変更通知
+@app.post("/announce/notify")
+async def notify_announce():
+    print("[Notify] announce changed")
+    if _bot is not None:
+        voice_cog = _bot.get_cog("VoiceReadCog")
+        if voice_cog is not None:
+            _bot.loop.call_soon_threadsafe(voice_cog.settings.invalidate_announce)
+    return {"ok": True}
@@ -0,0 +1,120 @@
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+
+def dictionary_version(entries: Iterable[Tuple[str, str]]) -> FrozenSet[Tuple[str, str]]:
+    """辞書の内容そのものを比較用のバージョンにする（内容が同じなら行の並び順によらず等しい）
+
+    ハッシュ値だけを比べると衝突したときに作り直しを取りこぼすので、エントリの集合を持つ
+    （文字列はエントリと共有するので、増えるのは集合の分だけ）。
+    """
+    return frozenset(entries)
+
+
+def rows_to_entries(rows) -> List[Tuple[str, str]]:
+    """DBの辞書行（key, value を持つレコード）を (key, value) のリストにする"""
+    return [(row['key'], row['value']) for row in rows]
+
+
+class DictionaryMatcher:
+    """辞書の全キーを1つの Aho-Corasick オートマトンにまとめ、1回の走査で置換する
+
+    置換は leftmost-longest（左から見て最初に始まるキーのうち最長のものを採用し、
+    置換した範囲の後ろから続きを探す）。置換後の文字列に対しては再度マッチさせない。
+    エントリ数によらず1メッセージあたりの処理量はほぼテキスト長に比例する。
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]) -> None:
+        entries = list(entries)
+        self.version = dictionary_version(entries)
+        self.size = 0
+        # ノードごとの遷移・失敗リンク・そのノードで終わるキーの長さと置換後の文字列
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._length: List[int] = [0]
+        self._value: List[Optional[str]] = [None]
+        # 失敗リンクをたどって最初に出会う「キーが終わるノード」（なければ0）
+        self._output: List[int] = [0]
+        for key, value in entries:
+            if key:
+                self._insert(key, value)
+        self._build_links()
+
+    @classmethod
+    def from_rows(cls, rows) -> "DictionaryMatcher":
+        return cls(rows_to_entries(rows))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _insert(self, key: str, value: str) -> None:
+        node = 0
+        for ch in key:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._length.append(0)
+                self._value.append(None)
+                self._output.append(0)
+            node = next_node
+        if not self._length[node]:
+            self.size += 1
+        # 同じキーが複数あれば後のものを採用する
+        self._length[node] = len(key)
+        self._value[node] = value
+
+    def _build_links(self) -> None:
+        goto, fail, length, output = self._goto, self._fail, self._length, self._output
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                target = goto[state].get(ch, 0)
+                fail[child] = target if target != child else 0
+                output[child] = fail[child] if length[fail[child]] else output[fail[child]]
+
+    def replace(self, text: str) -> str:
+        if not self.size or not text:
+            return text
+        goto, fail, length, output = self._goto, self._fail, self._length, self._output
+        # 開始位置ごとの最長マッチのノード。同じ開始位置なら後から見つかるほど長い
+        longest: Dict[int, int] = {}
+        node = 0
+        for end, ch in enumerate(text, 1):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            match = node if length[node] else output[node]
+            while match:
+                longest[end - length[match]] = match
+                match = output[match]
+        if not longest:
+            return text
+
+        pieces = []
+        position = 0
+        for start in sorted(longest):
+            if start < position:
+                continue
+            match = longest[start]
+            pieces.append(text[position:start])
+            pieces.append(self._value[match])
+            position = start + length[match]
+        pieces.append(text[position:])
+        return "".join(pieces)
+
+
+EMPTY_MATCHER = DictionaryMatcher(())
+
+
+class CompiledDictionary(NamedTuple):
+    """DBから読んだ辞書の行と、それをコンパイルしたマッチャー"""
+    rows: list
+    matcher: DictionaryMatcher
@@ -0,0 +1,399 @@
+import asyncio
+import logging
+import random
+import statistics
+import time
+from typing import Callable, Awaitable, Dict, List, Optional
+
+import aiohttp
+from prometheus_client import Counter, Gauge
+
+# サーキット状態（メトリクスでは 0=closed, 1=half_open, 2=open）
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# 振り分け方式
+ROUTING_RANDOM = "random"
+ROUTING_LEAST_OUTSTANDING = "least_outstanding"
+
+ENGINE_CIRCUIT_STATE = Gauge(
+    'voicevox_engine_circuit_state',
+    'VOICEVOXエンジンのサーキット状態（0=closed, 1=half_open, 2=open）',
+    ['engine', 'role']
+)
+ENGINE_EJECTED = Gauge(
+    'voicevox_engine_ejected',
+    '遅延外れ値として一時的に除外されているか（1=除外中）',
+    ['engine', 'role']
+)
+ENGINE_REQUESTS = Counter(
+    'voicevox_engine_requests_total',
+    'VOICEVOXエンジンへの合成リクエスト数',
+    ['engine', 'role', 'result']
+)
+ENGINE_INFLIGHT = Gauge(
+    'voicevox_engine_inflight_requests',
+    'VOICEVOXエンジンごとの処理中リクエスト数',
+    ['engine', 'role']
+)
+ENGINE_ROUTING_WEIGHT = Gauge(
+    'voicevox_engine_routing_weight',
+    '予想完了時間から求めたエンジンごとの振り分け重み（合計1）',
+    ['engine', 'role']
+)
+ENGINE_FAILOVERS = Counter(
+    'voicevox_engine_failovers_total',
+    '正常な通常サーバーがなくバックアップサーバーへ振り分けた回数'
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EngineBusyError(Exception):
+    """half_open のエンジンで試行リクエストが既に進行中（失敗ではないので次の候補へ進む）"""
+
+
+class EngineState:
+    """1台のVOICEVOXエンジンの健全性"""
+
+    def __init__(self, url: str, role: str) -> None:
+        self.url = url
+        self.role = role  # "primary" or "backup"
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_in_flight = False
+        self.ejected_until = 0.0
+        # 音声1秒あたりの処理秒数（リアルタイム係数）のEWMA
+        self.ewma_rtf: Optional[float] = None
+        self.inflight = 0
+        self.last_error: Optional[str] = None
+        self.last_probe_ok: Optional[bool] = None
+
+    def is_ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+
+class EnginePool:
+    """VOICEVOXエンジン群の健全性を管理し、リクエストの振り分け先を決める
+
+    - /version へのバックグラウンドヘルスチェック
+    - エンジンごとのサーキットブレーカー（連続失敗で open、一定時間後に half_open で1リクエストだけ試行）
+    - リアルタイム係数が他エンジンより極端に遅いエンジンの一時除外
+    - 正常な通常サーバーがない場合のみバックアップサーバーへフェイルオーバー
+    - routing="least_outstanding" では処理中リクエスト数とリアルタイム係数から
+      予想完了時間が最も短いエンジンを優先する（既定は "random"）
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        open_seconds: float = 30.0,
+        probe_interval: float = 5.0,
+        probe_timeout: float = 3.0,
+        outlier_factor: float = 3.0,
+        eject_seconds: float = 30.0,
+        ewma_alpha: float = 0.2,
+        routing: str = ROUTING_RANDOM,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.outlier_factor = outlier_factor
+        self.eject_seconds = eject_seconds
+        self.ewma_alpha = ewma_alpha
+        self.routing = ROUTING_RANDOM
+        self.set_routing(routing)
+        self.engines: Dict[str, EngineState] = {}
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def set_routing(self, routing: str) -> None:
+        if routing not in (ROUTING_RANDOM, ROUTING_LEAST_OUTSTANDING):
+            logger.warning(f"Unknown VOICEVOX routing mode {routing!r}, falling back to {ROUTING_RANDOM}")
+            routing = ROUTING_RANDOM
+        self.routing = routing
+
+    def update_urls(self, primary_urls: List[str], backup_urls: List[str]) -> None:
+        """URLリストを反映する（既存エンジンの状態は引き継ぐ）"""
+        wanted = {url: "primary" for url in primary_urls}
+        for url in backup_urls:
+            wanted.setdefault(url, "backup")
+        for url in list(self.engines):
+            if url not in wanted:
+                engine = self.engines.pop(url)
+                self._remove_labels(engine)
+        for url, role in wanted.items():
+            engine = self.engines.get(url)
+            if engine is None:
+                self.engines[url] = EngineState(url, role)
+            elif engine.role != role:
+                self._remove_labels(engine)
+                engine.role = role
+            self._export(self.engines[url])
+
+    def _remove_labels(self, engine: EngineState) -> None:
+        for metric in (ENGINE_CIRCUIT_STATE, ENGINE_EJECTED, ENGINE_INFLIGHT, ENGINE_ROUTING_WEIGHT):
+            try:
+                metric.remove(engine.url, engine.role)
+            except KeyError:
+                pass
+
+    def _engines(self, role: str) -> List[EngineState]:
+        return [e for e in self.engines.values() if e.role == role]
+
+    def _available(self, engine: EngineState, now: float) -> bool:
+        """このエンジンに今リクエストを送ってよいか"""
+        if engine.state == OPEN:
+            if now - engine.opened_at < self.open_seconds:
+                return False
+            # クールダウン経過後は half_open で試行を1件だけ許可
+            engine.state = HALF_OPEN
+            engine.half_open_in_flight = False
+            self._export(engine)
+        if engine.state == HALF_OPEN:
+            return not engine.half_open_in_flight
+        return not engine.is_ejected(now)
+
+    def expected_cost(self, engine: EngineState, default_rtf: float) -> float:
+        """新しいリクエストを投げた場合の相対的な完了時間の見積もり"""
+        rtf = engine.ewma_rtf if engine.ewma_rtf is not None else default_rtf
+        return (engine.inflight + 1) * rtf
+
+    def _default_rtf(self, engines: List[EngineState]) -> float:
+        # 実績のないエンジンは最速のエンジンと同等とみなし、まず試してもらう
+        known = [e.ewma_rtf for e in engines if e.ewma_rtf is not None]
+        return min(known) if known else 1.0
+
+    def _order(self, engines: List[EngineState]) -> List[EngineState]:
+        ordered = list(engines)
+        random.shuffle(ordered)
+        if self.routing == ROUTING_LEAST_OUTSTANDING:
+            # シャッフル後の安定ソートで、同点のエンジン間では負荷が偏らないようにする
+            default_rtf = self._default_rtf(ordered)
+            ordered.sort(key=lambda e: self.expected_cost(e, default_rtf))
+        return ordered
+
+    def candidates(self) -> List[str]:
+        """試行順に並べたエンジンURLを返す"""
+        now = time.monotonic()
+        primaries = [e for e in self._engines("primary") if self._available(e, now)]
+        if primaries:
+            return [e.url for e in self._order(primaries)]
+        backups = [e for e in self._engines("backup") if self._available(e, now)]
+        if backups:
+            ENGINE_FAILOVERS.inc()
+            return [e.url for e in self._order(backups)]
+        # 全滅時は最後の手段として、最も早くopenになった通常サーバーから順に試す
+        fallback = sorted(self._engines("primary"), key=lambda e: e.opened_at)
+        return [e.url for e in fallback]
+
+    def choose(self) -> str:
+        """単発リクエスト（/speakers など）用に1台選ぶ
+
+        half_open の試行枠は合成リクエストに残すため、closed のエンジンがあればそちらを選ぶ。
+        """
+        urls = self.candidates()
+        if not urls:
+            raise RuntimeError("No VOICEVOX engines configured")
+        closed = [url for url in urls if self.engines[url].state == CLOSED]
+        return (closed or urls)[0]
+
+    def is_backup(self, url: str) -> bool:
+        engine = self.engines.get(url)
+        return engine is not None and engine.role == "backup"
+
+    def begin(self, url: str) -> None:
+        """リクエスト送信直前に呼ぶ（完了時に必ず end() を呼ぶこと）
+
+        half_open のエンジンには試行リクエストを1件だけ通す。candidates() で候補を
+        受け取った後に別のリクエストが試行を始めていた場合は EngineBusyError を送出する
+        （この場合 end() は呼ばない）。
+        """
+        engine = self.engines.get(url)
+        if engine is None:
+            return
+        if engine.state == HALF_OPEN:
+            if engine.half_open_in_flight:
+                raise EngineBusyError(f"VOICEVOX engine {url} is already running its half-open trial")
+            engine.half_open_in_flight = True
+        engine.inflight += 1
+        self._export(engine)
+
+    def end(self, url: str) -> None:
+        """リクエスト完了時（成功・失敗を問わず）に呼ぶ"""
+        engine = self.engines.get(url)
+        if engine is None:
+            return
+        engine.inflight = max(0, engine.inflight - 1)
+        self._export(engine)
+
+    def release(self, url: str) -> None:
+        """エンジンは応答したが合成結果を使わなかった場合（4xxなど）に呼ぶ"""
+        engine = self.engines.get(url)
+        if engine is None:
+            return
+        engine.consecutive_failures = 0
+        if engine.state == HALF_OPEN:
+            engine.state = CLOSED
+        engine.half_open_in_flight = False
+        self._export(engine)
+
+    def record_success(self, url: str, elapsed: float, audio_seconds: float) -> None:
+        engine = self.engines.get(url)
+        if engine is None:
+            return
+        ENGINE_REQUESTS.labels(engine=url, role=engine.role, result="success").inc()
+        engine.consecutive_failures = 0
+        engine.last_error = None
+        if engine.state != CLOSED:
+            logger.info(f"VOICEVOX engine {url} recovered ({engine.state} -> closed)")
+        engine.state = CLOSED
+        engine.half_open_in_flight = False
+        if audio_seconds > 0:
+            rtf = elapsed / audio_seconds
+            if engine.ewma_rtf is None:
+                engine.ewma_rtf = rtf
+            else:
+                engine.ewma_rtf += self.ewma_alpha * (rtf - engine.ewma_rtf)
+            self._check_outlier(engine)
+        self._export(engine)
+
+    def record_failure(self, url: str, error: Exception) -> None:
+        engine = self.engines.get(url)
+        if engine is None:
+            return
+        ENGINE_REQUESTS.labels(engine=url, role=engine.role, result="failure").inc()
+        self._mark_failure(engine, error)
+
+    def _mark_failure(self, engine: EngineState, error: Exception) -> None:
+        engine.consecutive_failures += 1
+        engine.last_error = str(error) or type(error).__name__
+        engine.half_open_in_flight = False
+        if engine.state == HALF_OPEN or engine.consecutive_failures >= self.failure_threshold:
+            if engine.state != OPEN:
+                logger.warning(f"VOICEVOX engine {engine.url} circuit opened: {engine.last_error}")
+            engine.state = OPEN
+            engine.opened_at = time.monotonic()
+        self._export(engine)
+
+    def _check_outlier(self, engine: EngineState) -> None:
+        """他の通常サーバーの中央値より outlier_factor 倍以上遅いエンジンを一時除外する"""
+        if engine.role != "primary" or self.routing == ROUTING_LEAST_OUTSTANDING:
+            # least_outstanding では遅いエンジンは重みが下がるだけで除外はしない
+            # （性能の異なるホストが混在する構成を想定しているため）
+            return
+        now = time.monotonic()
+        others = [
+            e.ewma_rtf for e in self._engines("primary")
+            if e is not engine and e.state == CLOSED and e.ewma_rtf is not None and not e.is_ejected(now)
+        ]
+        if not others:
+            # 除外すると通常サーバーがなくなる場合は除外しない
+            return
+        median = statistics.median(others)
+        if median > 0 and engine.ewma_rtf > median * self.outlier_factor:
+            if not engine.is_ejected(now):
+                logger.warning(
+                    f"VOICEVOX engine {engine.url} ejected as slow outlier "
+                    f"(rtf={engine.ewma_rtf:.2f}, median={median:.2f})"
+                )
+            engine.ejected_until = now + self.eject_seconds
+            # 除外中に古い値で再び除外され続けないよう中央値まで戻しておく
+            engine.ewma_rtf = median
+
+    def _export(self, engine: EngineState) -> None:
+        ENGINE_CIRCUIT_STATE.labels(engine=engine.url, role=engine.role).set(_STATE_VALUES[engine.state])
+        ENGINE_EJECTED.labels(engine=engine.url, role=engine.role).set(1 if engine.is_ejected(time.monotonic()) else 0)
+        ENGINE_INFLIGHT.labels(engine=engine.url, role=engine.role).set(engine.inflight)
+
+    def routing_weights(self) -> Dict[str, float]:
+        """予想完了時間の逆数を正規化した重み（振り分け可能なエンジンのみ）"""
+        now = time.monotonic()
+        weights: Dict[str, float] = {}
+        for role in ("primary", "backup"):
+            engines = [
+                e for e in self._engines(role)
+                if e.state == CLOSED and not e.is_ejected(now)
+            ]
+            default_rtf = self._default_rtf(engines)
+            inverse = {e.url: 1.0 / max(self.expected_cost(e, default_rtf), 1e-6) for e in engines}
+            total = sum(inverse.values())
+            for url, value in inverse.items():
+                weights[url] = value / total if total else 0.0
+        return weights
+
+    def export_weights(self) -> None:
+        weights = self.routing_weights()
+        for engine in self.engines.values():
+            ENGINE_ROUTING_WEIGHT.labels(engine=engine.url, role=engine.role).set(weights.get(engine.url, 0.0))
+
+    def snapshot(self) -> List[dict]:
+        """管理コマンド表示用の状態一覧"""
+        now = time.monotonic()
+        weights = self.routing_weights()
+        rows = []
+        for engine in self.engines.values():
+            rows.append({
+                "url": engine.url,
+                "role": engine.role,
+                "state": engine.state,
+                "ejected": engine.is_ejected(now),
+                "consecutive_failures": engine.consecutive_failures,
+                "ewma_rtf": engine.ewma_rtf,
+                "inflight": engine.inflight,
+                "weight": weights.get(engine.url, 0.0),
+                "last_probe_ok": engine.last_probe_ok,
+                "last_error": engine.last_error,
+            })
+        return rows
+
+    def start(self, get_session: Callable[[], Awaitable[aiohttp.ClientSession]]) -> None:
+        """バックグラウンドのヘルスチェックを開始する"""
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe_loop(get_session))
+
+    async def stop(self) -> None:
+        if self._probe_task:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    async def _probe_loop(self, get_session) -> None:
+        while True:
+            try:
+                session = await get_session()
+                await asyncio.gather(
+                    *(self._probe(session, engine) for engine in list(self.engines.values()))
+                )
+                for engine in self.engines.values():
+                    self._export(engine)
+                self.export_weights()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in VOICEVOX engine probe loop: {e}")
+            await asyncio.sleep(self.probe_interval)
+
+    async def _probe(self, session: aiohttp.ClientSession, engine: EngineState) -> None:
+        try:
+            async with session.get(
+                f"{engine.url}/version",
+                timeout=aiohttp.ClientTimeout(total=self.probe_timeout)
+            ) as response:
+                response.raise_for_status()
+                await response.read()
+        except Exception as e:
+            engine.last_probe_ok = False
+            self._mark_failure(engine, e)
+            return
+        engine.last_probe_ok = True
+        if engine.state == OPEN and time.monotonic() - engine.opened_at >= self.open_seconds:
+            # クールダウン経過かつ疎通OKなら half_open にして実リクエストで復帰判定する
+            engine.state = HALF_OPEN
+            engine.half_open_in_flight = False
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import discord
+from prometheus_client import Counter, Gauge
+
+from lib.pcm_audio import FRAME_SIZE, PCMBufferSource
+
+OPUS_CACHE_HITS = Counter(
+    'voicevox_opus_cache_hits_total',
+    'エンコード済みOpusフレームをそのまま再生した回数'
+)
+OPUS_CACHE_FILLS = Counter(
+    'voicevox_opus_cache_fills_total',
+    '再生しながらOpusフレームをキャッシュに格納した回数'
+)
+OPUS_CACHE_EVICTIONS = Counter(
+    'voicevox_opus_cache_evictions_total',
+    'Opusフレームキャッシュから追い出したエントリ数'
+)
+OPUS_CACHE_BYTES = Gauge(
+    'voicevox_opus_cache_bytes',
+    'Opusフレームキャッシュの使用バイト数'
+)
+OPUS_CACHE_ENTRIES = Gauge(
+    'voicevox_opus_cache_entries',
+    'Opusフレームキャッシュのエントリ数'
+)
+
+logger = logging.getLogger(__name__)
+
+
+class OpusFrameSource(discord.AudioSource):
+    """エンコード済みの20ms Opusフレームを順に返すAudioSource（再生時のエンコードなし）"""
+
+    def __init__(self, frames: List[bytes]) -> None:
+        self._frames = frames
+        self._index = 0
+
+    def read(self) -> bytes:
+        if self._index >= len(self._frames):
+            return b""
+        frame = self._frames[self._index]
+        self._index += 1
+        return frame
+
+    def is_opus(self) -> bool:
+        return True
+
+
+class OpusRecordingSource(discord.AudioSource):
+    """PCMを自前でOpusにエンコードしながら再生し、最後まで再生できたらフレームを渡す
+
+    discord.py がプレイヤースレッドで行うエンコードをこちらで肩代わりするだけなので、
+    初回の再生コストは通常の PCM 再生と変わらない。途中で停止された場合は格納しない。
+    """
+
+    def __init__(self, pcm, on_complete: Callable[[List[bytes]], None]) -> None:
+        # discord.py が PCM ソースに使う既定の設定と同じエンコーダ
+        self._encoder = discord.opus.Encoder()
+        self._pcm = memoryview(pcm).cast("B")
+        self._offset = 0
+        self._frames: List[bytes] = []
+        self._on_complete = on_complete
+
+    def read(self) -> bytes:
+        chunk = self._pcm[self._offset:self._offset + FRAME_SIZE]
+        self._offset += FRAME_SIZE
+        if not chunk:
+            if self._on_complete is not None:
+                on_complete, self._on_complete = self._on_complete, None
+                on_complete(self._frames)
+            return b""
+        if len(chunk) < FRAME_SIZE:
+            chunk = bytes(chunk) + b"\x00" * (FRAME_SIZE - len(chunk))
+        frame = self._encoder.encode(bytes(chunk), self._encoder.SAMPLES_PER_FRAME)
+        self._frames.append(frame)
+        return frame
+
+    def is_opus(self) -> bool:
+        return True
+
+
+class OpusFrameCache:
+    """よく再生される音声のエンコード済みOpusフレームを保持するバイト数上限付きLRU
+
+    キーはPCMの内容のハッシュなので、音声キャッシュ・定型文バンク・合成直後の
+    どこから来た音声でも同じ内容なら同じエントリになる。同じ音声が2回目に
+    再生されるとき（またはhot=Trueの定型文は初回から）エンコードしながら格納し、
+    以降の再生はエンコードなしでフレームを流すだけになる。
+    """
+
+    def __init__(self, memory_limit_bytes: int, seen_entries: int = 4096) -> None:
+        self.memory_limit_bytes = max(0, memory_limit_bytes)
+        self.seen_entries = seen_entries
+        self._lock = threading.Lock()
+        self._frames: "OrderedDict[bytes, List[bytes]]" = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        # 1回だけ再生された音声のキー（2回目でキャッシュ対象にする）
+        self._seen: "OrderedDict[bytes, None]" = OrderedDict()
+
+    @staticmethod
+    def make_key(pcm) -> bytes:
+        return hashlib.blake2b(pcm, digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[List[bytes]]:
+        with self._lock:
+            frames = self._frames.get(key)
+            if frames is not None:
+                self._frames.move_to_end(key)
+        return frames
+
+    def _mark_seen(self, key: bytes) -> bool:
+        """以前にも再生されていれば True を返す"""
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = None
+            while len(self._seen) > self.seen_entries:
+                self._seen.popitem(last=False)
+            return False
+
+    def put(self, key: bytes, frames: List[bytes]) -> None:
+        size = sum(len(frame) for frame in frames)
+        # 1エントリで予算の1/8を超えるような長い音声は載せない
+        if not frames or size > self.memory_limit_bytes // 8:
+            return
+        evicted = 0
+        with self._lock:
+            if key in self._frames:
+                return
+            self._frames[key] = frames
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.memory_limit_bytes and self._frames:
+                old_key, _ = self._frames.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                evicted += 1
+            entries, total = len(self._frames), self._bytes
+        OPUS_CACHE_FILLS.inc()
+        if evicted:
+            OPUS_CACHE_EVICTIONS.inc(evicted)
+        OPUS_CACHE_BYTES.set(total)
+        OPUS_CACHE_ENTRIES.set(entries)
+
+    def source_for(self, pcm, hot: bool = False) -> discord.AudioSource:
+        """discord用PCMに対応するAudioSourceを返す
+
+        キャッシュにあればOpusフレームをそのまま流す。2回目以降の再生（または hot=True）なら
+        エンコードしながら格納する。それ以外や opus が使えない環境では通常のPCM再生にする。
+        """
+        if self.memory_limit_bytes <= 0:
+            return PCMBufferSource(pcm)
+        key = self.make_key(pcm)
+        frames = self.get(key)
+        if frames is not None:
+            OPUS_CACHE_HITS.inc()
+            return OpusFrameSource(frames)
+        if self._mark_seen(key) or hot:
+            try:
+                return OpusRecordingSource(pcm, lambda recorded: self.put(key, recorded))
+            except Exception as e:
+                # libopus が読み込めない環境ではPCMのまま再生する
+                logger.debug(f"Opus encoder unavailable, playing PCM: {e}")
+        return PCMBufferSource(pcm)
@@ -0,0 +1,143 @@
+import struct
+from typing import Optional, Tuple
+
+import discord
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from lib.audio_stream import ChunkedPCMStream
+
+# discord.py が要求するPCM形式（48kHz・16bit・ステレオ、20msごとに3840バイト）
+DISCORD_SAMPLING_RATE = discord.opus.Encoder.SAMPLING_RATE
+DISCORD_CHANNELS = discord.opus.Encoder.CHANNELS
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+SILENCE_FRAME = b"\x00" * FRAME_SIZE
+
+# ストリーミング再生で次のチャンクが間に合わないとき、無音を返す前に待つ秒数
+# （長く待つとプレイヤーが遅れを取り戻そうとして後続のフレームを詰めて送ってしまう）
+UNDERRUN_WAIT_SECONDS = 0.005
+
+
+class WavFormat:
+    __slots__ = ("audio_format", "channels", "sampling_rate", "bits_per_sample")
+
+    def __init__(self, audio_format: int, channels: int, sampling_rate: int, bits_per_sample: int) -> None:
+        self.audio_format = audio_format
+        self.channels = channels
+        self.sampling_rate = sampling_rate
+        self.bits_per_sample = bits_per_sample
+
+    @property
+    def is_discord_native(self) -> bool:
+        return (
+            self.audio_format == 1
+            and self.channels == DISCORD_CHANNELS
+            and self.sampling_rate == DISCORD_SAMPLING_RATE
+            and self.bits_per_sample == 16
+        )
+
+
+def parse_wav(wav_bytes: bytes) -> Tuple[WavFormat, memoryview]:
+    """RIFFヘッダを読み、fmt情報とdataチャンクのmemoryview（コピーなし）を返す"""
+    view = memoryview(wav_bytes)
+    if len(view) < 12 or view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise ValueError("not a RIFF/WAVE file")
+    offset = 12
+    fmt: Optional[WavFormat] = None
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        (chunk_size,) = struct.unpack_from("<I", view, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sampling_rate = struct.unpack_from("<HHI", view, body)
+            (bits_per_sample,) = struct.unpack_from("<H", view, body + 14)
+            fmt = WavFormat(audio_format, channels, sampling_rate, bits_per_sample)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("data chunk before fmt chunk")
+            # ストリーミング出力などでサイズが不正な場合は末尾までをデータとみなす
+            end = min(body + chunk_size, len(view))
+            return fmt, view[body:end]
+        # チャンクは2バイト境界に揃えられる
+        offset = body + chunk_size + (chunk_size & 1)
+    raise ValueError("data chunk not found")
+
+
+def to_discord_pcm(wav_bytes: bytes):
+    """WAVをdiscord用PCM（48kHz・16bit・ステレオ）に変換する
+
+    既に48kHzステレオならdataチャンクのmemoryviewをそのまま返す（コピーなし）。
+    それ以外はNumPyで線形補間リサンプリングする。NumPyがない場合や16bit PCM以外は
+    ValueError を送出するので、呼び出し側でFFmpegにフォールバックすること。
+    """
+    fmt, data = parse_wav(wav_bytes)
+    if fmt.is_discord_native:
+        return data[:len(data) - len(data) % 4]
+    if fmt.audio_format != 1 or fmt.bits_per_sample != 16 or fmt.channels not in (1, 2):
+        raise ValueError(f"unsupported WAV format: {fmt.audio_format}/{fmt.bits_per_sample}bit/{fmt.channels}ch")
+    if np is None:
+        raise ValueError("numpy is required to resample non-48kHz audio")
+    frame_bytes = 2 * fmt.channels
+    samples = np.frombuffer(data[:len(data) - len(data) % frame_bytes], dtype="<i2").reshape(-1, fmt.channels)
+    if fmt.sampling_rate != DISCORD_SAMPLING_RATE and len(samples) > 1:
+        n_out = int(round(len(samples) * DISCORD_SAMPLING_RATE / fmt.sampling_rate))
+        positions = np.linspace(0, len(samples) - 1, n_out)
+        source_index = np.arange(len(samples))
+        samples = np.stack(
+            [np.interp(positions, source_index, samples[:, c]) for c in range(fmt.channels)],
+            axis=1,
+        )
+    if fmt.channels == 1:
+        samples = np.repeat(samples, 2, axis=1)
+    return np.ascontiguousarray(np.clip(np.rint(samples), -32768, 32767).astype("<i2")).tobytes()
+
+
+class PCMBufferSource(discord.AudioSource):
+    """メモリ上のPCMを20msずつ返すAudioSource（ディスク・サブプロセスなし）"""
+
+    def __init__(self, pcm) -> None:
+        self._pcm = memoryview(pcm).cast("B")
+        self._offset = 0
+
+    def read(self) -> bytes:
+        chunk = self._pcm[self._offset:self._offset + FRAME_SIZE]
+        self._offset += FRAME_SIZE
+        if not chunk:
+            return b""
+        if len(chunk) < FRAME_SIZE:
+            # 最後のフレームは無音で埋める
+            return bytes(chunk) + b"\x00" * (FRAME_SIZE - len(chunk))
+        return bytes(chunk)
+
+    def is_opus(self) -> bool:
+        return False
+
+
+class StreamingPCMSource(discord.AudioSource):
+    """ChunkedPCMStream に順次投入されるPCMを再生するAudioSource
+
+    次のチャンクがまだ合成中の場合は無音のフレームを返し、プレイヤーの送出間隔を保つ。
+    空を返す（再生を終える）のはストリームが閉じられて読み切ったときだけ。
+    """
+
+    def __init__(self, stream: ChunkedPCMStream) -> None:
+        self._stream = stream
+
+    def read(self) -> bytes:
+        chunk = self._stream.read_exact(FRAME_SIZE, timeout=UNDERRUN_WAIT_SECONDS)
+        if chunk is None:
+            return SILENCE_FRAME
+        if not chunk:
+            return b""
+        if len(chunk) < FRAME_SIZE:
+            return chunk + b"\x00" * (FRAME_SIZE - len(chunk))
+        return chunk
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self._stream.abort()
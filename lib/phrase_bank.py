@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from prometheus_client import Counter
+
+from lib.pcm_audio import to_discord_pcm
+
+# 定型文バンクの参照結果（source: memory / disk / engine）
+PHRASE_BANK_REQUESTS = Counter(
+    'voicevox_phrase_bank_requests_total',
+    '定型文バンクの参照数',
+    ['source']
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PhraseBank:
+    """「接続しました。」などの定型文を話者ごとに事前合成して保持するストア
+
+    音声は VOICEVOXLib.cache_key()（テキスト・話者・速度・エンジンバージョン・出力形式）を
+    キーに bank_dir へ保存し、再起動後も再利用する。AudioCache と違い追い出しは
+    行わないので、定型文はLRUに押し出されずエンジンへ届かない。
+    メモリ上には直近 memory_entries 件だけを保持する。
+    """
+
+    def __init__(self, voicelib, bank_dir: Optional[str], memory_entries: int = 256) -> None:
+        self.voicelib = voicelib
+        self.bank_dir = bank_dir
+        self.memory_entries = max(0, memory_entries)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._on_disk = set()
+        # 同じ定型文を同時に合成しないよう、合成中のタスクをキーごとに共有する
+        self._inflight = {}
+        if self.bank_dir:
+            try:
+                os.makedirs(self.bank_dir, exist_ok=True)
+                self._on_disk = {name[:-4] for name in os.listdir(self.bank_dir) if name.endswith(".wav")}
+            except OSError as e:
+                logger.error(f"Failed to prepare phrase bank dir {self.bank_dir}: {e}")
+                self.bank_dir = None
+
+    @staticmethod
+    def _normalize_speed(speed: Optional[float]) -> float:
+        # speedScale の既定値は1.0なので、未指定と1.0を同じ音声として扱う
+        return 1.0 if speed is None else float(speed)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.bank_dir, f"{key}.wav")
+
+    def _remember(self, key: str, wav_bytes: bytes) -> None:
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = wav_bytes
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.bank_dir or key not in self._on_disk:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            self._on_disk.discard(key)
+            return None
+
+    def _write_disk(self, key: str, wav_bytes: bytes) -> None:
+        if not self.bank_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(wav_bytes)
+            os.replace(tmp_path, path)
+            self._on_disk.add(key)
+        except OSError as e:
+            logger.error(f"Failed to write phrase bank file {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    async def get(self, phrase: str, speaker_id: int, speed: Optional[float] = None) -> bytes:
+        """定型文のWAVを返す。バンクになければ合成して保存する"""
+        speed = self._normalize_speed(speed)
+        key = await self.voicelib.cache_key(phrase, speaker_id, speed)
+        if key is None:
+            # エンジンのバージョンがわからない間はバンクに保存しない（更新後に古い音声を返さないため）
+            PHRASE_BANK_REQUESTS.labels(source="engine").inc()
+            _, wav_bytes = await self.voicelib.synthesize_bytes(phrase, speaker_id, speed=speed, use_cache=False)
+            return wav_bytes
+        with self._lock:
+            wav_bytes = self._memory.get(key)
+            if wav_bytes is not None:
+                self._memory.move_to_end(key)
+        if wav_bytes is not None:
+            PHRASE_BANK_REQUESTS.labels(source="memory").inc()
+            return wav_bytes
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(phrase, speaker_id, speed, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # 呼び出し元がキャンセルされても、他の待ち手のために合成は続ける
+        return await asyncio.shield(task)
+
+    async def _load(self, phrase: str, speaker_id: int, speed: float, key: str) -> bytes:
+        wav_bytes = await asyncio.to_thread(self._read_disk, key)
+        if wav_bytes is not None:
+            PHRASE_BANK_REQUESTS.labels(source="disk").inc()
+        else:
+            PHRASE_BANK_REQUESTS.labels(source="engine").inc()
+            _, wav_bytes = await self.voicelib.synthesize_bytes(phrase, speaker_id, speed=speed, use_cache=False)
+            await asyncio.to_thread(self._write_disk, key, wav_bytes)
+        self._remember(key, wav_bytes)
+        return wav_bytes
+
+    async def warm(self, phrases: Iterable[str], speaker_ids: Iterable[int],
+                   speed: Optional[float] = None, concurrency: int = 2) -> None:
+        """定型文を全話者分まとめて用意する（起動時にバックグラウンドで呼ぶ）
+
+        読み上げ中のリクエストを圧迫しないよう同時合成数は concurrency に抑える。
+        既にディスクにある分はエンジンに問い合わせない。
+        """
+        if await self.voicelib.get_engine_version() is None:
+            logger.warning("Phrase bank warm-up skipped: VOICEVOX engine version is unknown")
+            return
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        failures = 0
+
+        async def warm_one(phrase, speaker_id):
+            nonlocal failures
+            async with semaphore:
+                try:
+                    await self.get(phrase, speaker_id, speed)
+                except Exception as e:
+                    failures += 1
+                    logger.debug(f"Phrase bank warm-up failed for {phrase!r} (speaker {speaker_id}): {e}")
+
+        targets = [(phrase, speaker_id) for speaker_id in dict.fromkeys(speaker_ids) for phrase in phrases]
+        await asyncio.gather(*(warm_one(phrase, speaker_id) for phrase, speaker_id in targets))
+        if failures:
+            logger.warning(f"Phrase bank warm-up: {failures}/{len(targets)} phrase(s) could not be rendered; they will be synthesized on first use")
+        else:
+            logger.info(f"Phrase bank ready: {len(targets)} phrase(s)")
+
+    async def compose(self, name_text: str, suffix: str, speaker_id: int, speed: Optional[float] = None):
+        """「{名前}が参加しました。」のような文を、名前の音声と定型文の音声を繋げて作る
+
+        名前部分は通常の音声キャッシュ経由で合成する（同じ名前なら2回目以降はキャッシュから）。
+        discord用PCM（48kHz・16bit・ステレオ）を返す。変換できない形式なら ValueError。
+        """
+        speed = self._normalize_speed(speed)
+        (_, name_wav), suffix_wav = await asyncio.gather(
+            self.voicelib.synthesize_bytes(name_text, speaker_id, speed=speed),
+            self.get(suffix, speaker_id, speed),
+        )
+        return b"".join((to_discord_pcm(name_wav), to_discord_pcm(suffix_wav)))
@@ -1,7 +1,9 @@
 import os
+import asyncio
+import logging
 import asyncpg
 from dotenv import load_dotenv
-from typing import Optional, List
+from typing import Callable, Iterable, Optional, List
 
 load_dotenv(override=True)
 
@@ -17,6 +19,49 @@ else:
     DB_SSL = False
 print(f"Connecting to DB at {DB_HOST}:{DB_PORT} as {DB_USER} to {DB_NAME} (SSL: {DB_SSL})")
 
+logger = logging.getLogger(__name__)
+
+# 行の変更をJSONで NOTIFY するトリガー関数（チャンネル名はトリガーの引数で渡す）
+# ペイロード: {"table", "op", "old": 変更前の行, "new": 変更後の行}。TRUNCATE と、
+# NOTIFY の上限（8000バイト）を超える行は {"table", "op": "RELOAD"} になる（受け取り側で読み直す）
+CHANGE_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION tts_notify_change() RETURNS trigger AS $$
+DECLARE
+    old_row JSONB;
+    new_row JSONB;
+    payload TEXT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', 'RELOAD')::text;
+    ELSE
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            old_row := to_jsonb(OLD);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            new_row := to_jsonb(NEW);
+        END IF;
+        payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'old', old_row, 'new', new_row)::text;
+        IF octet_length(payload) > 7500 THEN
+            payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', 'RELOAD')::text;
+        END IF;
+    END IF;
+    PERFORM pg_notify(TG_ARGV[0], payload);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _connect_options() -> dict:
+    return dict(
+        host=DB_HOST,
+        port=DB_PORT,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        ssl=DB_SSL,
+    )
+
 class PostgresDB:
     async def upsert_announce(self, announce: str) -> None:
         """アナウンス内容をセット(上書き)し、更新時刻を記録する"""
@@ -49,12 +94,7 @@ class PostgresDB:
     async def initialize(self) -> None:
         """Initialize the connection pool and ensure the dictionary table exists"""
         self._pool = await asyncpg.create_pool(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            ssl=DB_SSL,
+            **_connect_options(),
             min_size=1,
             max_size=10
         )
@@ -145,6 +185,64 @@ class PostgresDB:
             await self._pool.close()
             self._pool = None
 
+    async def install_change_notify(self, channel: str, tables: Iterable[str]) -> None:
+        """tables の行の変更を channel に NOTIFY するトリガーを作成（作り直し）する"""
+        if not self._pool:
+            raise RuntimeError("Database connection pool is not initialized.")
+        async with self._pool.acquire() as connection:
+            async with connection.transaction():
+                # 複数のプロセスが同時に起動してもトリガーの作り直しがぶつからないようにする
+                await connection.execute("SELECT pg_advisory_xact_lock(hashtext('tts_notify_change'))")
+                await connection.execute(CHANGE_NOTIFY_FUNCTION)
+                for table in tables:
+                    await connection.execute(f"""
+                        DROP TRIGGER IF EXISTS {table}_notify_change ON {table};
+                        CREATE TRIGGER {table}_notify_change
+                            AFTER INSERT OR UPDATE OR DELETE ON {table}
+                            FOR EACH ROW EXECUTE PROCEDURE tts_notify_change('{channel}');
+                        DROP TRIGGER IF EXISTS {table}_notify_truncate ON {table};
+                        CREATE TRIGGER {table}_notify_truncate
+                            AFTER TRUNCATE ON {table}
+                            FOR EACH STATEMENT EXECUTE PROCEDURE tts_notify_change('{channel}');
+                    """)
+
+    async def listen(self, channel: str, on_notify: Callable[[str], None],
+                     on_connect: Optional[Callable[[], None]] = None,
+                     on_disconnect: Optional[Callable[[], None]] = None,
+                     check_interval: float = 30.0) -> None:
+        """プールとは別の専用接続で channel を LISTEN し続ける（キャンセルされるまで戻らない）
+
+        通知のたびに on_notify(payload) を呼ぶ。接続が切れている間の通知は届かないので、
+        (再)接続のたびに on_connect() を呼び、呼び出し側でキャッシュを捨てられるようにする。
+        """
+        backoff = 1.0
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(**_connect_options())
+                await connection.add_listener(channel, lambda _conn, _pid, _channel, payload: on_notify(payload))
+                backoff = 1.0
+                if on_connect:
+                    on_connect()
+                # 切断に気づけるよう定期的に問い合わせる
+                while True:
+                    await asyncio.sleep(check_interval)
+                    await connection.fetchval("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"LISTEN {channel} connection lost: {e}")
+            finally:
+                if connection is not None:
+                    if on_disconnect:
+                        on_disconnect()
+                    try:
+                        await connection.close(timeout=5)
+                    except Exception:
+                        connection.terminate()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
     async def fetch(self, query: str, *args) -> List[asyncpg.Record]:
         """Execute a SELECT query and return the results"""
         if not self._pool:
@@ -219,6 +317,47 @@ class PostgresDB:
                 "DELETE FROM server_voice_speed WHERE guild_id = $1", guild_id
             )
 
+    async def get_user_voice(self, user_id: int) -> Optional[str]:
+        """Get the speaker_id a user has chosen. Returns None if not set."""
+        if not self._pool:
+            raise RuntimeError("Database connection pool is not initialized.")
+        async with self._pool.acquire() as connection:
+            return await connection.fetchval(
+                "SELECT speaker_id FROM user_voice WHERE user_id = $1", user_id
+            )
+
+    async def set_user_voice(self, user_id: int, speaker_id: str) -> None:
+        """Set or update the speaker_id for a user."""
+        if not self._pool:
+            raise RuntimeError("Database connection pool is not initialized.")
+        async with self._pool.acquire() as connection:
+            await connection.execute(
+                """
+                INSERT INTO user_voice (user_id, speaker_id)
+                VALUES ($1, $2)
+                ON CONFLICT (user_id) DO UPDATE SET speaker_id = $2
+                """,
+                user_id, speaker_id
+            )
+
+    async def get_banlist(self) -> List[int]:
+        """Return the user_ids of all banned users."""
+        return await self.fetch_column("SELECT user_id FROM banlist")
+
+    async def add_ban(self, user_id: int) -> None:
+        if not self._pool:
+            raise RuntimeError("Database connection pool is not initialized.")
+        async with self._pool.acquire() as connection:
+            await connection.execute(
+                "INSERT INTO banlist (user_id) VALUES ($1) ON CONFLICT DO NOTHING", user_id
+            )
+
+    async def remove_ban(self, user_id: int) -> None:
+        if not self._pool:
+            raise RuntimeError("Database connection pool is not initialized.")
+        async with self._pool.acquire() as connection:
+            await connection.execute("DELETE FROM banlist WHERE user_id = $1", user_id)
+
     async def upsert_dictionary(self, guild_id: int, key: str, value: str, author_id: int) -> None:
         """Insert or update a dictionary entry for a specific guild."""
         if not self._pool:
@@ -0,0 +1,32 @@
+from typing import List, NamedTuple
+
+
+# 読み上げキューの項目・統計の型（rust_queue 拡張を読み込まずに使えるよう rust_lib_client から分けている）
+
+# 優先レーン（小さいほど先に読み上げる）
+PRIORITY_SYSTEM = 0   # 接続・参加・退出などのシステム音声
+PRIORITY_COMMAND = 1  # コマンドから読み上げる音声
+PRIORITY_CHAT = 2     # 通常のチャット
+
+
+class QueueItem(NamedTuple):
+    text: str
+    speaker_id: int
+    user_name: str
+    age: float  # キューに入ってからの経過秒数
+    author_id: int = 0  # 投稿者のユーザーID（システム音声は0）
+    priority: int = PRIORITY_CHAT
+    ttl: float = 0.0  # 取り出した時点での期限までの残り秒数（0なら期限なし）
+
+
+class GuildQueueStats(NamedTuple):
+    guild_id: int
+    depth: int
+    oldest_age: float  # 最も古い項目がキューに入ってからの経過秒数
+    bytes: int         # キューに保持しているテキストのバイト数
+
+
+class QueueSnapshot(NamedTuple):
+    guilds: List[GuildQueueStats]  # 空でないキューのみ
+    total_depth: int
+    total_bytes: int
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from dotenv import dotenv_values, find_dotenv
+from prometheus_client import Counter, Gauge
+
+CONFIG_RELOADS = Counter(
+    'runtime_config_reloads_total',
+    '.env から実行時設定を再読込した回数',
+    ['source']
+)
+CONFIG_LAST_RELOAD = Gauge(
+    'runtime_config_last_reload_timestamp_seconds',
+    '実行時設定を最後に読み込んだ時刻（UNIX時間）'
+)
+
+DEFAULT_VOICEVOX_URL = "http://localhost:50021"
+
+logger = logging.getLogger(__name__)
+
+
+def _split_urls(value: Optional[str]) -> Tuple[str, ...]:
+    return tuple(u.strip() for u in (value or "").split(",") if u.strip())
+
+
+@dataclass(frozen=True)
+class RuntimeConfig:
+    """実行中に変更されうる設定のスナップショット（イミュータブル）
+
+    ホットパスでは get_config() の戻り値を読むだけにし、.env の再読込や
+    環境変数の書き換えは行わない。再読込時はオブジェクトごと差し替える。
+    """
+    voicevox_urls: Tuple[str, ...]
+    voicevox_backup_urls: Tuple[str, ...]
+    voicevox_routing: str
+    admin_id: Optional[int]
+    debug: bool
+    loaded_at: float
+
+
+def _find_env_path() -> Optional[str]:
+    path = find_dotenv(usecwd=True)
+    return path or None
+
+
+def load_runtime_config(env_path: Optional[str] = None) -> RuntimeConfig:
+    """環境変数と .env（.env が優先）から RuntimeConfig を作る"""
+    values = dict(os.environ)
+    path = env_path or _find_env_path()
+    if path:
+        values.update({k: v for k, v in dotenv_values(path).items() if v is not None})
+    urls = _split_urls(values.get("VOICEVOX_URL")) or (DEFAULT_VOICEVOX_URL,)
+    admin_id = values.get("ADMIN_ID")
+    try:
+        admin_id = int(admin_id) if admin_id else None
+    except ValueError:
+        logger.error(f"Invalid ADMIN_ID in .env: {admin_id!r}")
+        admin_id = None
+    return RuntimeConfig(
+        voicevox_urls=urls,
+        voicevox_backup_urls=_split_urls(values.get("VOICEVOX_BACKUP_URL")),
+        voicevox_routing=(values.get("VOICEVOX_ROUTING") or "random").strip().lower(),
+        admin_id=admin_id,
+        debug=values.get("DEBUG", "0") == "1",
+        loaded_at=time.time(),
+    )
+
+
+_current: RuntimeConfig = load_runtime_config()
+CONFIG_LAST_RELOAD.set(_current.loaded_at)
+
+
+def get_config() -> RuntimeConfig:
+    """現在の実行時設定を返す（ファイルI/Oなし）"""
+    return _current
+
+
+def reload_config(source: str = "manual") -> RuntimeConfig:
+    """.env を読み直して設定を差し替える"""
+    global _current
+    new_config = load_runtime_config()
+    _current = new_config
+    CONFIG_RELOADS.labels(source=source).inc()
+    CONFIG_LAST_RELOAD.set(new_config.loaded_at)
+    logger.info(
+        f"Runtime config reloaded ({source}): "
+        f"{len(new_config.voicevox_urls)} VOICEVOX URL(s), {len(new_config.voicevox_backup_urls)} backup URL(s)"
+    )
+    return new_config
+
+
+def _env_mtime() -> Optional[float]:
+    path = _find_env_path()
+    if not path:
+        return None
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+async def watch_config(interval: float = 5.0) -> None:
+    """.env の更新時刻を定期的に確認し、変わっていれば再読込する"""
+    last_mtime = await asyncio.to_thread(_env_mtime)
+    while True:
+        try:
+            await asyncio.sleep(interval)
+            mtime = await asyncio.to_thread(_env_mtime)
+            if mtime != last_mtime:
+                last_mtime = mtime
+                await asyncio.to_thread(reload_config, "watcher")
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Error in runtime config watcher: {e}")
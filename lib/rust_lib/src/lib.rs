@@ -1,31 +1,247 @@
 use pyo3::prelude::*;
-use pyo3::types::PyTuple;
+use pyo3::exceptions::PyValueError;
 use std::collections::{HashMap, VecDeque};
 use std::sync::Mutex;
+use std::time::{Duration, Instant};
 use once_cell::sync::Lazy;
 
 type GuildId = u64;
-type QueueItem = (String, u64, String); // (text, speaker_id, user_name)
+// (text, speaker_id, user_name, 経過秒数, author_id, 優先レーン, 期限までの残り秒数（期限なしは0）)
+type Entry = (String, u64, String, f64, u64, usize, f64);
 
-static QUEUES: Lazy<Mutex<HashMap<GuildId, VecDeque<QueueItem>>>> = Lazy::new(|| Mutex::new(HashMap::new()));
+// 優先レーン（小さいほど先に読む）: 0 = システム音声, 1 = コマンド, 2 = チャット
+const LANES: usize = 3;
 
+struct QueueItem {
+    text: String,
+    speaker_id: u64,
+    user_name: String,
+    author_id: u64, // 投稿者のユーザーID（システム音声は0）
+    priority: usize,
+    enqueued_at: Instant,
+    expires_at: Option<Instant>,
+}
+
+impl QueueItem {
+    fn is_expired(&self, now: Instant) -> bool {
+        self.expires_at.map_or(false, |deadline| now >= deadline)
+    }
+
+    /// キュー上で保持しているテキストのバイト数
+    fn bytes(&self) -> usize {
+        self.text.len() + self.user_name.len()
+    }
+
+    /// Pythonに返すタプル（requeue_front にそのまま渡せば元のレーン・期限で戻せる）
+    fn into_tuple(self, now: Instant) -> Entry {
+        let age = now.duration_since(self.enqueued_at).as_secs_f64();
+        let ttl_left = self.expires_at.map_or(0.0, |deadline| deadline.saturating_duration_since(now).as_secs_f64());
+        (self.text, self.speaker_id, self.user_name, age, self.author_id, self.priority, ttl_left)
+    }
+}
+
+#[derive(Default)]
+struct GuildQueue {
+    lanes: [VecDeque<QueueItem>; LANES],
+    // 前回 take_expired を呼んでから期限切れで捨てた件数
+    expired: usize,
+}
+
+impl GuildQueue {
+    fn len(&self) -> usize {
+        self.lanes.iter().map(|lane| lane.len()).sum()
+    }
+
+    fn bytes(&self) -> usize {
+        self.lanes.iter().flatten().map(QueueItem::bytes).sum()
+    }
+
+    /// 各レーンは古い順に並んでいるので、先頭同士を比べれば最古の項目がわかる
+    fn oldest(&self) -> Option<Instant> {
+        self.lanes.iter().filter_map(|lane| lane.front()).map(|item| item.enqueued_at).min()
+    }
+
+    /// 最も優先度の高いレーンから期限切れでない項目を1件取り出す
+    fn pop_live(&mut self, now: Instant) -> Option<QueueItem> {
+        for lane in 0..LANES {
+            while let Some(item) = self.lanes[lane].pop_front() {
+                if item.is_expired(now) {
+                    self.expired += 1;
+                    continue;
+                }
+                return Some(item);
+            }
+        }
+        None
+    }
+
+    /// 容量超過時に追い出す項目を選ぶ。追加する項目と同じか低い優先度のレーンから、
+    /// 最も優先度の低いレーンの最古（drop_oldest）を選ぶ。
+    /// drop_newest では追加する項目自身を捨て、より低い優先度のレーンがあればその最新を追い出す。
+    fn evict_for(&mut self, priority: usize, drop_newest: bool) -> bool {
+        for lane in (priority..LANES).rev() {
+            if drop_newest {
+                if lane > priority && self.lanes[lane].pop_back().is_some() {
+                    return true;
+                }
+            } else if self.lanes[lane].pop_front().is_some() {
+                return true;
+            }
+        }
+        false
+    }
+}
+
+static QUEUES: Lazy<Mutex<HashMap<GuildId, GuildQueue>>> = Lazy::new(|| Mutex::new(HashMap::new()));
+
+/// 秒数を Duration にする。0以下・NaN・無限大・表せないほど大きい値は None
+fn seconds(value: f64) -> Option<Duration> {
+    if value > 0.0 {
+        Duration::try_from_secs_f64(value).ok()
+    } else {
+        None
+    }
+}
+
+/// 空になったギルドのキューをマップから外す（期限切れ件数が未回収なら take_expired まで残す）
+fn remove_if_drained(queues: &mut HashMap<GuildId, GuildQueue>, guild_id: GuildId) {
+    if queues.get(&guild_id).map_or(false, |q| q.len() == 0 && q.expired == 0) {
+        queues.remove(&guild_id);
+    }
+}
+
+/// 項目を追加し、容量超過で捨てた件数を返す（追加した項目自身を捨てた場合も1件と数える）
+///
+/// capacity が 0 なら無制限、ttl_seconds が 0 以下（または NaN・無限大など不正な値）なら期限なし。
 #[pyfunction]
-fn add_to_queue(guild_id: u64, text: String, speaker_id: u64, user_name: String) {
+#[pyo3(signature = (guild_id, text, speaker_id, user_name, priority=2, ttl_seconds=0.0, capacity=0, drop_newest=false, author_id=0))]
+fn add_to_queue(
+    guild_id: u64,
+    text: String,
+    speaker_id: u64,
+    user_name: String,
+    priority: usize,
+    ttl_seconds: f64,
+    capacity: usize,
+    drop_newest: bool,
+    author_id: u64,
+) -> PyResult<usize> {
+    if priority >= LANES {
+        return Err(PyValueError::new_err(format!("priority must be 0..{}", LANES - 1)));
+    }
+    let now = Instant::now();
+    let expires_at = seconds(ttl_seconds).and_then(|ttl| now.checked_add(ttl));
     let mut queues = QUEUES.lock().unwrap();
-    let queue = queues.entry(guild_id).or_insert_with(VecDeque::new);
-    queue.push_back((text, speaker_id, user_name));
+    let queue = queues.entry(guild_id).or_default();
+    let mut dropped = 0;
+    if capacity > 0 {
+        // 追い出す前に期限切れの項目を片付ける
+        for lane in queue.lanes.iter_mut() {
+            let before = lane.len();
+            lane.retain(|item| !item.is_expired(now));
+            queue.expired += before - lane.len();
+        }
+        while queue.len() >= capacity {
+            if !queue.evict_for(priority, drop_newest) {
+                // 追い出せる項目がない（すべてより高い優先度）ので新しい項目を捨てる
+                remove_if_drained(&mut queues, guild_id);
+                return Ok(dropped + 1);
+            }
+            dropped += 1;
+        }
+    }
+    queue.lanes[priority].push_back(QueueItem { text, speaker_id, user_name, author_id, priority, enqueued_at: now, expires_at });
+    Ok(dropped)
 }
 
 #[pyfunction]
-fn get_next(py: Python, guild_id: u64) -> PyResult<PyObject> {
+fn get_next(guild_id: u64) -> Option<Entry> {
     let mut queues = QUEUES.lock().unwrap();
+    let now = Instant::now();
+    let item = queues.get_mut(&guild_id)?.pop_live(now);
+    remove_if_drained(&mut queues, guild_id);
+    item.map(|item| item.into_tuple(now))
+}
+
+/// 優先度順に最大 n 件をまとめて取り出す（ロックは1回だけ取る）
+#[pyfunction]
+fn get_many(guild_id: u64, n: usize) -> Vec<Entry> {
+    let mut queues = QUEUES.lock().unwrap();
+    let mut items = Vec::new();
     if let Some(queue) = queues.get_mut(&guild_id) {
-        if let Some((text, speaker_id, user_name)) = queue.pop_front() {
-            let tuple = PyTuple::new(py, &[text.into_py(py), speaker_id.into_py(py), user_name.into_py(py)])?;
-            return Ok(tuple.into_py(py));
+        let now = Instant::now();
+        while items.len() < n {
+            match queue.pop_live(now) {
+                Some(item) => items.push(item.into_tuple(now)),
+                None => break,
+            }
+        }
+    }
+    remove_if_drained(&mut queues, guild_id);
+    items
+}
+
+/// 期限切れでない項目がある最も優先度の高いレーン（なければ None）。項目は取り出さない
+#[pyfunction]
+fn peek_priority(guild_id: u64) -> Option<usize> {
+    let queues = QUEUES.lock().unwrap();
+    let queue = queues.get(&guild_id)?;
+    let now = Instant::now();
+    (0..LANES).find(|&lane| queue.lanes[lane].iter().any(|item| !item.is_expired(now)))
+}
+
+/// 取り出した項目を、それぞれのレーンの先頭に読み上げ順のまま戻す
+///
+/// items は get_next / get_many が返したタプル（読み上げ順）。経過時間と期限は引き継ぎ、
+/// 容量の上限は確認しない（取り出す前にキューに入っていた項目なので）。
+#[pyfunction]
+fn requeue_front(guild_id: u64, items: Vec<Entry>) -> PyResult<()> {
+    if items.iter().any(|item| item.5 >= LANES) {
+        return Err(PyValueError::new_err(format!("priority must be 0..{}", LANES - 1)));
+    }
+    let now = Instant::now();
+    let mut queues = QUEUES.lock().unwrap();
+    let queue = queues.entry(guild_id).or_default();
+    for (text, speaker_id, user_name, age, author_id, priority, ttl_left) in items.into_iter().rev() {
+        let enqueued_at = seconds(age).and_then(|age| now.checked_sub(age)).unwrap_or(now);
+        let expires_at = seconds(ttl_left).and_then(|ttl| now.checked_add(ttl));
+        queue.lanes[priority].push_front(QueueItem { text, speaker_id, user_name, author_id, priority, enqueued_at, expires_at });
+    }
+    Ok(())
+}
+
+/// 空でない全ギルドの (guild_id, 件数, 最古の項目の経過秒数, バイト数) と、
+/// 全体の (件数, バイト数) を1回のロックで集計する
+#[pyfunction]
+fn snapshot() -> (Vec<(u64, usize, f64, usize)>, usize, usize) {
+    let queues = QUEUES.lock().unwrap();
+    let now = Instant::now();
+    let mut rows = Vec::new();
+    let (mut total_depth, mut total_bytes) = (0, 0);
+    for (guild_id, queue) in queues.iter() {
+        let depth = queue.len();
+        if depth == 0 {
+            continue;
         }
+        let bytes = queue.bytes();
+        let oldest_age = queue.oldest().map_or(0.0, |t| now.duration_since(t).as_secs_f64());
+        rows.push((*guild_id, depth, oldest_age, bytes));
+        total_depth += depth;
+        total_bytes += bytes;
     }
-    Ok(py.None())
+    (rows, total_depth, total_bytes)
+}
+
+/// 前回の呼び出し以降に期限切れで捨てた件数を返してリセットする
+#[pyfunction]
+fn take_expired(guild_id: u64) -> usize {
+    let mut queues = QUEUES.lock().unwrap();
+    let expired = queues
+        .get_mut(&guild_id)
+        .map(|q| std::mem::take(&mut q.expired))
+        .unwrap_or(0);
+    remove_if_drained(&mut queues, guild_id);
+    expired
 }
 
 #[pyfunction]
@@ -44,6 +260,11 @@ fn queue_length(guild_id: u64) -> usize {
 fn rust_queue(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(add_to_queue, m)?)?;
     m.add_function(wrap_pyfunction!(get_next, m)?)?;
+    m.add_function(wrap_pyfunction!(get_many, m)?)?;
+    m.add_function(wrap_pyfunction!(peek_priority, m)?)?;
+    m.add_function(wrap_pyfunction!(requeue_front, m)?)?;
+    m.add_function(wrap_pyfunction!(snapshot, m)?)?;
+    m.add_function(wrap_pyfunction!(take_expired, m)?)?;
     m.add_function(wrap_pyfunction!(clear_queue, m)?)?;
     m.add_function(wrap_pyfunction!(queue_length, m)?)?;
     Ok(())
@@ -1,21 +1,92 @@
+import asyncio
+from typing import Dict, List, Optional
+
 import rust_queue
 
+from lib.queue_types import (
+    PRIORITY_CHAT, PRIORITY_COMMAND, PRIORITY_SYSTEM, GuildQueueStats, QueueItem, QueueSnapshot,
+)
+
+# 容量超過時の方針
+DROP_OLDEST = "drop_oldest"  # 最も優先度の低いレーンの一番古い項目を追い出す
+DROP_NEWEST = "drop_newest"  # 追加しようとした項目を捨てる（より低い優先度の項目があればそちらを追い出す）
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+
 class RustQueueClient:
-    def add(self, guild_id: int, text: str, speaker_id: int, user_name: str) -> None:
-        print(f"Adding to Rust queue")
-        rust_queue.add_to_queue(guild_id, text, speaker_id, user_name)
+    def __init__(self) -> None:
+        # ギルドごとの「キューに追加があった」通知（消費側はこれを待って眠る）
+        self._wakeups: Dict[int, asyncio.Event] = {}
+
+    def _wakeup(self, guild_id: int) -> asyncio.Event:
+        event = self._wakeups.get(guild_id)
+        if event is None:
+            event = self._wakeups[guild_id] = asyncio.Event()
+        return event
+
+    async def wait(self, guild_id: int) -> None:
+        """前回の wait 以降に add されるまで待つ（すでに add されていればすぐ戻る）
+
+        取り出し側は get_next が None を返したらこれを待ち、戻ったら get_next をやり直す。
+        """
+        event = self._wakeup(guild_id)
+        await event.wait()
+        event.clear()
+
+    def add(self, guild_id: int, text: str, speaker_id: int, user_name: str,
+            priority: int = PRIORITY_CHAT, ttl: Optional[float] = None,
+            capacity: int = 0, overflow: str = DROP_OLDEST, author_id: int = 0) -> int:
+        """キューに追加し、容量超過で捨てた件数を返す
+
+        ttl 秒を過ぎた項目は get_next で読み飛ばされる（None・0以下・NaN・無限大なら期限なし）。
+        capacity はギルドあたりの全レーン合計の上限（0なら無制限）。
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        dropped = rust_queue.add_to_queue(
+            guild_id, text, speaker_id, user_name,
+            priority, ttl or 0.0, capacity, overflow == DROP_NEWEST, author_id,
+        )
+        self._wakeup(guild_id).set()
+        return dropped
 
     def get_next(self, guild_id: int):
+        """最も優先度の高いレーンの先頭を返す（期限切れの項目は捨てて次を見る）"""
         result = rust_queue.get_next(guild_id)
         if result is not None:
-            text, speaker_id, user_name = result
-            return text, speaker_id, user_name
+            return QueueItem(*result)
         return None
 
+    def get_many(self, guild_id: int, n: int) -> List[QueueItem]:
+        """get_next を最大 n 回繰り返したのと同じ項目を、1回の呼び出しで取り出す"""
+        return [QueueItem(*item) for item in rust_queue.get_many(guild_id, n)]
+
+    def peek_priority(self, guild_id: int) -> Optional[int]:
+        """読み上げ待ちのある最も優先度の高いレーン（空なら None）"""
+        return rust_queue.peek_priority(guild_id)
+
+    def requeue_front(self, guild_id: int, items: List[QueueItem]) -> None:
+        """取り出した項目を、元のレーンの先頭に読み上げ順のまま戻す（経過時間・期限は引き継ぐ）"""
+        if items:
+            rust_queue.requeue_front(guild_id, [tuple(item) for item in items])
+            self._wakeup(guild_id).set()
+
+    def snapshot(self) -> QueueSnapshot:
+        """全ギルドのキューの状態と合計を、拡張側の1回のロックで集計する"""
+        rows, total_depth, total_bytes = rust_queue.snapshot()
+        return QueueSnapshot([GuildQueueStats(*row) for row in rows], total_depth, total_bytes)
+
+    def take_expired(self, guild_id: int) -> int:
+        """前回の呼び出し以降に期限切れで捨てた件数"""
+        return rust_queue.take_expired(guild_id)
+
     def clear(self, guild_id: int) -> None:
-        print(f"Clearing Rust queue")
+        """キューを空にし、そのギルドの通知も捨てる"""
         rust_queue.clear_queue(guild_id)
+        event = self._wakeups.pop(guild_id, None)
+        if event is not None:
+            # 捨てた通知を待っている消費側を起こす（get_next をやり直して新しい通知を待つ）
+            event.set()
 
     def length(self, guild_id: int) -> int:
-        print(f"Getting length of Rust queue")
         return rust_queue.queue_length(guild_id)
@@ -0,0 +1,108 @@
+from typing import Dict, Optional, Set, Tuple
+
+from lib.async_cache import AsyncLoadingCache
+from lib.postgres import PostgresDB
+
+# announce_config は id = 1 の1行だけ
+ANNOUNCE_KEY = 1
+
+
+class SettingsCache:
+    """サーバー・ユーザー設定のプロセス内キャッシュ
+
+    読み上げスピード・ユーザーの話者・アナウンスは初めて使うときに読み込み
+    （AsyncLoadingCache）、BANリストと自動参加設定は起動時に全件読み込む。
+    書き込みはDBに書いてからキャッシュにも反映する（write-through）。
+    Web側など他のプロセスからの変更は invalidate_* で捨てるか、ttl 秒で読み直す。
+    キャッシュ済みの設定を読むだけならDBには問い合わせない。
+    """
+
+    def __init__(self, db: PostgresDB, ttl: Optional[float] = 300,
+                 max_guilds: int = 10000, max_users: int = 50000) -> None:
+        self.db = db
+        self.speeds = AsyncLoadingCache("server_speed", self._load_speed, max_entries=max_guilds, ttl=ttl)
+        self.speakers = AsyncLoadingCache("user_voice", self._load_speaker, max_entries=max_users, ttl=ttl)
+        self.announce = AsyncLoadingCache("announce", self._load_announce, max_entries=1, ttl=ttl)
+        self.banlist: Set[int] = set()
+        self.autojoin: Dict[int, Tuple[int, int]] = {}  # {guild_id: (vc_channel_id, tts_channel_id)}
+
+    async def load_banlist(self) -> None:
+        self.banlist = set(await self.db.get_banlist())
+
+    async def load_autojoin(self) -> None:
+        rows = await self.db.fetch_all_autojoin()
+        self.autojoin = {r['guild_id']: (r['vc_channel_id'], r['tts_channel_id']) for r in rows}
+
+    # --- 読み上げスピード（未設定なら None） ---
+    async def _load_speed(self, guild_id: int, previous) -> Optional[float]:
+        return await self.db.get_server_voice_speed(guild_id)
+
+    async def get_speed(self, guild_id: int) -> Optional[float]:
+        return await self.speeds.get(guild_id)
+
+    async def set_speed(self, guild_id: int, speed: float) -> None:
+        await self.db.set_server_voice_speed(guild_id, speed)
+        self.speeds.put(guild_id, speed)
+
+    async def reset_speed(self, guild_id: int) -> None:
+        await self.db.delete_server_voice_speed(guild_id)
+        self.speeds.put(guild_id, None)
+
+    # --- ユーザーの話者（未設定なら None） ---
+    async def _load_speaker(self, user_id: int, previous) -> Optional[int]:
+        speaker_id = await self.db.get_user_voice(user_id)
+        return int(speaker_id) if speaker_id is not None else None
+
+    async def get_speaker_id(self, user_id: int) -> Optional[int]:
+        return await self.speakers.get(user_id)
+
+    async def set_speaker_id(self, user_id: int, speaker_id: int) -> None:
+        await self.db.set_user_voice(user_id, str(speaker_id))
+        self.speakers.put(user_id, speaker_id)
+
+    # --- アナウンス（未設定なら空文字） ---
+    async def _load_announce(self, key, previous) -> str:
+        row = await self.db.get_announce()
+        return row["announce"] if row else ""
+
+    async def get_announce(self) -> str:
+        return await self.announce.get(ANNOUNCE_KEY)
+
+    async def set_announce(self, text: str) -> None:
+        await self.db.upsert_announce(text)
+        self.announce.put(ANNOUNCE_KEY, text)
+
+    async def delete_announce(self) -> None:
+        await self.db.delete_announce()
+        self.announce.put(ANNOUNCE_KEY, "")
+
+    # --- BANリスト ---
+    def is_banned(self, user_id: int) -> bool:
+        return user_id in self.banlist
+
+    async def ban(self, user_id: int) -> None:
+        await self.db.add_ban(user_id)
+        self.banlist.add(user_id)
+
+    async def unban(self, user_id: int) -> None:
+        await self.db.remove_ban(user_id)
+        self.banlist.discard(user_id)
+
+    # --- 自動参加 ---
+    async def set_autojoin(self, guild_id: int, vc_channel_id: int, tts_channel_id: int) -> None:
+        await self.db.set_autojoin(guild_id, vc_channel_id, tts_channel_id)
+        self.autojoin[guild_id] = (vc_channel_id, tts_channel_id)
+
+    async def delete_autojoin(self, guild_id: int) -> None:
+        await self.db.delete_autojoin(guild_id)
+        self.autojoin.pop(guild_id, None)
+
+    # --- 他のプロセスでの変更（HTTP の /notify から呼ぶ） ---
+    def invalidate_speed(self, guild_id: int) -> None:
+        self.speeds.invalidate(guild_id)
+
+    def invalidate_speaker(self, user_id: int) -> None:
+        self.speakers.invalidate(user_id)
+
+    def invalidate_announce(self) -> None:
+        self.announce.invalidate(ANNOUNCE_KEY)
@@ -0,0 +1,36 @@
+import re
+
+# 数字の連続（"1000000" や電話番号など）は意味が変わるので縮めない
+_DIGIT = re.compile(r"\d")
+
+
+def collapse_char_runs(text: str, max_run: int = 3) -> str:
+    """同じ文字の連続を max_run 文字までに縮める（"wwwwww" → "www", "！！！！" → "！！！"）"""
+    if max_run < 1:
+        return text
+    pattern = re.compile(r"(\D)\1{%d,}" % max_run)
+    return pattern.sub(lambda m: m.group(1) * max_run, text)
+
+
+def collapse_token_repeats(text: str, max_repeats: int = 2, max_token_len: int = 8) -> str:
+    """2〜max_token_len 文字の並びの繰り返しを max_repeats 回までに縮める
+
+    "あははあははあははあはは" → "あははあはは"、"草生える草生える草生える" → "草生える草生える"
+    """
+    if max_repeats < 1 or max_token_len < 2:
+        return text
+    pattern = re.compile(r"(.{2,%d}?)\1{%d,}" % (max_token_len, max_repeats), re.DOTALL)
+
+    def replace(match):
+        token = match.group(1)
+        if _DIGIT.search(token):
+            return match.group(0)
+        return token * max_repeats
+
+    return pattern.sub(replace, text)
+
+
+def collapse_repeats(text: str, max_char_run: int = 3, max_token_repeats: int = 2) -> str:
+    """チャットによくある連打・コピペの繰り返しを縮めて、合成する文字数を減らす"""
+    text = collapse_char_runs(text, max_char_run)
+    return collapse_token_repeats(text, max_token_repeats)
@@ -0,0 +1,323 @@
+"""VOICEVOXエンジンのベンチマークスイート
+
+コーパス（短文・中文・長文）を、エンジンごとに並列数を変えながら合成し、
+audio_query と synthesis の所要時間を分けて p50/p95/p99 とリアルタイム係数（RTF）を集計する。
+並列数を上げてもスループットが伸びなくなった点を飽和点として報告する。
+エンジンの素の性能を測るため、各エンジンに直接リクエストを送り、VOICEVOXLib の
+エンジンプール（サーキットブレーカー・振り分け）と音声キャッシュは経由しない。
+
+/admin bench suite から実行するほか、CLIからスタブエンジンに対して回して
+回帰チェックに使える:
+
+    python -m lib.voicevox_bench --stub --levels 1,4,16 --max-p95 2.0
+    python -m lib.voicevox_bench --url http://localhost:50021 --json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import sys
+import time
+import wave
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Sequence
+
+import aiohttp
+
+from lib.VOICEVOXlib import VOICEVOXLib
+
+DEFAULT_CORPUS: Dict[str, List[str]] = {
+    "short": [
+        "こんにちは",
+        "了解です",
+        "おつかれさま",
+    ],
+    "medium": [
+        "今日の夜って何時から集まる予定ですか？",
+        "ちょっと離席します、十分くらいで戻ります",
+        "このボス強すぎない？回復アイテムが足りないかも",
+    ],
+    "long": [
+        "さっきの試合、最後の一手が完全に読まれていたね。次はもう少し慎重に行こう。作戦は通話で相談しよう。",
+        "明日は午前中に買い物へ行って、午後から作業をする予定です。夜は通話に参加できると思うので、また連絡します。",
+    ],
+}
+DEFAULT_LEVELS = (1, 4, 16, 64)
+# 稼働中のエンジンに Discord から流す場合の既定の並列数と上限（読み上げを止めない程度に抑える）
+CHAT_DEFAULT_LEVELS = (1, 4)
+CHAT_MAX_LEVEL = 16
+# 並列数を上げてもスループットの伸びがこの割合未満なら飽和とみなす
+SATURATION_GAIN = 1.10
+# 結果と一緒に表示する計測条件の注記
+POOL_BYPASS_NOTE = "各エンジンに直接送信（エンジンプール・音声キャッシュは経由しない）"
+
+
+@dataclass
+class LevelResult:
+    concurrency: int
+    requests: int
+    errors: int
+    wall_seconds: float
+    requests_per_sec: float
+    audio_seconds_per_sec: float
+    latency_p50: Optional[float]
+    latency_p95: Optional[float]
+    latency_p99: Optional[float]
+    query_p50: Optional[float]
+    query_p95: Optional[float]
+    query_p99: Optional[float]
+    synthesis_p50: Optional[float]
+    synthesis_p95: Optional[float]
+    synthesis_p99: Optional[float]
+    rtf_p50: Optional[float]
+
+
+@dataclass
+class EngineResult:
+    url: str
+    levels: List[LevelResult] = field(default_factory=list)
+    saturation_concurrency: Optional[int] = None
+    saturated: bool = False
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def flatten_corpus(corpus) -> List[str]:
+    if isinstance(corpus, dict):
+        return [text for texts in corpus.values() for text in texts]
+    return [text for text in corpus if text.strip()]
+
+
+def _wav_duration(wav_bytes: bytes) -> float:
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
+        framerate = wav_file.getframerate()
+        return wav_file.getnframes() / framerate if framerate else 0.0
+
+
+async def _synthesize_once(session: aiohttp.ClientSession, url: str, text: str,
+                           speaker_id: int, speed: Optional[float]):
+    """1回分の audio_query → synthesis を行い (query秒, synthesis秒, 音声秒) を返す"""
+    start = time.perf_counter()
+    async with session.post(f"{url}/audio_query", params={"text": text, "speaker": speaker_id}) as response:
+        response.raise_for_status()
+        query = VOICEVOXLib._apply_query_options(await response.json(), speed)
+    query_done = time.perf_counter()
+    async with session.post(f"{url}/synthesis", params={"speaker": speaker_id}, json=query) as response:
+        response.raise_for_status()
+        wav_bytes = await response.read()
+    return query_done - start, time.perf_counter() - query_done, _wav_duration(wav_bytes)
+
+
+async def bench_level(session: aiohttp.ClientSession, url: str, texts: List[str], concurrency: int,
+                      requests: int, speaker_id: int, speed: Optional[float]) -> LevelResult:
+    """concurrency 本のワーカーで合計 requests 回合成して集計する"""
+    queries, syntheses, totals, rtfs = [], [], [], []
+    audio_total = 0.0
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, audio_total, errors
+        while next_index < requests:
+            text = texts[next_index % len(texts)]
+            next_index += 1
+            try:
+                query_s, synthesis_s, audio_s = await _synthesize_once(session, url, text, speaker_id, speed)
+            except Exception:
+                errors += 1
+                continue
+            queries.append(query_s)
+            syntheses.append(synthesis_s)
+            totals.append(query_s + synthesis_s)
+            audio_total += audio_s
+            if audio_s > 0:
+                rtfs.append((query_s + synthesis_s) / audio_s)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return LevelResult(
+        concurrency=concurrency,
+        requests=requests,
+        errors=errors,
+        wall_seconds=wall,
+        requests_per_sec=len(totals) / wall if wall > 0 else 0.0,
+        audio_seconds_per_sec=audio_total / wall if wall > 0 else 0.0,
+        latency_p50=percentile(totals, 50),
+        latency_p95=percentile(totals, 95),
+        latency_p99=percentile(totals, 99),
+        query_p50=percentile(queries, 50),
+        query_p95=percentile(queries, 95),
+        query_p99=percentile(queries, 99),
+        synthesis_p50=percentile(syntheses, 50),
+        synthesis_p95=percentile(syntheses, 95),
+        synthesis_p99=percentile(syntheses, 99),
+        rtf_p50=percentile(rtfs, 50),
+    )
+
+
+def find_saturation(levels: List[LevelResult]):
+    """スループットの伸びが SATURATION_GAIN 未満になる直前の並列数を返す
+
+    戻り値は (並列数, 飽和したか)。最後まで伸び続けた場合は最大の並列数と False。
+    """
+    usable = [level for level in levels if level.requests_per_sec > 0]
+    for previous, current in zip(usable, usable[1:]):
+        if current.requests_per_sec < previous.requests_per_sec * SATURATION_GAIN:
+            return previous.concurrency, True
+    return (usable[-1].concurrency if usable else None), False
+
+
+async def run_benchmark(urls: Sequence[str], corpus=None, levels: Sequence[int] = DEFAULT_LEVELS,
+                        requests_per_level: Optional[int] = None, speaker_id: int = 1,
+                        speed: Optional[float] = None, timeout: float = 120.0) -> List[EngineResult]:
+    """各エンジンに対して並列数ごとのベンチマークを順番に実行する
+
+    エンジン同士・並列数同士が干渉しないよう、同時に負荷をかけるのは1エンジン・1並列数だけ。
+    requests_per_level を省略すると max(並列数×4, コーパス件数) 回合成する。
+    """
+    if not levels or min(levels) < 1:
+        raise ValueError("concurrency levels must be positive integers")
+    texts = flatten_corpus(corpus if corpus is not None else DEFAULT_CORPUS)
+    if not texts:
+        raise ValueError("benchmark corpus is empty")
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=max(levels))
+    results = []
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        for url in urls:
+            url = url.rstrip("/")
+            engine = EngineResult(url=url)
+            # 接続確立やモデルの読み込みを計測に含めないよう、先に1回合成しておく
+            try:
+                await _synthesize_once(session, url, texts[0], speaker_id, speed)
+            except Exception:
+                pass
+            for concurrency in levels:
+                requests = requests_per_level or max(concurrency * 4, len(texts))
+                engine.levels.append(await bench_level(session, url, texts, concurrency, requests, speaker_id, speed))
+            engine.saturation_concurrency, engine.saturated = find_saturation(engine.levels)
+            results.append(engine)
+    return results
+
+
+def _fmt(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds:.2f}"
+
+
+def format_engine(engine: EngineResult) -> str:
+    """1エンジン分の結果を等幅の表にする（並列数ごとに合計・query・synth の3行）"""
+    lines = ["conc  stage p50   p95   p99   RTF   req/s  err"]
+    for level in engine.levels:
+        lines.append(
+            f"{level.concurrency:<5} total {_fmt(level.latency_p50):<5} {_fmt(level.latency_p95):<5} "
+            f"{_fmt(level.latency_p99):<5} {_fmt(level.rtf_p50):<5} {level.requests_per_sec:<6.2f} {level.errors}"
+        )
+        for stage, p50, p95, p99 in (
+            ("query", level.query_p50, level.query_p95, level.query_p99),
+            ("synth", level.synthesis_p50, level.synthesis_p95, level.synthesis_p99),
+        ):
+            lines.append(f"{'':<5} {stage} {_fmt(p50):<5} {_fmt(p95):<5} {_fmt(p99)}")
+    if engine.saturated:
+        lines.append(f"飽和点: 並列数 {engine.saturation_concurrency}")
+    else:
+        lines.append(f"飽和点: 並列数 {engine.saturation_concurrency} まで未到達")
+    return "\n".join(lines)
+
+
+def format_report(results: List[EngineResult]) -> str:
+    engines = "\n\n".join(f"{engine.url}\n{format_engine(engine)}" for engine in results)
+    return f"{POOL_BYPASS_NOTE}\n\n{engines}"
+
+
+def check_thresholds(results: List[EngineResult], max_p95: Optional[float],
+                     min_rps: Optional[float], max_error_rate: Optional[float]) -> List[str]:
+    """回帰チェック用。しきい値を外れた項目の説明を返す（空なら合格）"""
+    failures = []
+    for engine in results:
+        for level in engine.levels:
+            label = f"{engine.url} c={level.concurrency}"
+            if max_p95 is not None and (level.latency_p95 is None or level.latency_p95 > max_p95):
+                failures.append(f"{label}: p95 {_fmt(level.latency_p95)}s > {max_p95}s")
+            if min_rps is not None and level.requests_per_sec < min_rps:
+                failures.append(f"{label}: {level.requests_per_sec:.2f} req/s < {min_rps} req/s")
+            if max_error_rate is not None and level.requests and level.errors / level.requests > max_error_rate:
+                failures.append(f"{label}: error rate {level.errors / level.requests:.3f} > {max_error_rate}")
+    return failures
+
+
+def parse_levels(value: str, max_level: Optional[int] = None) -> List[int]:
+    """カンマ区切りの並列数を検証して昇順のリストにする（1未満・max_level 超は ValueError）"""
+    levels = sorted({int(part) for part in value.split(",") if part.strip()})
+    if not levels or levels[0] < 1:
+        raise ValueError("levels must be positive integers, e.g. 1,4,16")
+    if max_level is not None and levels[-1] > max_level:
+        raise ValueError(f"levels must be at most {max_level}")
+    return levels
+
+
+def _parse_levels(value: str) -> List[int]:
+    try:
+        return parse_levels(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+async def _main_async(args: argparse.Namespace) -> int:
+    corpus = None
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+
+    engines = []
+    urls = list(args.url or [])
+    if args.stub:
+        from tools.stub_engine import StubEngine, options_from_args
+        engine = StubEngine(options_from_args(args))
+        urls.append(await engine.start())
+        engines.append(engine)
+    if not urls:
+        from lib.runtime_config import get_config
+        urls = list(get_config().voicevox_urls)
+    try:
+        results = await run_benchmark(urls, corpus, args.levels, args.requests, args.speaker)
+    finally:
+        for engine in engines:
+            await engine.stop()
+
+    if args.json:
+        print(json.dumps([asdict(engine) for engine in results], ensure_ascii=False, indent=2))
+    else:
+        print(format_report(results))
+    failures = check_thresholds(results, args.max_p95, args.min_rps, args.max_error_rate)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="VOICEVOXエンジンのベンチマークスイート")
+    parser.add_argument("--url", action="append", help="対象エンジン（複数指定可、省略時は VOICEVOX_URL）")
+    parser.add_argument("--stub", action="store_true", help="スタブエンジン（tools.stub_engine）を起動して対象に加える")
+    parser.add_argument("--levels", type=_parse_levels, default=list(DEFAULT_LEVELS), help="並列数（カンマ区切り）")
+    parser.add_argument("--requests", type=int, default=None, help="並列数ごとの合成回数")
+    parser.add_argument("--speaker", type=int, default=1, help="話者ID")
+    parser.add_argument("--corpus", help="1行1テキストのコーパスファイル（省略時は短文・中文・長文の既定コーパス）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    parser.add_argument("--max-p95", type=float, default=None, help="p95レイテンシ（秒）の上限。超えたら終了コード1")
+    parser.add_argument("--min-rps", type=float, default=None, help="スループット（件/秒）の下限。下回ったら終了コード1")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="エラー率の上限。超えたら終了コード1")
+    from tools.stub_engine import add_engine_arguments
+    add_engine_arguments(parser.add_argument_group("stub engine"))
+    sys.exit(asyncio.run(_main_async(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
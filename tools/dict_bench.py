@@ -0,0 +1,112 @@
+"""辞書置換のマイクロベンチマーク
+
+ランダムに生成した辞書（既定で 10 / 1,000 / 50,000 件）に対して、
+1エントリずつ str.replace する従来の方式と、lib.dict_matcher の Aho-Corasick
+マッチャーとで、1メッセージあたりの置換にかかる時間を比べる。
+
+    python -m tools.dict_bench
+    python -m tools.dict_bench --sizes 10,1000,50000 --messages 2000
+"""
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+from lib.dict_matcher import DictionaryMatcher
+
+# 辞書のキー・メッセージの組み立てに使う文字（かな・カナ・漢字・英字）
+ALPHABET = "あいうえおかきくけこさしすせそたちつてとなにぬねのアイウエオカキクケコ草笑今日明夜wxyz"
+MESSAGES = [
+    "おはよう",
+    "今日の夜って何時から集まる？",
+    "ちょっと離席します、すぐ戻ります",
+    "このボス強すぎない？回復アイテム足りないかも",
+    "さっきの試合、最後の一手が完全に読まれてたね。次はもう少し慎重に行こう。",
+    "明日は午前中に買い物へ行って、午後から作業をする予定です。夜は通話に参加できると思います！",
+]
+
+
+def make_dictionary(size: int, rng: random.Random) -> List[Tuple[str, str]]:
+    entries = {}
+    while len(entries) < size:
+        key = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 6)))
+        entries[key] = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 8)))
+    return list(entries.items())
+
+
+def make_messages(entries: List[Tuple[str, str]], count: int, rng: random.Random) -> List[str]:
+    """実際の辞書のようにキーをいくつか含むメッセージを作る"""
+    messages = []
+    for _ in range(count):
+        text = rng.choice(MESSAGES)
+        for _ in range(rng.randint(0, 3)):
+            position = rng.randint(0, len(text))
+            text = text[:position] + rng.choice(entries)[0] + text[position:]
+        messages.append(text)
+    return messages
+
+
+def replace_naive(entries: List[Tuple[str, str]], text: str) -> str:
+    for key, value in entries:
+        text = text.replace(key, value)
+    return text
+
+
+def per_message_us(func, messages: List[str], min_seconds: float = 0.5) -> float:
+    """messages を min_seconds 以上繰り返し処理し、1メッセージあたりのマイクロ秒を返す"""
+    done = 0
+    start = time.perf_counter()
+    while True:
+        for text in messages:
+            func(text)
+        done += len(messages)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / done * 1e6
+
+
+def run(sizes: List[int], message_count: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    results = []
+    for size in sizes:
+        entries = make_dictionary(size, rng)
+        messages = make_messages(entries, message_count, rng)
+        start = time.perf_counter()
+        matcher = DictionaryMatcher(entries)
+        build_ms = (time.perf_counter() - start) * 1000
+        # 大きな辞書の str.replace は遅いので、計測に使うメッセージを減らす
+        naive_messages = messages[:max(10, message_count * 100 // max(size, 100))]
+        results.append({
+            "entries": size,
+            "build_ms": build_ms,
+            "naive_us": per_message_us(lambda text: replace_naive(entries, text), naive_messages),
+            "matcher_us": per_message_us(matcher.replace, messages),
+        })
+    return results
+
+
+def print_report(results: List[dict]) -> None:
+    print("entries  build(ms)  str.replace(us/msg)  matcher(us/msg)  speedup")
+    for row in results:
+        print(f"{row['entries']:<8} {row['build_ms']:<10.1f} {row['naive_us']:<20.1f} "
+              f"{row['matcher_us']:<16.1f} {row['naive_us'] / row['matcher_us']:.1f}x")
+
+
+def _parse_sizes(value: str) -> List[int]:
+    sizes = [int(part) for part in value.split(",") if part.strip()]
+    if not sizes or min(sizes) < 1:
+        raise argparse.ArgumentTypeError("sizes must be positive integers, e.g. 10,1000,50000")
+    return sizes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="辞書置換（str.replace と Aho-Corasick）のマイクロベンチマーク")
+    parser.add_argument("--sizes", type=_parse_sizes, default=[10, 1000, 50000], help="辞書のエントリ数（カンマ区切り）")
+    parser.add_argument("--messages", type=int, default=1000, help="計測に使うメッセージ数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    args = parser.parse_args()
+    print_report(run(args.sizes, args.messages, args.seed))
+
+
+if __name__ == "__main__":
+    main()
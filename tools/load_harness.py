@@ -0,0 +1,342 @@
+"""読み上げパイプラインの負荷試験ハーネス
+
+スタブのVOICEVOXエンジン（tools.stub_engine）を起動し、本物の VoiceReadCog の
+process_queue・rust_queue・VOICEVOXLib を、Discordの代わりに偽のボイスクライアントへ
+つないで動かす。N ギルドそれぞれに毎秒 M 件（ポアソン到着）のメッセージを投入し、
+処理できたメッセージ数/秒、キュー投入から再生開始までの時間（TTFA）の分布、
+エンジンの稼働率を出力する。
+
+    python -m tools.load_harness --guilds 20 --rate 0.5 --duration 60 --engines 2 --workers 2
+
+DB・Discord・辞書コグは使わない（話速は既定値、辞書は適用しない）。
+投入と再生を1対1で対応づけるため、キューの件数を減らす処理（バックログのまとめ・
+TTL・容量上限）は config に関わらず無効にして測る（レポートにも表示する）。
+rust_queue はビルド済みである必要がある（lib/rust_lib を maturin develop でビルド）。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import yaml
+
+from cogs.voice.basic import QUEUE_TTL_KEYS, SPEAKER_LIST, VoiceReadCog
+from lib.audio_cache import AudioCache
+from lib.phrase_bank import PhraseBank
+from lib.settings_cache import SettingsCache
+from lib.voicevox_bench import percentile
+from lib.VOICEVOXlib import VOICEVOXLib
+from tools.stub_engine import StubEngine, add_engine_arguments, options_from_args
+
+# 短文・中文・複数文の長文を混ぜた投入用のメッセージ
+CORPUS = [
+    "おはよう",
+    "了解です",
+    "草",
+    "それな",
+    "今日の夜って何時から集まる？",
+    "ちょっと離席します、すぐ戻ります",
+    "このボス強すぎない？回復アイテム足りないかも",
+    "さっきの試合、最後の一手が完全に読まれてたね。次はもう少し慎重に行こう。",
+    "明日は午前中に買い物へ行って、午後から作業をする予定です。夜は通話に参加できると思います！",
+    "URLを貼っておきます。詳しい手順は固定メッセージにまとめたので、分からないところがあれば聞いてください。よろしくお願いします。",
+]
+
+
+class Recorder:
+    """ギルドごとに投入時刻を積み、再生開始時にTTFAを記録する
+
+    キューは投入順に再生されるので、再生開始のたびに最も古い投入時刻と対応づける。
+    項目が捨てられたりまとめられたりすると対応がずれるため、load_config でそれらを無効にする。
+    """
+
+    def __init__(self) -> None:
+        self.pending: Dict[int, deque] = defaultdict(deque)
+        self.ttfa: List[float] = []
+        self.enqueued = 0
+        self.played = 0
+
+    def on_enqueue(self, guild_id: int) -> None:
+        self.enqueued += 1
+        self.pending[guild_id].append(time.perf_counter())
+
+    def on_play(self, guild_id: int) -> None:
+        self.played += 1
+        if self.pending[guild_id]:
+            self.ttfa.append(time.perf_counter() - self.pending[guild_id].popleft())
+
+    def outstanding(self) -> int:
+        return sum(len(q) for q in self.pending.values())
+
+
+class FakeVoiceClient:
+    """discord.VoiceClient の代わりに AudioSource を実時間で読み進める
+
+    discord.py のプレイヤーと同じく別スレッドで20msごとに read() する。
+    playback_speed を上げると再生を早送りできる（エンジン側の負荷を上げたい場合）。
+    """
+
+    def __init__(self, recorder: Recorder, guild_id: int, playback_speed: float = 1.0) -> None:
+        self.recorder = recorder
+        self.guild_id = guild_id
+        self.playback_speed = max(playback_speed, 0.01)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._playing = False
+        self.frames = 0
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return self._playing
+
+    def play(self, source, *, after=None, **kwargs) -> None:
+        if self.is_playing():
+            raise RuntimeError("Already playing audio.")
+        self.recorder.on_play(self.guild_id)
+        self._stop.clear()
+        self._playing = True
+        self._thread = threading.Thread(target=self._run, args=(source, after), daemon=True)
+        self._thread.start()
+
+    def _run(self, source, after) -> None:
+        frame_seconds = 0.02 / self.playback_speed
+        next_frame = time.perf_counter()
+        error = None
+        try:
+            while not self._stop.is_set():
+                if not source.read():
+                    break
+                self.frames += 1
+                next_frame += frame_seconds
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+            # discord.py と同じく、after を呼ぶ時点では再生中でない扱いにする
+            self._playing = False
+            if after:
+                after(error)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def disconnect(self, *, force: bool = False) -> None:
+        self.stop()
+
+
+class FakeDB:
+    """ハーネスで使う分だけの PostgresDB の代用品（設定はすべて既定値）"""
+
+    async def get_server_voice_speed(self, guild_id):
+        return None
+
+    async def get_user_voice(self, user_id):
+        return None
+
+    async def fetchrow(self, query, *args):
+        return None
+
+    async def fetch(self, query, *args):
+        return []
+
+    async def fetch_column(self, query, *args):
+        return []
+
+    async def execute(self, query, *args):
+        return "OK"
+
+    async def close(self):
+        pass
+
+
+class HarnessBot:
+    """VoiceReadCog が参照する commands.Bot の属性だけを持つ代用品"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, config: dict) -> None:
+        self.loop = loop
+        self.config = config
+        self.guilds: Dict[int, SimpleNamespace] = {}
+        self.tts_counter = 0
+        self.error_counter = 0
+        self.shard_tts_counters = defaultdict(int)
+        self.shard_error_counters = defaultdict(int)
+
+    def get_guild(self, guild_id: int):
+        return self.guilds.get(guild_id)
+
+    def get_cog(self, name: str):
+        return None
+
+
+# 投入した項目を1件ずつ必ず再生させる（Recorder の対応づけと outstanding() のため）
+SHEDDING_DISABLED = {
+    "backlog_policy_depth": 0,
+    "queue_capacity": 0,
+    **{key: 0 for key in QUEUE_TTL_KEYS.values()},
+}
+
+
+def load_config(args: argparse.Namespace) -> dict:
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    if args.prefetch_depth is not None:
+        config["prefetch_depth"] = args.prefetch_depth
+    if args.no_batch:
+        config["batch_synthesis_enabled"] = False
+    if args.no_streaming:
+        config["streaming_synthesis_enabled"] = False
+    config.update(SHEDDING_DISABLED)
+    return config
+
+
+async def produce(cog: VoiceReadCog, recorder: Recorder, guild_id: int, rate: float,
+                  duration: float, rng: random.Random) -> None:
+    """1ギルド分のメッセージを平均 rate 件/秒のポアソン到着で duration 秒間投入する"""
+    deadline = time.perf_counter() + duration
+    while True:
+        await asyncio.sleep(rng.expovariate(rate))
+        if time.perf_counter() >= deadline:
+            return
+        speaker_id = rng.choice(SPEAKER_LIST)["id"]
+        recorder.on_enqueue(guild_id)
+        cog._enqueue(guild_id, rng.choice(CORPUS), speaker_id, f"user{rng.randrange(1000)}")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    loop = asyncio.get_running_loop()
+    engines = [StubEngine(options_from_args(args)) for _ in range(args.engines)]
+    urls = [await engine.start() for engine in engines]
+
+    bot = HarnessBot(loop, load_config(args))
+    cog = VoiceReadCog(bot)
+    cog.db = FakeDB()
+    cog.settings = SettingsCache(cog.db)
+    cog.voicelib = VOICEVOXLib(base_url=urls)
+    if not args.cache:
+        # 毎回エンジンまで届かせる（キャッシュの効果を含めたい場合は --cache）
+        cog.voicelib.audio_cache = AudioCache(None, memory_limit_bytes=0, disk_limit_bytes=0)
+    cog.phrase_bank = PhraseBank(cog.voicelib, None)
+    await cog.voicelib.start()
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    guild_ids = list(range(1, args.guilds + 1))
+    for guild_id in guild_ids:
+        cog.rust_queue.clear(guild_id)
+        bot.guilds[guild_id] = SimpleNamespace(
+            id=guild_id,
+            shard_id=0,
+            voice_client=FakeVoiceClient(recorder, guild_id, args.playback_speed),
+        )
+        cog.queue_tasks[guild_id] = loop.create_task(cog.process_queue(guild_id))
+
+    for engine in engines:
+        engine.reset_stats()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            produce(cog, recorder, guild_id, args.rate, args.duration, random.Random(rng.random()))
+            for guild_id in guild_ids
+        ))
+        # 投入が終わったら、キューが捌けるまで（最大 drain_timeout 秒）待つ
+        drain_deadline = time.perf_counter() + args.drain_timeout
+        while time.perf_counter() < drain_deadline:
+            playing = any(bot.guilds[g].voice_client.is_playing() for g in guild_ids)
+            if not recorder.outstanding() and not playing:
+                break
+            await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started
+    finally:
+        for guild_id in guild_ids:
+            cog.queue_tasks[guild_id].cancel()
+            bot.guilds[guild_id].voice_client.stop()
+        await asyncio.gather(*cog.queue_tasks.values(), return_exceptions=True)
+        await cog.voicelib.close()
+        for engine in engines:
+            await engine.stop()
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "guilds": args.guilds,
+        "rate_per_guild": args.rate,
+        "duration": args.duration,
+        "elapsed": round(elapsed, 2),
+        "enqueued": recorder.enqueued,
+        "played": recorder.played,
+        "unplayed": recorder.outstanding(),
+        "errors": bot.error_counter,
+        "queue_overrides": SHEDDING_DISABLED,
+        "messages_per_sec": round(recorder.played / elapsed, 2) if elapsed > 0 else 0.0,
+        "ttfa_ms": {
+            "p50": ms(percentile(recorder.ttfa, 50)),
+            "p95": ms(percentile(recorder.ttfa, 95)),
+            "p99": ms(percentile(recorder.ttfa, 99)),
+            "max": ms(max(recorder.ttfa)) if recorder.ttfa else None,
+        },
+        "engines": [
+            {
+                "url": engine.url,
+                "utilization": round(engine.busy_seconds / (elapsed * max(1, engine.options.workers)), 3),
+                "requests": dict(engine.requests),
+                "errors": engine.errors,
+                "audio_seconds": round(engine.audio_seconds, 1),
+            }
+            for engine in engines
+        ],
+    }
+
+
+def print_report(result: dict) -> None:
+    print(f"guilds={result['guilds']} rate={result['rate_per_guild']}/s/guild "
+          f"duration={result['duration']}s elapsed={result['elapsed']}s")
+    print(f"enqueued={result['enqueued']} played={result['played']} "
+          f"unplayed={result['unplayed']} errors={result['errors']}")
+    print("queue shedding disabled: " + " ".join(f"{k}={v}" for k, v in result["queue_overrides"].items()))
+    print(f"throughput: {result['messages_per_sec']} msgs/sec")
+    ttfa = result["ttfa_ms"]
+    print(f"time to first audio (ms): p50={ttfa['p50']} p95={ttfa['p95']} p99={ttfa['p99']} max={ttfa['max']}")
+    for engine in result["engines"]:
+        print(f"engine {engine['url']}: utilization={engine['utilization'] * 100:.1f}% "
+              f"requests={engine['requests']} errors={engine['errors']} audio={engine['audio_seconds']}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="スタブエンジンに対して読み上げパイプラインの負荷試験を行う")
+    parser.add_argument("--guilds", type=int, default=10, help="ギルド数 N")
+    parser.add_argument("--rate", type=float, default=0.5, help="ギルドあたりの投入レート M（件/秒）")
+    parser.add_argument("--duration", type=float, default=30.0, help="投入を続ける秒数")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="投入終了後にキューが捌けるのを待つ最大秒数")
+    parser.add_argument("--playback-speed", type=float, default=1.0, help="再生の早送り倍率")
+    parser.add_argument("--engines", type=int, default=1, help="起動するスタブエンジンの数")
+    parser.add_argument("--config", default="config.yml", help="読み込む config.yml")
+    parser.add_argument("--prefetch-depth", type=int, default=None, help="config の prefetch_depth を上書き")
+    parser.add_argument("--no-batch", action="store_true", help="一括合成を無効にする")
+    parser.add_argument("--no-streaming", action="store_true", help="ストリーミング合成を無効にする")
+    parser.add_argument("--cache", action="store_true", help="音声キャッシュ（メモリ・ディスク）を有効にする")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""VOICEVOXエンジンのスタブ（負荷試験・ベンチマーク用）
+
+実エンジンの代わりに /version, /speakers, /audio_query, /synthesis, /multi_synthesis を
+提供する。レイテンシは「固定分＋音声長×リアルタイム係数」を対数正規分布でばらつかせ、
+指定した確率で500を返す。合成はワーカー数分しか同時に進まないので、実エンジンと
+同じように混雑すると待ち行列ができる。
+
+    python -m tools.stub_engine --port 50021 --workers 2 --rtf 0.15 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import random
+import time
+import wave
+import zipfile
+from dataclasses import dataclass
+from typing import Optional
+
+from aiohttp import web
+
+STUB_VERSION = "0.0.0-stub"
+# 1モーラあたりの発話時間（秒）。実際のVOICEVOXの標準速度とおおむね同じ
+MORA_SECONDS = 0.12
+DEFAULT_SAMPLING_RATE = 24000
+
+
+@dataclass
+class StubEngineOptions:
+    workers: int = 1                # 同時に合成できる数（実エンジンのCPUコア数に相当）
+    query_latency_ms: float = 15.0  # audio_query の中央値
+    synthesis_base_ms: float = 20.0  # synthesis の固定分の中央値
+    rtf: float = 0.15               # 音声1秒あたりの合成時間（秒）
+    latency_sigma: float = 0.25     # 対数正規分布のσ（0でばらつきなし）
+    error_rate: float = 0.0         # 500を返す確率
+    seed: Optional[int] = None
+
+
+class StubEngine:
+    """aiohttp.web で動くVOICEVOXエンジンのスタブ"""
+
+    def __init__(self, options: StubEngineOptions) -> None:
+        self.options = options
+        self._random = random.Random(options.seed)
+        self._workers = asyncio.Semaphore(max(1, options.workers))
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+        # 負荷試験の集計用
+        self.started_at = time.perf_counter()
+        self.busy_seconds = 0.0
+        self.requests = {"audio_query": 0, "synthesis": 0, "multi_synthesis": 0}
+        self.errors = 0
+        self.audio_seconds = 0.0
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/version", self.handle_version)
+        app.router.add_get("/speakers", self.handle_speakers)
+        app.router.add_post("/audio_query", self.handle_audio_query)
+        app.router.add_post("/synthesis", self.handle_synthesis)
+        app.router.add_post("/multi_synthesis", self.handle_multi_synthesis)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """サーバーを起動してベースURLを返す（port=0なら空いているポート）"""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{bound_port}"
+        self.reset_stats()
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def reset_stats(self) -> None:
+        self.started_at = time.perf_counter()
+        self.busy_seconds = 0.0
+        self.requests = {name: 0 for name in self.requests}
+        self.errors = 0
+        self.audio_seconds = 0.0
+
+    def utilization(self) -> float:
+        """計測開始からの稼働率（合成に使った時間 ÷ (経過時間 × ワーカー数)）"""
+        elapsed = time.perf_counter() - self.started_at
+        if elapsed <= 0:
+            return 0.0
+        return self.busy_seconds / (elapsed * max(1, self.options.workers))
+
+    def _jitter(self, median_seconds: float) -> float:
+        if median_seconds <= 0:
+            return 0.0
+        sigma = self.options.latency_sigma
+        return median_seconds * (math.exp(self._random.gauss(0.0, sigma)) if sigma > 0 else 1.0)
+
+    def _should_fail(self) -> bool:
+        if self.options.error_rate > 0 and self._random.random() < self.options.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    async def _work(self, seconds: float) -> None:
+        """ワーカーを1つ占有して seconds 秒処理したことにする"""
+        async with self._workers:
+            await asyncio.sleep(seconds)
+            self.busy_seconds += seconds
+
+    @staticmethod
+    def _query_seconds(query: dict) -> float:
+        moras = sum(len(phrase.get("moras", [])) + (1 if phrase.get("pause_mora") else 0)
+                    for phrase in query.get("accent_phrases", []))
+        speed = float(query.get("speedScale") or 1.0)
+        return (moras * MORA_SECONDS / max(speed, 0.1)
+                + float(query.get("prePhonemeLength", 0.1))
+                + float(query.get("postPhonemeLength", 0.1)))
+
+    @staticmethod
+    def _render_wav(query: dict) -> bytes:
+        """クエリの長さ・サンプリングレート・チャンネル数どおりのWAVを作る（中身は正弦波）"""
+        rate = int(query.get("outputSamplingRate") or DEFAULT_SAMPLING_RATE)
+        channels = 2 if query.get("outputStereo") else 1
+        frames = int(StubEngine._query_seconds(query) * rate)
+        period = max(2, rate // 220)
+        one_period = bytearray()
+        for i in range(period):
+            sample = int(8000 * math.sin(2 * math.pi * i / period)).to_bytes(2, "little", signed=True)
+            one_period += sample * channels
+        repeats, remainder = divmod(frames, period)
+        pcm = bytes(one_period) * repeats + bytes(one_period[:remainder * 2 * channels])
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(channels)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(rate)
+            wav_file.writeframes(pcm)
+        return buffer.getvalue()
+
+    async def handle_version(self, request: web.Request) -> web.Response:
+        return web.json_response(STUB_VERSION)
+
+    async def handle_speakers(self, request: web.Request) -> web.Response:
+        speakers = [
+            {"name": f"stub-{i}", "speaker_uuid": f"00000000-0000-0000-0000-{i:012d}",
+             "styles": [{"name": "ノーマル", "id": i}], "version": STUB_VERSION}
+            for i in range(100)
+        ]
+        return web.json_response(speakers)
+
+    async def handle_audio_query(self, request: web.Request) -> web.Response:
+        self.requests["audio_query"] += 1
+        text = request.query.get("text", "")
+        await self._work(self._jitter(self.options.query_latency_ms / 1000))
+        if self._should_fail():
+            raise web.HTTPInternalServerError(text="stub engine error")
+        # 4文字ごとに1アクセント句、1文字1モーラとみなす
+        accent_phrases = []
+        for start in range(0, len(text), 4):
+            piece = text[start:start + 4]
+            accent_phrases.append({
+                "moras": [{"text": ch, "consonant": None, "consonant_length": None,
+                           "vowel": "a", "vowel_length": MORA_SECONDS, "pitch": 5.5} for ch in piece],
+                "accent": 1,
+                "pause_mora": None,
+                "is_interrogative": False,
+            })
+        return web.json_response({
+            "accent_phrases": accent_phrases,
+            "speedScale": 1.0,
+            "pitchScale": 0.0,
+            "intonationScale": 1.0,
+            "volumeScale": 1.0,
+            "prePhonemeLength": 0.1,
+            "postPhonemeLength": 0.1,
+            "outputSamplingRate": DEFAULT_SAMPLING_RATE,
+            "outputStereo": False,
+            "kana": text,
+        })
+
+    async def handle_synthesis(self, request: web.Request) -> web.Response:
+        self.requests["synthesis"] += 1
+        query = await request.json()
+        seconds = self._query_seconds(query)
+        await self._work(self._jitter(self.options.synthesis_base_ms / 1000 + seconds * self.options.rtf))
+        if self._should_fail():
+            raise web.HTTPInternalServerError(text="stub engine error")
+        self.audio_seconds += seconds
+        return web.Response(body=self._render_wav(query), content_type="audio/wav")
+
+    async def handle_multi_synthesis(self, request: web.Request) -> web.Response:
+        self.requests["multi_synthesis"] += 1
+        queries = await request.json()
+        if not isinstance(queries, list):
+            raise web.HTTPUnprocessableEntity(text=json.dumps({"detail": "expected a list of queries"}))
+        seconds = sum(self._query_seconds(query) for query in queries)
+        # 一括合成は固定分が1回で済む
+        await self._work(self._jitter(self.options.synthesis_base_ms / 1000 + seconds * self.options.rtf))
+        if self._should_fail():
+            raise web.HTTPInternalServerError(text="stub engine error")
+        self.audio_seconds += seconds
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for i, query in enumerate(queries, start=1):
+                archive.writestr(f"{i:03d}.wav", self._render_wav(query))
+        return web.Response(body=buffer.getvalue(), content_type="application/zip")
+
+
+def add_engine_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--workers", type=int, default=1, help="同時に合成できる数")
+    parser.add_argument("--query-latency-ms", type=float, default=15.0, help="audio_query の中央値（ミリ秒）")
+    parser.add_argument("--synthesis-base-ms", type=float, default=20.0, help="synthesis の固定分の中央値（ミリ秒）")
+    parser.add_argument("--rtf", type=float, default=0.15, help="音声1秒あたりの合成時間（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.25, help="レイテンシの対数正規分布のσ")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500を返す確率（0〜1）")
+    parser.add_argument("--seed", type=int, default=None, help="乱数シード")
+
+
+def options_from_args(args: argparse.Namespace) -> StubEngineOptions:
+    return StubEngineOptions(
+        workers=args.workers,
+        query_latency_ms=args.query_latency_ms,
+        synthesis_base_ms=args.synthesis_base_ms,
+        rtf=args.rtf,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    engine = StubEngine(options_from_args(args))
+    url = await engine.start(args.host, args.port)
+    print(f"Stub VOICEVOX engine listening on {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await engine.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="VOICEVOXエンジンのスタブを起動する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=50021)
+    add_engine_arguments(parser)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()